@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Batch Extraction Runner
+Runs one extractor over every PDF in a directory or glob, several documents
+at a time, and writes one JSON output per document plus a manifest
+
+All documents share the process-wide OCR engine pool, so while one document
+is rendering or segmenting, the pages of the others keep the OCR workers
+busy. Documents start largest first (by page count), so the longest book is
+not left running alone at the end of the batch.
+
+Usage:
+    python batch_extract.py aoshu/ --extractor improved --output-dir out/
+    python batch_extract.py "books/**/*.pdf" --extractor targeted --jobs 4 --resume
+"""
+
+import os
+import glob
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from ocr_engine import get_shared_pool
+from ocr_cache import pdf_content_hash
+from pdf_documents import get_document_cache
+from checkpoint_journal import CheckpointJournal, default_journal_path
+
+# Extractor modules are imported on first use, so a batch only loads the libraries it needs
+
+def _run_ocr_pdf(pdf_path, journal):
+    from ocr_pdf_extraction import OCRMathProblemExtractor
+    return OCRMathProblemExtractor(journal=journal).extract_from_pdf(pdf_path)
+
+def _run_extract_pdf_ocr(pdf_path, journal):
+    from extract_pdf_ocr import MathProblemOCRExtractor
+    extractor = MathProblemOCRExtractor(two_pass=os.environ.get("OCR_TWO_PASS") == "1", journal=journal)
+    try:
+        pages = range(extractor.documents.page_count(pdf_path))
+        return extractor.process_pdf_pipelined(pdf_path, pages=pages)
+    finally:
+        extractor.cleanup()
+
+def _run_targeted(pdf_path, journal):
+    from targeted_ocr_extraction import TargetedMathExtractor
+    from page_triage import PageTriage
+    extractor = TargetedMathExtractor(two_pass=os.environ.get("OCR_TWO_PASS") == "1", journal=journal)
+    try:
+        return extractor.process_specific_pages(pdf_path, PageTriage().select_pages(pdf_path))
+    finally:
+        extractor.cleanup()
+
+def _run_improved(pdf_path, journal):
+    from improved_ocr_extraction import ImprovedMathProblemExtractor
+    from page_triage import PageTriage
+    extractor = ImprovedMathProblemExtractor(parallel_configs=True, layout=os.environ.get("OCR_LAYOUT") == "1",
+                                             journal=journal)
+    try:
+        return extractor.process_pdf(pdf_path, pages=PageTriage().select_pages(pdf_path))
+    finally:
+        extractor.cleanup()
+
+def _run_comprehensive(pdf_path, journal):
+    from comprehensive_pdf_processing import ComprehensiveMathProblemExtractor
+    # Page fusion reads text-layer pages without OCR, so every document can take the scanned path
+    return ComprehensiveMathProblemExtractor().extract_from_scanned_pdf(
+        pdf_path, max_pages=get_document_cache().page_count(pdf_path))
+
+def _run_enhanced(pdf_path, journal):
+    from enhanced_pdf_extraction import EnhancedMathProblemExtractor
+    return EnhancedMathProblemExtractor().extract_from_pdf(pdf_path)
+
+def _run_extract_pdf_problems(pdf_path, journal):
+    from extract_pdf_problems import MathProblemExtractor
+    return MathProblemExtractor().extract_from_pdf(pdf_path)
+
+def _run_mcp(pdf_path, journal):
+    from mcp_pdf_processing import MCPPDFProcessor
+    return MCPPDFProcessor().process_pdf_file(pdf_path)
+
+# name -> run(pdf_path, journal) returning the document's problems
+EXTRACTORS = {
+    "ocr_pdf": _run_ocr_pdf,
+    "extract_pdf_ocr": _run_extract_pdf_ocr,
+    "targeted": _run_targeted,
+    "improved": _run_improved,
+    "comprehensive": _run_comprehensive,
+    "enhanced": _run_enhanced,
+    "extract_pdf_problems": _run_extract_pdf_problems,
+    "mcp": _run_mcp
+}
+
+# Extractors that record finished pages in a checkpoint journal (and can resume from it)
+JOURNALED = {"ocr_pdf", "extract_pdf_ocr", "targeted", "improved"}
+
+def find_pdfs(sources):
+    """Expand directories (recursively), globs and file paths into a sorted list of unique PDFs"""
+    found = {}
+    for source in sources:
+        if os.path.isdir(source):
+            paths = glob.glob(os.path.join(glob.escape(source), '**', '*.pdf'), recursive=True)
+            paths += glob.glob(os.path.join(glob.escape(source), '**', '*.PDF'), recursive=True)
+        elif os.path.isfile(source):
+            paths = [source]
+        else:
+            paths = glob.glob(source, recursive=True)
+        for path in paths:
+            if os.path.isfile(path) and path.lower().endswith('.pdf'):
+                found.setdefault(os.path.realpath(path), path)
+    return sorted(found.values())
+
+def document_size(pdf_path):
+    """(page count, file size) of a PDF; page count is 0 when it cannot be opened"""
+    try:
+        pages = get_document_cache().page_count(pdf_path)
+    except Exception:
+        pages = 0
+    return pages, os.path.getsize(pdf_path)
+
+def output_paths(pdf_files, output_dir):
+    """One output file per PDF, named after it; clashing names get a content hash suffix"""
+    stems = {}
+    for pdf_file in pdf_files:
+        stems.setdefault(Path(pdf_file).stem, []).append(pdf_file)
+
+    outputs = {}
+    for stem, paths in stems.items():
+        for pdf_file in paths:
+            name = stem if len(paths) == 1 else f"{stem}-{pdf_content_hash(pdf_file)[:8]}"
+            outputs[pdf_file] = os.path.join(output_dir, f"{name}.json")
+    return outputs
+
+class BatchRunner:
+    """Runs one extractor over many PDFs on a shared OCR pool"""
+
+    def __init__(self, extractor, output_dir, jobs=None, resume=False):
+        self.extractor = extractor
+        self.run = EXTRACTORS[extractor]
+        self.output_dir = output_dir
+        # Documents in flight at once; by default as many as there are OCR workers
+        self.jobs = jobs or get_shared_pool().workers or 1
+        self.resume = resume
+
+    def process_document(self, pdf_path, output_file, pages):
+        """Extract one document into its output file; returns its manifest entry"""
+        entry = {"file": pdf_path, "pdf": pdf_content_hash(pdf_path), "pages": pages, "output": output_file,
+                 "problems": 0, "seconds": 0.0, "status": "ok"}
+        journal = None
+        start = time.time()
+
+        try:
+            if self.extractor in JOURNALED:
+                journal = CheckpointJournal(default_journal_path(output_file), resume=self.resume)
+            problems = self.run(pdf_path, journal) or []
+
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(problems, f, ensure_ascii=False, indent=2)
+            entry["problems"] = len(problems)
+        except Exception as e:
+            print(f"Error processing {Path(pdf_path).name}: {e}")
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+        finally:
+            if journal:
+                journal.close()
+
+        entry["seconds"] = time.time() - start
+        return entry
+
+    def process(self, pdf_files):
+        """Extract every PDF, largest first, and write the manifest; returns the manifest"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        outputs = output_paths(pdf_files, self.output_dir)
+        sizes = {pdf_file: document_size(pdf_file) for pdf_file in pdf_files}
+        # Longest documents start first so the batch does not end on one long book
+        order = sorted(pdf_files, key=lambda pdf_file: (-sizes[pdf_file][0], -sizes[pdf_file][1], pdf_file))
+
+        print(f"Extracting {len(pdf_files)} documents ({sum(pages for pages, size in sizes.values())} pages) "
+              f"with {self.extractor}, {self.jobs} at a time")
+        start = time.time()
+
+        entries = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {pdf_file: executor.submit(self.process_document, pdf_file, outputs[pdf_file],
+                                                 sizes[pdf_file][0])
+                       for pdf_file in order}
+            for done, pdf_file in enumerate(order, 1):
+                entries[pdf_file] = futures[pdf_file].result()
+                entry = entries[pdf_file]
+                print(f"[{done}/{len(order)}] {Path(pdf_file).name}: {entry['status']}, "
+                      f"{entry['problems']} problems in {entry['seconds']:.1f}s")
+
+        manifest = {
+            "extractor": self.extractor,
+            "created": time.time(),
+            "seconds": time.time() - start,
+            "documents": [entries[pdf_file] for pdf_file in pdf_files],
+            "total_problems": sum(entry["problems"] for entry in entries.values()),
+            "failed": sum(1 for entry in entries.values() if entry["status"] != "ok")
+        }
+        manifest_file = os.path.join(self.output_dir, "manifest.json")
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        print(f"\nExtracted {manifest['total_problems']} problems from {len(pdf_files)} documents "
+              f"in {manifest['seconds']:.1f}s ({manifest['failed']} failed)")
+        print(f"Manifest saved to: {manifest_file}")
+        return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract math problems from every PDF in a directory or glob")
+    parser.add_argument('sources', nargs='+', help="PDF files, directories (searched recursively) or glob patterns")
+    parser.add_argument('--extractor', choices=sorted(EXTRACTORS), default='improved')
+    parser.add_argument('--output-dir', default='extracted', help="Directory for per-document outputs and the manifest")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Documents processed at once (default: number of OCR workers)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip pages an interrupted batch already finished (journaled extractors only)")
+    args = parser.parse_args()
+
+    pdf_files = find_pdfs(args.sources)
+    if not pdf_files:
+        print("No PDF files found")
+        return
+
+    try:
+        BatchRunner(args.extractor, args.output_dir, jobs=args.jobs, resume=args.resume).process(pdf_files)
+    finally:
+        get_document_cache().close_all()
+
+if __name__ == "__main__":
+    main()
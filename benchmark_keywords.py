@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Keyword Classification Benchmark
+Classifies every stem of the problem bank with the keyword automaton and
+with the per-keyword `in` loops it replaced, checks that both give the
+same labels, and reports stems per second
+
+Per stem, the old path runs the knowledge point, type and difficulty
+loops of the OCR, targeted and improved extractors and the keyword
+checks of format_problem_structure. The automaton answers all of them
+from one scan, one stem at a time or a whole batch per scan.
+
+Usage:
+    python benchmark_keywords.py [files or globs ...] [--repeat 5]
+"""
+
+import glob
+import json
+import time
+import argparse
+from keyword_automaton import KEYWORD_TABLE, _classify, get_automaton
+from format_extracted_problems import format_problem_structure
+
+DEFAULT_SOURCES = ['data/*.json', 'examples/*.json', 'public/data/*.json', '*problems*.json']
+
+def problem_bank_stems(sources):
+    """Stems of every problem in the JSON files matched by sources"""
+    stems = []
+    paths = sorted({path for source in sources for path in glob.glob(source)})
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        items = data.get('items', data.get('problems', [])) if isinstance(data, dict) else data
+        for item in items if isinstance(items, list) else []:
+            stem = item.get('stem') if isinstance(item, dict) else None
+            if isinstance(stem, dict):
+                stem = stem.get('text')
+            if isinstance(stem, str) and stem.strip():
+                stems.append(stem.strip())
+    return stems
+
+def old_keywords(namespace):
+    """(keyword, label) pairs of a namespace, in table order, for the loops below"""
+    return [(keyword, label) for row_namespace, keyword, label in KEYWORD_TABLE if row_namespace == namespace]
+
+def old_labels(text, namespace):
+    """The `keyword in text` loop the extractors ran, one substring scan per keyword"""
+    labels = []
+    for keyword, label in old_keywords(namespace):
+        if keyword in text and label not in labels:
+            labels.append(label)
+    return labels
+
+def old_classify(text):
+    """Every lookup the extractors and format_problem_structure made for one stem, the old way"""
+    return {namespace: old_labels(text, namespace) for namespace in NAMESPACES}
+
+def new_classify(text):
+    """The same lookups from one automaton scan (uncached)"""
+    labels = get_automaton().classify(text)
+    return {namespace: labels.get(namespace, []) for namespace in NAMESPACES}
+
+NAMESPACES = list(dict.fromkeys(namespace for namespace, keyword, label in KEYWORD_TABLE))
+
+def best_time(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keyword classification on the problem bank")
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES, help="Problem JSON files or globs")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    stems = problem_bank_stems(args.sources)
+    if not stems:
+        print("No problem stems found")
+        return
+    automaton = get_automaton()
+    print(f"{len(stems)} stems, {sum(map(len, stems))} characters, {len(KEYWORD_TABLE)} table rows, "
+          f"{len(NAMESPACES)} namespaces\n")
+
+    # Same labels as the loops, one stem at a time and in batches
+    mismatches = sum(1 for stem in stems if old_classify(stem) != new_classify(stem))
+    batch = automaton.classify_batch(stems)
+    mismatches += sum(1 for stem, labels in zip(stems, batch)
+                      if old_classify(stem) != {namespace: labels.get(namespace, []) for namespace in NAMESPACES})
+    print(f"Label mismatches: {mismatches}")
+
+    timings = [
+        ("keyword loops", best_time(lambda: [old_classify(stem) for stem in stems], args.repeat)),
+        ("automaton", best_time(lambda: [automaton.classify(stem) for stem in stems], args.repeat)),
+        ("automaton batch", best_time(lambda: automaton.classify_batch(stems), args.repeat)),
+    ]
+    _classify.cache_clear()
+    timings.append(("format_problem_structure", best_time(
+        lambda: (_classify.cache_clear(), [format_problem_structure({"stem": stem}) for stem in stems]),
+        args.repeat)))
+
+    baseline = timings[0][1]
+    print(f"\n{'classifier':<26} {'stems/s':>10} {'us/stem':>9} {'speedup':>8}")
+    for name, elapsed in timings:
+        speedup = f"{baseline / elapsed:.2f}x" if name != "format_problem_structure" else ""
+        print(f"{name:<26} {len(stems) / elapsed:>10.0f} {elapsed * 1e6 / len(stems):>9.1f} {speedup:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Pattern Registry Benchmark
+Times the combined patterns of problem_patterns against the per-pattern
+re.search loops and re.sub chains the extractors ran, and checks that both
+give the same results
+
+Inputs are the problem bank stems, the same stems with every indicator
+character removed (the no-match path, where the loops try every pattern),
+and random strings over the indicator characters for the equality check.
+
+Usage:
+    python benchmark_patterns.py [files or globs ...] [--fuzz 20000] [--repeat 5]
+"""
+
+import re
+import time
+import random
+import argparse
+from benchmark_keywords import DEFAULT_SOURCES, problem_bank_stems
+from page_segmenter import ordered_in_line
+import problem_patterns
+
+# The per-pattern checks and chains the registry replaced, kept here as the baseline
+INDICATORS = [r'\d+\s*[＋+\-×÷]\s*\d+', r'应用题', r'选择题', r'填空题', r'判断题', r'[①②③④⑤⑥⑦⑧⑨⑩]', r'[1-9]\.\s*']
+CONTEXT_INDICATORS = [r'千克|克|米|厘米|分钟|小时', r'苹果|书|学生|班级|学校']
+PAIRS = [('解', '题'), ('计算', '式'), ('求', '值')]
+SECTION_INDICATORS = [r'练习', r'习题', r'测试', r'计算', r'解题', r'应用题', r'选择题', r'填空题', r'判断题', r'解答题',
+                      r'\d+\s*[\.、]', r'[①②③④⑤⑥⑦⑧⑨⑩]']
+SOLUTION_LINES = [r'答案[:：].*?$', r'答[:：].*?$', r'解[:：].*?$', r'解析[:：].*?$']
+
+def old_is_math_problem(text, context=False):
+    """MathProblemExtractor / MCPPDFProcessor (context=False) and the OCR extractors (context=True)"""
+    for pattern in INDICATORS + (CONTEXT_INDICATORS if context else []):
+        if re.search(pattern, text):
+            return True
+    return any(ordered_in_line(text, first, second) for first, second in PAIRS)
+
+def old_is_math_section(text):
+    for indicator in SECTION_INDICATORS:
+        if re.search(indicator, text):
+            return True
+    return False
+
+def old_strip_solution(text):
+    for pattern in SOLUTION_LINES:
+        text = re.sub(pattern, '', text, flags=re.MULTILINE)
+    return text
+
+def old_markdown_style(text):
+    text = re.sub(r'([①②③④⑤⑥⑦⑧⑨⑩]|[1-9]+[\.、])\s*(.*?)', r'## \1 \2', text)
+    text = re.sub(r'答案[:：]\s*(.*?)', r'**答案**: \1', text)
+    text = re.sub(r'解析[:：]\s*(.*?)', r'**解析**: \1', text)
+    return re.sub(r'解[:：]\s*(.*?)', r'**解**: \1', text)
+
+def old_split_sections(text):
+    return re.split(r'(?:[①②③④⑤⑥⑦⑧⑨⑩]|[1-9]+[\.、])', text)
+
+def old_stem_head(text):
+    return re.search(r'^(.*?)(?=答案|答|解|解析|$)', text, re.DOTALL).group(1).strip()
+
+# (name, old, new) per check
+CHECKS = [
+    ("is_math_problem", old_is_math_problem, problem_patterns.is_math_problem),
+    ("is_math_problem context", lambda text: old_is_math_problem(text, True),
+     lambda text: problem_patterns.is_math_problem(text, context=True)),
+    ("is_math_section", old_is_math_section, problem_patterns.is_math_section),
+    ("strip_solution", old_strip_solution, problem_patterns.strip_solution),
+    ("markdown_style", old_markdown_style, problem_patterns.markdown_style),
+    ("stem_head", old_stem_head, problem_patterns.stem_head),
+    ("split_sections", old_split_sections, problem_patterns.split_sections),
+]
+
+FUZZ_CHARS = '解题计算式求值答案析:：12.、+×①应用选择克米书练习 \n'
+
+def fuzz_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(FUZZ_CHARS) for _ in range(rng.randint(0, 24))) for _ in range(count)]
+
+def best_time(run, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            run(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared pattern registry against per-pattern loops")
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES, help="Problem JSON files or globs")
+    parser.add_argument('--fuzz', type=int, default=20000, help="Random strings for the equality check")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    stems = problem_bank_stems(args.sources)
+    if not stems:
+        print("No problem stems found")
+        return
+    plain = [re.sub(r'[\d①-⑩应选填判解计求克米分小苹书学班练习测答]', '', stem) for stem in stems]
+    print(f"{len(stems)} stems, {args.fuzz} random strings\n")
+
+    print(f"{'check':<24} {'diffs':>6} {'bank us':>8} {'old':>7} {'speedup':>8} {'no-match us':>12} {'old':>7} {'speedup':>8}")
+    for name, old, new in CHECKS:
+        diffs = sum(1 for text in stems + plain + fuzz_texts(args.fuzz) if old(text) != new(text))
+        row = f"{name:<24} {diffs:>6}"
+        for texts in (stems, plain):
+            old_time = best_time(old, texts, args.repeat)
+            new_time = best_time(new, texts, args.repeat)
+            row += f" {new_time * 1e6 / len(texts):>{8 if texts is stems else 12}.2f} {old_time * 1e6 / len(texts):>7.2f}"
+            row += f" {old_time / new_time:>7.2f}x"
+        print(row)
+
+if __name__ == "__main__":
+    main()
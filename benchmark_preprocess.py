@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Preprocessing Benchmark
+Measures what the clean render mode (adaptive threshold, deskew, speckle
+removal) costs and gains per page, at the zoom and page segmentation mode
+of each OCR extractor
+
+For every page the grayscale image is the baseline. Net time is clean
+render + OCR minus grayscale render + OCR, so preprocessing time that OCR
+wins back shows up as a negative number. Accuracy is the similarity to the
+page's text layer when it has one, and mean word confidence always.
+
+Usage:
+    python benchmark_preprocess.py book.pdf [--pages 1,5,9] [--extractors targeted,improved]
+"""
+
+import time
+import argparse
+from pathlib import Path
+from ocr_engine import OCR_AVAILABLE, OCREnginePool
+from pdf_documents import get_document_cache
+from page_render import page_image
+from page_preprocess import NUMPY_AVAILABLE
+from benchmark_render_modes import parse_pages, text_similarity
+
+# (zoom, psm) each extractor OCRs a page with
+EXTRACTORS = {
+    "ocr_pdf": (1, 3),            # ocr_pdf_extraction / comprehensive_pdf_processing
+    "extract_pdf_ocr": (2, 6),
+    "targeted": (2.5, 6),
+    "improved": (3, 6)
+}
+
+def run_mode(pool, pdf_path, page_index, zoom, psm, mode, lang):
+    """Render and OCR one page in one mode; returns (render s, ocr s, text, confidence, method)"""
+    start = time.time()
+    with get_document_cache().page(pdf_path, page_index) as page:
+        image, ext, method = page_image(page, zoom, mode)
+    render_time = time.time() - start
+
+    start = time.time()
+    text, words = pool.ocr(image, psm=psm, lang=lang, words=True)
+    return render_time, time.time() - start, text, words.mean_confidence(), method
+
+def benchmark(pdf_path, page_indexes, extractors, lang='chi_sim+eng'):
+    """Compare grayscale and clean images page by page; returns a list of row dicts"""
+    documents = get_document_cache()
+    pool = OCREnginePool(workers=0, lang=lang)
+    rows = []
+
+    for page_index in page_indexes:
+        with documents.page(pdf_path, page_index) as page:
+            reference = page.get_text()
+
+        for name in extractors:
+            zoom, psm = EXTRACTORS[name]
+            gray = run_mode(pool, pdf_path, page_index, zoom, psm, 'gray', lang)
+            clean = run_mode(pool, pdf_path, page_index, zoom, psm, 'clean', lang)
+
+            row = {
+                "page": page_index + 1,
+                "extractor": name,
+                "method": gray[4],
+                "prep_time": clean[0] - gray[0],
+                "net_time": (clean[0] + clean[1]) - (gray[0] + gray[1]),
+                "gray_confidence": gray[3],
+                "clean_confidence": clean[3],
+                "gray_accuracy": None,
+                "clean_accuracy": None
+            }
+            if reference.strip():
+                row["gray_accuracy"] = text_similarity(reference, gray[2])
+                row["clean_accuracy"] = text_similarity(reference, clean[2])
+            rows.append(row)
+
+        print(f"Page {page_index + 1} done")
+
+    return rows
+
+def format_value(value, spec):
+    """Format a number, or a dash of the same width when it is missing"""
+    if value is None:
+        return '-'.center(len(format(0, spec)))
+    return format(value, spec)
+
+def print_report(rows):
+    """Print one row per page and extractor, then per-extractor means"""
+    print(f"\n{'page':>4} {'extractor':<16} {'prep s':>7} {'net s':>7} {'conf':>11} {'accuracy':>13}")
+
+    for row in rows:
+        print(f"{row['page']:>4} {row['extractor']:<16} {row['prep_time']:>7.3f} {row['net_time']:>+7.3f} "
+              f"{format_value(row['gray_confidence'], '>5.1f')}>{format_value(row['clean_confidence'], '<5.1f')} "
+              f"{format_value(row['gray_accuracy'], '>6.3f')}>{format_value(row['clean_accuracy'], '<6.3f')}")
+
+    print(f"\n{'extractor':<16} {'net s/page':>10} {'conf change':>11} {'accuracy change':>15}")
+    for name in dict.fromkeys(row["extractor"] for row in rows):
+        selected = [row for row in rows if row["extractor"] == name]
+        net = sum(row["net_time"] for row in selected) / len(selected)
+        confidence = [row["clean_confidence"] - row["gray_confidence"] for row in selected
+                      if row["gray_confidence"] is not None and row["clean_confidence"] is not None]
+        accuracy = [row["clean_accuracy"] - row["gray_accuracy"] for row in selected
+                    if row["gray_accuracy"] is not None]
+        print(f"{name:<16} {net:>+10.3f} "
+              f"{format_value(sum(confidence) / len(confidence) if confidence else None, '>+11.1f')} "
+              f"{format_value(sum(accuracy) / len(accuracy) if accuracy else None, '>+15.3f')}")
+
+    print("\nconf/accuracy: grayscale>clean; accuracy is similarity to the page's text layer")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure clean-mode preprocessing against grayscale OCR")
+    parser.add_argument('pdf', help="PDF file to benchmark")
+    parser.add_argument('--pages', help="Comma-separated 1-based page numbers (default: first 5)")
+    parser.add_argument('--extractors', default=','.join(EXTRACTORS),
+                        help=f"Comma-separated subset of {', '.join(EXTRACTORS)}")
+    parser.add_argument('--lang', default='chi_sim+eng')
+    args = parser.parse_args()
+
+    if not OCR_AVAILABLE:
+        parser.error("tesseract is not available")
+    if not NUMPY_AVAILABLE:
+        parser.error("NumPy is not installed; clean mode would fall back to bilevel")
+
+    extractors = [name for name in args.extractors.split(',') if name in EXTRACTORS]
+    total_pages = get_document_cache().page_count(args.pdf)
+    page_indexes = parse_pages(args.pages, total_pages)
+    print(f"Benchmarking {len(page_indexes)} pages of {Path(args.pdf).name} for {', '.join(extractors)}")
+
+    print_report(benchmark(args.pdf, page_indexes, extractors, lang=args.lang))
+
+if __name__ == "__main__":
+    main()
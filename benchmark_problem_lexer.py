@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Problem Lexer Benchmark
+Times the single-pass boundary lexer against the findall passes it replaced
+in TargetedMathExtractor and MathProblemOCRExtractor, and counts the
+problems each finds and how many of them overlap another problem
+
+The lexer is a quality change, not a speed change: it finds problems the
+findall passes cut in two, merged or counted twice, and every one of them
+is validated, classified and built, so per page it can cost more. The
+us/problem column separates that from segmentation cost.
+
+Pages are the text layer of a PDF, or pages assembled from the problem
+stems in data/*.json (numbered the way workbooks number them) when no PDF
+is given.
+
+Usage:
+    python benchmark_problem_lexer.py [--pdf book.pdf] [--pages 200] [--repeat 5]
+"""
+
+import re
+import glob
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from problem_lexer import problem_spans
+
+# The per-pattern passes the lexer replaced, kept here as the baseline
+TARGETED_PATTERNS = [
+    r'(\d+\.[^.\n]+(?:\n[^.\n]+){0,5})',
+    r'([①②③④⑤⑥⑦⑧⑨⑩][^①②③④⑤⑥⑦⑧⑨⑩\n]+(?:\n[^①②③④⑤⑥⑦⑧⑨⑩\n]+){0,3})',
+    r'(计算[^。\n]+(?:\n[^。\n]+){0,2})',
+    r'(应用题[^。\n]+(?:\n[^。\n]+){0,5})',
+    r'(练习[^。\n]+(?:\n[^。\n]+){0,10})',
+]
+OCR_PATTERNS = [
+    r'(\d+[\.、]\s*[^.\n]+(?:\n[^.\n]+)*?)',
+    r'([①②③④⑤⑥⑦⑧⑨⑩]\s*[^①②③④⑤⑥⑦⑧⑨⑩\n]+(?:\n[^①②③④⑤⑥⑦⑧⑨⑩\n]+)*?)',
+    r'((?:题|计算|求|解)[^.\n]+(?:\n[^.\n]+)*?)',
+]
+
+def findall_targeted(extractor, text, page_num, source_file):
+    """TargetedMathExtractor.extract_problems_from_text before the lexer"""
+    problems = []
+    text = re.sub(r'[^\u4e00-\u9fff\w\s+\-×÷=＜＞≤≥\(\)\[\]{}.,，。、:：;；!！?？\d]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    for pattern in TARGETED_PATTERNS:
+        for match in re.findall(pattern, text, re.MULTILINE):
+            match = match.strip()
+            if extractor.is_valid_problem(match):
+                problems.append(extractor.create_problem(match, page_num, len(problems) + 1, source_file))
+    return problems
+
+def findall_ocr(extractor, text, page_num, source_file):
+    """MathProblemOCRExtractor.extract_math_problems before the lexer"""
+    problems = []
+    for pattern in OCR_PATTERNS:
+        for match in re.findall(pattern, text, re.MULTILINE):
+            match = match.strip()
+            if len(match) > 15:
+                problems.append({
+                    "id": f"{Path(source_file).stem}_{page_num}_{len(problems)+1}",
+                    "source": f"{source_file} (Page {page_num})",
+                    "stem": match,
+                    "taxonomy": "math",
+                    "steps": [],
+                    "transitions": [],
+                    "scoring": {"total": 5, "steps": []},
+                    "answer": "",
+                    "analysis": "",
+                    "knowledgePoints": extractor.extract_knowledge_points(match),
+                    "difficulty": extractor.estimate_difficulty(match),
+                    "type": extractor.classify_problem_type(match)
+                })
+    return problems
+
+def implementations():
+    """Return ({name: run(text, page_num, source_file)}, cleanups): findall and lexer version per extractor"""
+    from targeted_ocr_extraction import TargetedMathExtractor
+    from extract_pdf_ocr import MathProblemOCRExtractor
+    targeted = TargetedMathExtractor()
+    ocr = MathProblemOCRExtractor()
+    return {
+        "targeted findall": lambda *page: findall_targeted(targeted, *page),
+        "targeted lexer": targeted.extract_problems_from_text,
+        "extract_pdf_ocr findall": lambda *page: findall_ocr(ocr, *page),
+        "extract_pdf_ocr lexer": ocr.extract_math_problems,
+    }, [targeted.cleanup, ocr.cleanup]
+
+def data_stems():
+    """Distinct problem stems from the JSON problem banks in data/"""
+    stems = []
+    for path in sorted(glob.glob('data/*.json')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        items = data.get('items', []) if isinstance(data, dict) else data
+        for item in items:
+            stem = item.get('stem') if isinstance(item, dict) else None
+            if isinstance(stem, dict):
+                stem = stem.get('text')
+            if isinstance(stem, str) and stem.strip():
+                stems.append(stem.strip())
+    return list(dict.fromkeys(stems))
+
+def synthetic_pages(count, per_page=8, seed=0):
+    """Workbook-like pages: a heading, then stems numbered 1. / ① / 第N题, some with answers
+
+    A page never repeats a stem, so every overlap counted is one of segmentation.
+    """
+    stems = data_stems() or ["一个长方形的长是12厘米，宽是5厘米，求这个长方形的面积和周长。"]
+    rng = random.Random(seed)
+    pages = []
+
+    for page_index in range(count):
+        lines = [f"第{page_index + 1}课 练习{page_index % 9 + 1}"]
+        page_stems = rng.sample(stems, per_page) if len(stems) >= per_page else rng.choices(stems, k=per_page)
+        for number, stem in enumerate(page_stems, 1):
+            style = rng.choice(["number", "number", "circled", "question"])
+            label = {"number": f"{number}.", "circled": "①②③④⑤⑥⑦⑧⑨⑩"[(number - 1) % 10],
+                     "question": f"第{number}题"}[style]
+            line = f"{label} {stem}"
+            if rng.random() < 0.3:
+                line += f" 答案：{rng.randint(2, 999)}"
+            lines.append(line)
+        pages.append('\n'.join(lines))
+
+    return pages
+
+def pdf_pages(pdf_path, count):
+    """Text layer of the first count pages of a PDF"""
+    from pdf_documents import get_document_cache
+    documents = get_document_cache()
+    pages = []
+    for page_index in range(min(count, documents.page_count(pdf_path))):
+        with documents.page(pdf_path, page_index) as page:
+            pages.append(page.get_text())
+    return pages
+
+def overlapping(stems):
+    """Number of stems that share text with another stem of the same page"""
+    count = 0
+    for index, stem in enumerate(stems):
+        if any(index != other_index and (stem in other or other in stem) for other_index, other in enumerate(stems)):
+            count += 1
+    return count
+
+def benchmark(pages, repeat=5):
+    """Time every implementation over all pages; returns a list of row dicts"""
+    runs, cleanups = implementations()
+    rows = []
+
+    try:
+        for name, run in runs.items():
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = [run(text, page_num, "benchmark.pdf") for page_num, text in enumerate(pages, 1)]
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            rows.append({
+                "name": name,
+                "ms_per_page": best * 1000 / max(1, len(pages)),
+                "problems": sum(len(problems) for problems in results),
+                "overlapping": sum(overlapping([problem["stem"] for problem in problems]) for problems in results)
+            })
+    finally:
+        for cleanup in cleanups:
+            cleanup()
+
+    start = time.perf_counter()
+    for text in pages:
+        problem_spans(text)
+    print(f"Lexer scan alone (spans, no problem building): {(time.perf_counter() - start) * 1000 / max(1, len(pages)):.3f} ms/page\n")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the problem boundary lexer against the findall passes")
+    parser.add_argument('--pdf', help="Use this PDF's text layer instead of synthetic pages")
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = pdf_pages(args.pdf, args.pages) if args.pdf else synthetic_pages(args.pages)
+    print(f"{len(pages)} pages, {sum(len(text) for text in pages)} characters, best of {args.repeat} runs\n")
+
+    rows = benchmark(pages, args.repeat)
+    print(f"{'implementation':<24} {'ms/page':>9} {'speedup':>8} {'problems':>9} {'us/problem':>11} "
+          f"{'overlapping':>12}")
+    for index, row in enumerate(rows):
+        # Each lexer row is compared with the findall row before it
+        baseline = rows[index - index % 2]["ms_per_page"]
+        speedup = baseline / row["ms_per_page"] if row["ms_per_page"] else 0.0
+        per_problem = row["ms_per_page"] * 1000 * len(pages) / row["problems"] if row["problems"] else 0.0
+        print(f"{row['name']:<24} {row['ms_per_page']:>9.3f} {speedup:>7.2f}x {row['problems']:>9} "
+              f"{per_problem:>11.1f} {row['overlapping']:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Render Mode Benchmark
+Compares RGB, grayscale, bilevel and clean page images on image size, render time,
+OCR time and OCR agreement with the RGB baseline
+
+Usage:
+    python benchmark_render_modes.py book.pdf [--pages 1,5,9] [--zoom 3] [--psm 6]
+"""
+
+import time
+import difflib
+import argparse
+from pathlib import Path
+from ocr_engine import OCR_AVAILABLE, OCREnginePool
+from pdf_documents import get_document_cache
+from page_render import RENDER_MODES, page_image
+
+def parse_pages(spec, total_pages):
+    """Turn a 1-based '1,5,9' list into page indexes (default: first 5 pages)"""
+    if not spec:
+        return list(range(min(5, total_pages)))
+    return [int(part) - 1 for part in spec.split(',') if 0 < int(part) <= total_pages]
+
+def text_similarity(reference, text):
+    """Character-level similarity of two OCR outputs, ignoring whitespace"""
+    reference = ''.join(reference.split())
+    text = ''.join(text.split())
+    if not reference and not text:
+        return 1.0
+    return difflib.SequenceMatcher(None, reference, text, autojunk=False).ratio()
+
+def benchmark(pdf_path, page_indexes, zoom=3, psm=6, lang='chi_sim+eng', run_ocr=True):
+    """Measure every render mode on the given pages; returns per-mode totals"""
+    documents = get_document_cache()
+    pool = OCREnginePool(workers=0, lang=lang)
+    results = {mode: {"bytes": 0, "peak_bytes": 0, "render_time": 0.0, "ocr_time": 0.0,
+                      "similarity": [], "confidence": []}
+               for mode in RENDER_MODES}
+
+    for page_index in page_indexes:
+        reference = None
+
+        for mode in RENDER_MODES:
+            stats = results[mode]
+
+            start = time.time()
+            with documents.page(pdf_path, page_index) as page:
+                image, ext, method = page_image(page, zoom, mode)
+            stats["render_time"] += time.time() - start
+            stats["bytes"] += len(image)
+            stats["peak_bytes"] = max(stats["peak_bytes"], len(image))
+
+            if not run_ocr:
+                continue
+
+            start = time.time()
+            text, confidences = pool.ocr(image, psm=psm, confidences=True)
+            stats["ocr_time"] += time.time() - start
+
+            # RGB runs first and is the baseline the other modes are scored against
+            if reference is None:
+                reference = text
+            stats["similarity"].append(text_similarity(reference, text))
+            words = [c for c in confidences if c >= 0]
+            if words:
+                stats["confidence"].append(sum(words) / len(words))
+
+        print(f"Page {page_index + 1} done ({method})")
+
+    return results
+
+def print_report(results, page_count):
+    """Print one row per render mode"""
+    baseline = results['rgb']["bytes"] or 1
+    print(f"\n{'mode':<8} {'MB/page':>8} {'vs rgb':>7} {'render s':>9} {'ocr s':>7} "
+          f"{'similarity':>10} {'confidence':>10}")
+
+    for mode, stats in results.items():
+        similarity = (sum(stats["similarity"]) / len(stats["similarity"])) if stats["similarity"] else None
+        confidence = (sum(stats["confidence"]) / len(stats["confidence"])) if stats["confidence"] else None
+        print(f"{mode:<8} {stats['bytes'] / page_count / (1024 * 1024):>8.2f} "
+              f"{stats['bytes'] / baseline:>7.2f} "
+              f"{stats['render_time'] / page_count:>9.3f} "
+              f"{stats['ocr_time'] / page_count:>7.2f} "
+              f"{similarity if similarity is not None else float('nan'):>10.3f} "
+              f"{confidence if confidence is not None else float('nan'):>10.1f}")
+
+    print("\nsimilarity: difflib ratio of each mode's OCR text against the RGB text")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the page render modes for OCR")
+    parser.add_argument('pdf', help="PDF file to benchmark")
+    parser.add_argument('--pages', help="Comma-separated 1-based page numbers (default: first 5)")
+    parser.add_argument('--zoom', type=float, default=3)
+    parser.add_argument('--psm', type=int, default=6)
+    parser.add_argument('--lang', default='chi_sim+eng')
+    parser.add_argument('--no-ocr', action='store_true', help="Only measure rendering")
+    args = parser.parse_args()
+
+    run_ocr = OCR_AVAILABLE and not args.no_ocr
+    if not run_ocr and not args.no_ocr:
+        print("Warning: tesseract not available, measuring rendering only")
+
+    total_pages = get_document_cache().page_count(args.pdf)
+    page_indexes = parse_pages(args.pages, total_pages)
+    print(f"Benchmarking {len(page_indexes)} pages of {Path(args.pdf).name} at zoom {args.zoom:g}")
+
+    results = benchmark(args.pdf, page_indexes, zoom=args.zoom, psm=args.psm, lang=args.lang,
+                        run_ocr=run_ocr)
+    print_report(results, max(len(page_indexes), 1))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Segmentation Benchmark on Pathological Pages
+Times the lazy DOTALL segmentation patterns the extractors used against
+page_segmenter on inputs built to trigger backtracking, at doubling sizes
+
+The growth column is log2 of the time ratio between consecutive sizes:
+about 1 means linear time, about 2 quadratic.
+
+Cases:
+    digit run      a long run of digits with no item markers (number grids, OCR noise)
+    one item       one numbered item followed by a long cleaned page
+    solve only     many 解 with no 题 after them (is_math_problem's 解.*?题)
+    workbook page  an ordinary page of numbered problems, for reference
+
+Usage:
+    python benchmark_segmentation.py [--sizes 2000,4000,8000,16000] [--repeat 3]
+"""
+
+import re
+import math
+import time
+import argparse
+from page_segmenter import ordered_in_line, segments
+
+# The patterns page_segmenter replaced, kept here as the baseline
+OLD_PATTERNS = {
+    "circled": r'([①②③④⑤⑥⑦⑧⑨⑩])\s*(.*?)(?=[①②③④⑤⑥⑦⑧⑨⑩]|$)',
+    "numbered": r'([1-9]+[\.、])\s*(.*?)(?=[1-9]+[\.、]|$)',
+    "question": r'(第[一二三四五六七八九十\d]+题)\s*(.*?)(?=第[一二三四五六七八九十\d]+题|$)',
+}
+OLD_PAIRS = [r'解.*?题', r'计算.*?式', r'求.*?值']
+PAIRS = [('解', '题'), ('计算', '式'), ('求', '值')]
+
+def old_segment(text):
+    """Segment bodies and indicator checks the way the extractors did before"""
+    bodies = [match[1].strip() for pattern in OLD_PATTERNS.values()
+              for match in re.findall(pattern, text, re.DOTALL)]
+    return bodies, [bool(re.search(pattern, text)) for pattern in OLD_PAIRS]
+
+def new_segment(text):
+    """The same results from page_segmenter"""
+    bodies = [body.strip() for family in OLD_PATTERNS for marker, body in segments(text, family)]
+    return bodies, [ordered_in_line(text, first, second) for first, second in PAIRS]
+
+def make_case(name, size):
+    """Text of about size characters for a pathological case"""
+    if name == "digit run":
+        return ("1234567892" * (size // 10 + 1))[:size]
+    if name == "one item":
+        filler = "小明买了3支笔和12本书共花了45元 "
+        return "1. " + (filler * (size // len(filler) + 1))[:size]
+    if name == "solve only":
+        return ("解方程 x+3=5 " * (size // 10 + 1))[:size]
+    problem = "一个长方形的长是12厘米，宽是5厘米，求这个长方形的面积和周长。"
+    return ' '.join(f"{number}. {problem}" for number in range(1, size // (len(problem) + 4) + 2))[:size]
+
+CASES = ["digit run", "one item", "solve only", "workbook page"]
+
+def time_run(run, text, repeat):
+    """Best wall time of repeat runs, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def growth(times, index):
+    """log2 of the time ratio to the previous size (None for the first size)"""
+    if index == 0 or not times[index - 1] or not times[index]:
+        return None
+    return math.log2(times[index] / times[index - 1])
+
+def format_growth(value):
+    return "" if value is None else f"{value:.2f}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark segmentation on inputs that trigger regex backtracking")
+    parser.add_argument('--sizes', default='2000,4000,8000,16000', help="Comma-separated page lengths, doubling")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'case':<14} {'chars':>7} {'old ms':>10} {'growth':>7} {'new ms':>9} {'growth':>7}")
+    for name in CASES:
+        old_times = []
+        new_times = []
+        for index, size in enumerate(sizes):
+            text = make_case(name, size)
+            if old_segment(text) != new_segment(text):
+                print(f"{name} at {size} chars: segmenter output differs from the old patterns")
+            old_times.append(time_run(old_segment, text, args.repeat))
+            new_times.append(time_run(new_segment, text, args.repeat))
+            print(f"{name:<14} {size:>7} {old_times[-1] * 1000:>10.2f} {format_growth(growth(old_times, index)):>7} "
+                  f"{new_times[-1] * 1000:>9.3f} {format_growth(growth(new_times, index)):>7}")
+
+if __name__ == "__main__":
+    main()
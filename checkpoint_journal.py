@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Per-page Checkpoint Journal
+Append-only JSONL record of the problems extracted from every finished page,
+so an extraction run that crashes or is killed can be resumed without
+redoing the OCR of pages it already finished
+
+Each line is one page:
+    {"pdf": content hash, "file": path, "page": 1-based page number,
+     "problems": [...], "time": unix time}
+plus "held": [page number, text] when the extractor's page stitcher was
+still holding back an unfinished problem after that page. A resumed run
+restores it, so the problem can still be joined with the next page. The
+first page of a sharded run also carries "lead": [page number, text], the
+fragment before its first problem marker, which the shard merge joins
+with the span held at the end of the shard before.
+
+Pages are keyed by PDF content hash, so a journal never replays pages of a
+file that has since changed. A line cut short by a crash is ignored and the
+page is simply done again.
+"""
+
+import os
+import json
+import time
+from ocr_cache import pdf_content_hash
+
+def default_journal_path(output_file):
+    """Journal file kept next to a run's JSON output"""
+    return f"{output_file}.journal.jsonl"
+
+class CheckpointJournal:
+    """Finished pages of one extraction run"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self._pages = {}  # pdf hash -> {page number: problems}
+        self._held = {}  # pdf hash -> {page number: (page number, text) held back after it, or None}
+        self._leads = {}  # pdf hash -> {page number: (page number, text) of its leading fragment}
+
+        if resume and os.path.exists(path):
+            self._load()
+            finished = sum(len(pages) for pages in self._pages.values())
+            print(f"Resuming from {path}: {finished} pages already done")
+        elif not resume and os.path.exists(path):
+            os.remove(path)  # A fresh run starts a fresh journal
+
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell() and not self._ends_with_newline():
+            self._file.write('\n')  # Keep new entries off a line cut short by a crash
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial last line from an interrupted write
+                self._pages.setdefault(entry["pdf"], {})[entry["page"]] = entry["problems"]
+                held = entry.get("held")
+                self._held.setdefault(entry["pdf"], {})[entry["page"]] = tuple(held) if held else None
+                if entry.get("lead"):
+                    self._leads.setdefault(entry["pdf"], {})[entry["page"]] = tuple(entry["lead"])
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def finished(self, pdf_path):
+        """{page number: problems} of pages already done for a PDF"""
+        return self._pages.get(pdf_content_hash(pdf_path), {})
+
+    def held(self, pdf_path, page_num):
+        """(page number, text) of the span a page stitcher held back after a finished page, or None"""
+        return self._held.get(pdf_content_hash(pdf_path), {}).get(page_num)
+
+    def lead(self, pdf_path, page_num):
+        """(page number, text) of the leading fragment a sharded run set aside on a page, or None"""
+        return self._leads.get(pdf_content_hash(pdf_path), {}).get(page_num)
+
+    def record(self, pdf_path, page_num, problems, held=None, lead=None):
+        """Append one finished page and push it to disk before returning
+
+        held is the (page number, text) span a page stitcher still holds
+        after this page; recording the page again replaces it. lead is the
+        page's leading fragment set aside for the shard merge, which
+        recording the page again keeps.
+        """
+        pdf_hash = pdf_content_hash(pdf_path)
+        lead = lead or self._leads.get(pdf_hash, {}).get(page_num)
+        entry = {"pdf": pdf_hash, "file": str(pdf_path), "page": page_num, "problems": problems,
+                 "time": time.time()}
+        if held:
+            entry["held"] = list(held)
+        if lead:
+            entry["lead"] = list(lead)
+            self._leads.setdefault(pdf_hash, {})[page_num] = tuple(lead)
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pages.setdefault(pdf_hash, {})[page_num] = problems
+        self._held.setdefault(pdf_hash, {})[page_num] = tuple(held) if held else None
+
+    def close(self):
+        self._file.close()
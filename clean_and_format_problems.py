@@ -108,6 +108,10 @@ class ProblemCleaner:
             "gradeLevel": "4"
         }
 
+        # Keep the measured OCR word confidence for integration scoring
+        if problem.get('ocrConfidence') is not None:
+            cleaned_problem['ocrConfidence'] = problem['ocrConfidence']
+
         return cleaned_problem
 
     def generate_steps(self, stem):
@@ -13,51 +13,42 @@ from pathlib import Path
 sys.path.insert(0, './pdf_env/lib/python3.13/site-packages')
 
 import fitz  # PyMuPDF
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE
+from page_fusion import PageFusion
+from page_segmenter import DEFAULT_PAGE_BUDGET, PageBudget, segment_page
+from page_stitcher import family_markers, stitch_pages
+from problem_patterns import collapse_whitespace, is_math_problem, labelled_value, strip_solution
 import PyPDF2
 
-# Try to import OCR libraries
-try:
-    import pytesseract
-    from PIL import Image
-    import io
-    OCR_AVAILABLE = True
-    print("OCR libraries available")
-except ImportError:
-    OCR_AVAILABLE = False
-    print("OCR libraries not available")
+# OCR runs on the shared tesseract engine pool
+from ocr_engine import OCR_AVAILABLE, get_shared_pool
+
+if OCR_AVAILABLE:
+    print("OCR engine available")
+else:
+    print("OCR engine not available")
 
 class ComprehensiveMathProblemExtractor:
-    def __init__(self):
+    def __init__(self, ocr_pool=None, render_mode=None, page_budget=DEFAULT_PAGE_BUDGET):
         self.extracted_problems = []
         self.current_problem = {}
+        self.ocr_pool = ocr_pool or get_shared_pool()
+        # 'rgb', 'gray' or 'bilevel' page images (see page_render)
+        self.render_mode = render_mode or DEFAULT_RENDER_MODE
+        # Whole scanned pages are read at zoom 1 with automatic page segmentation
+        self.fusion = PageFusion(self.ocr_pool, zoom=1, psm=3, render_mode=self.render_mode)
+        # Seconds of segmentation allowed per page
+        self.page_budget = page_budget
 
     def clean_text(self, text):
         """Clean extracted text"""
-        text = re.sub(r'\s+', ' ', text).strip()
-        text = re.sub(r'[\u3000]+', ' ', text)  # Remove full-width spaces
-        return text
+        # Remove excessive whitespace (full-width spaces included)
+        return collapse_whitespace(text)
 
     def is_math_problem(self, text):
         """Check if text looks like a math problem"""
-        math_indicators = [
-            r'\d+\s*[＋+\-×÷]\s*\d+',  # Basic operations
-            r'解.*?题',  # Solve problem
-            r'计算.*?式',  # Calculate expression
-            r'求.*?值',  # Find value
-            r'应用题',  # Word problem
-            r'选择题',  # Multiple choice
-            r'填空题',  # Fill in blank
-            r'判断题',  # True/False
-            r'[①②③④⑤⑥⑦⑧⑨⑩]',  # Problem numbers
-            r'[1-9]\.\s*',  # Numbered problems
-            r'千克|克|米|厘米|分钟|小时',  # Units
-            r'苹果|书|学生|班级|学校',  # Common math problem subjects
-        ]
-
-        for pattern in math_indicators:
-            if re.search(pattern, text):
-                return True
-        return False
+        return is_math_problem(text, context=True)
 
     def extract_problem_structure(self, text, source_info=""):
         """Extract structured problem from text"""
@@ -82,21 +73,13 @@ class ComprehensiveMathProblemExtractor:
         }
 
         # Extract problem stem
-        stem = re.sub(r'答案[:：].*?$', '', text, flags=re.MULTILINE)
-        stem = re.sub(r'答[:：].*?$', '', stem, flags=re.MULTILINE)
-        stem = re.sub(r'解[:：].*?$', '', stem, flags=re.MULTILINE)
-        stem = re.sub(r'解析[:：].*?$', '', stem, flags=re.MULTILINE)
-        problem["stem"] = stem.strip()
+        problem["stem"] = strip_solution(text).strip()
 
         # Extract answer
-        answer_match = re.search(r'答案[:：]\s*(.*?)(?:\n|$)', text)
-        if answer_match:
-            problem["answer"] = answer_match.group(1).strip()
+        problem["answer"] = labelled_value("answer", text)
 
         # Extract analysis
-        analysis_match = re.search(r'解析[:：]\s*(.*?)(?:\n|$)', text)
-        if analysis_match:
-            problem["analysis"] = analysis_match.group(1).strip()
+        problem["analysis"] = labelled_value("analysis", text)
 
         # Determine difficulty
         stem_length = len(problem["stem"])
@@ -123,15 +106,13 @@ class ComprehensiveMathProblemExtractor:
         problems = []
 
         try:
-            doc = fitz.open(pdf_path)
-            full_text = ""
-
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                text = page.get_text()
-                full_text += text + "\n"
+            with get_document_cache().document(pdf_path) as doc:
+                full_text = ""
 
-            doc.close()
+                for page_num in range(len(doc)):
+                    page = doc[page_num]
+                    text = page.get_text()
+                    full_text += text + "\n"
 
             # Process the math competition answer key
             lines = full_text.split('\n')
@@ -178,6 +159,25 @@ class ComprehensiveMathProblemExtractor:
             print(f"Error processing text PDF: {e}")
             return []
 
+    def read_pages(self, pdf_path, page_count, methods):
+        """Yield (page number, cleaned text) for the first page_count pages
+
+        Text-layer blocks are used as they are, OCR for images without text
+        coverage; methods gets "ocr" or "text" for each page read.
+        """
+        for page_num in range(page_count):
+            try:
+                text, stats = self.fusion.read_page(pdf_path, page_num)
+            except Exception as e:
+                print(f"  OCR failed for page {page_num + 1}: {e}")
+                continue
+            use_ocr = stats["method"] != "text"
+            if use_ocr:
+                print(f"  Using OCR for {stats['ocr_blocks']} block(s) of page {page_num + 1}")
+
+            methods[page_num + 1] = "ocr" if use_ocr else "text"
+            yield page_num + 1, self.clean_text(text)
+
     def extract_from_scanned_pdf(self, pdf_path, max_pages=10):
         """Extract from scanned PDF using OCR"""
         print(f"Processing scanned PDF: {pdf_path} (first {max_pages} pages)")
@@ -188,56 +188,31 @@ class ComprehensiveMathProblemExtractor:
             return []
 
         try:
-            doc = fitz.open(pdf_path)
-            print(f"Total pages: {len(doc)}, processing first {max_pages}")
-
-            for page_num in range(min(max_pages, len(doc))):
-                page = doc[page_num]
-
-                # First try regular text extraction
-                text = page.get_text()
-                use_ocr = len(text.strip()) < 50
-
-                if use_ocr:
-                    print(f"  Using OCR for page {page_num + 1}")
-                    try:
-                        # Get page as image
-                        pix = page.get_pixmap()
-                        img_data = pix.tobytes("ppm")
-                        img = Image.open(io.BytesIO(img_data))
-
-                        # Use Tesseract OCR
-                        text = pytesseract.image_to_string(img, lang='chi_sim+eng')
-                    except Exception as e:
-                        print(f"  OCR failed for page {page_num + 1}: {e}")
-                        continue
-
-                # Clean and process the text
-                text = self.clean_text(text)
-
-                # Look for problem patterns
-                problem_patterns = [
-                    r'([①②③④⑤⑥⑦⑧⑨⑩])\s*(.*?)(?=[①②③④⑤⑥⑦⑧⑨⑩]|$)',
-                    r'([1-9]+[\.、])\s*(.*?)(?=[1-9]+[\.、]|$)',
-                ]
-
-                for pattern in problem_patterns:
-                    matches = re.findall(pattern, text, re.DOTALL)
-                    for match in matches:
-                        if len(match) >= 2:
-                            problem_text = match[1].strip()
-                            if len(problem_text) > 20 and self.is_math_problem(problem_text):
-                                problem = self.extract_problem_structure(
-                                    problem_text,
-                                    f"{Path(pdf_path).name} (Page {page_num + 1})"
-                                )
-                                problem["id"] = f"{Path(pdf_path).stem}_page{page_num + 1}_{len(problems)+1}"
-                                problem["extraction_method"] = "ocr" if use_ocr else "text"
-
-                                if problem["stem"]:
-                                    problems.append(problem)
-
-            doc.close()
+            total_pages = get_document_cache().page_count(pdf_path)
+            print(f"Total pages: {total_pages}, processing first {max_pages}")
+
+            # A problem cut by a page break is held back and joined with the top of the next page
+            methods = {}
+            pages = self.read_pages(pdf_path, min(max_pages, total_pages), methods)
+            for page, text in stitch_pages(pages, family_markers(("circled", "numbered"))):
+                # Segments between circled and numbered markers, in linear time
+                budget = PageBudget(self.page_budget)
+                for family, marker, problem_text in segment_page(text, ("circled", "numbered"), budget):
+                    problem_text = problem_text.strip()
+                    if len(problem_text) > 20 and self.is_math_problem(problem_text):
+                        problem = self.extract_problem_structure(
+                            problem_text,
+                            f"{Path(pdf_path).name} (Page {page})"
+                        )
+                        problem["id"] = f"{Path(pdf_path).stem}_page{page}_{len(problems)+1}"
+                        problem["extraction_method"] = methods[page]
+
+                        if problem["stem"]:
+                            problems.append(problem)
+
+                if budget.expired():
+                    print(f"  Page {page}: segmentation stopped at the {budget.seconds}s page budget")
+
             print(f"Found {len(problems)} problems in {max_pages} pages")
             return problems
 
@@ -17,59 +17,34 @@ except ImportError as e:
     print(f"Error importing PDF libraries: {e}")
     sys.exit(1)
 
+from page_stream import iter_text_pages
+from page_segmenter import DEFAULT_PAGE_BUDGET, PageBudget, segment_page
+from page_stitcher import family_markers, stitch_pages
+from problem_patterns import collapse_whitespace, is_math_problem, labelled_value, markdown_style, stem_head
+
 class EnhancedMathProblemExtractor:
-    def __init__(self):
+    def __init__(self, page_budget=DEFAULT_PAGE_BUDGET):
         self.extracted_problems = []
         self.current_problem = {}
+        # Seconds of segmentation allowed per page
+        self.page_budget = page_budget
 
     def clean_text(self, text):
         """Clean extracted text with markitdown-style processing"""
         # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = collapse_whitespace(text)
         # Remove empty lines
         lines = [line.strip() for line in text.split('\n') if line.strip()]
         return '\n'.join(lines)
 
     def convert_to_markdown_style(self, text):
         """Convert text to markdown-like format for better structure detection"""
-        # Add markdown-style formatting
-        markdown_text = text
-
-        # Convert problem numbers to markdown headers
-        markdown_text = re.sub(r'([①②③④⑤⑥⑦⑧⑨⑩]|[1-9]+[\.、])\s*(.*?)', r'## \1 \2', markdown_text)
-
-        # Convert answer sections
-        markdown_text = re.sub(r'答案[:：]\s*(.*?)', r'**答案**: \1', markdown_text)
-
-        # Convert analysis sections
-        markdown_text = re.sub(r'解析[:：]\s*(.*?)', r'**解析**: \1', markdown_text)
-
-        # Convert solution sections
-        markdown_text = re.sub(r'解[:：]\s*(.*?)', r'**解**: \1', markdown_text)
-
-        return markdown_text
+        # Problem numbers become markdown headers, answer, analysis and solution labels bold
+        return markdown_style(text)
 
     def is_math_problem(self, text):
         """Check if text looks like a math problem with enhanced detection"""
-        math_indicators = [
-            r'\d+\s*[＋+\-×÷]\s*\d+',  # Basic operations
-            r'解.*?题',  # Solve problem
-            r'计算.*?式',  # Calculate expression
-            r'求.*?值',  # Find value
-            r'应用题',  # Word problem
-            r'选择题',  # Multiple choice
-            r'填空题',  # Fill in blank
-            r'判断题',  # True/False
-            r'[①②③④⑤⑥⑦⑧⑨⑩]',  # Problem numbers
-            r'[1-9]\.\s*',  # Numbered problems
-            r'千克|克|米|厘米|分钟|小时',  # Units
-            r'苹果|书|学生|班级|学校',  # Common math problem subjects
-        ]
-
-        for pattern in math_indicators:
-            if re.search(pattern, text):
-                return True
-        return False
+        return is_math_problem(text, context=True)
 
     def extract_problem_structure(self, text):
         """Extract structured problem with enhanced format"""
@@ -96,19 +71,13 @@ class EnhancedMathProblemExtractor:
         }
 
         # Extract problem stem (before answer/solution sections)
-        stem_match = re.search(r'^(.*?)(?=答案|答|解|解析|$)', markdown_text, re.DOTALL)
-        if stem_match:
-            problem["stem"] = stem_match.group(1).strip()
+        problem["stem"] = stem_head(markdown_text)
 
         # Extract answer
-        answer_match = re.search(r'\*\*答案\*\*[:：]?\s*(.*?)(?=\n|$)', markdown_text)
-        if answer_match:
-            problem["answer"] = answer_match.group(1).strip()
+        problem["answer"] = labelled_value("markdown_answer", markdown_text)
 
         # Extract analysis
-        analysis_match = re.search(r'\*\*解析\*\*[:：]?\s*(.*?)(?=\n|$)', markdown_text)
-        if analysis_match:
-            problem["analysis"] = analysis_match.group(1).strip()
+        problem["analysis"] = labelled_value("markdown_analysis", markdown_text)
 
         # Enhanced difficulty detection
         stem_length = len(problem["stem"])
@@ -134,62 +103,41 @@ class EnhancedMathProblemExtractor:
         print(f"Processing PDF: {pdf_path}")
 
         try:
-            # Use PyMuPDF for better Chinese text extraction
-            doc = fitz.open(pdf_path)
-            text_content = ""
-            page_info = []
-
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                text = page.get_text()
-                text_content += f"\n--- Page {page_num + 1} ---\n{text}"
-                page_info.append({"page": page_num + 1, "text_length": len(text)})
-
-            doc.close()
-
-            # Process with enhanced extraction
-            problems = self.process_enhanced_content(text_content, pdf_path, page_info)
+            # Use PyMuPDF for better Chinese text extraction, streamed page by page
+            problems = self.process_enhanced_content(iter_text_pages(pdf_path), pdf_path)
             return problems
 
         except Exception as e:
             print(f"Error processing PDF: {e}")
             return []
 
-    def process_enhanced_content(self, text_content, source_file, page_info):
-        """Process content with enhanced extraction"""
+    def process_enhanced_content(self, pages, source_file):
+        """Process a stream of page records with enhanced extraction"""
         problems = []
 
-        # Split by pages
-        pages = text_content.split('--- Page')
-
-        for i, page_content in enumerate(pages[1:], 1):  # Skip first empty split
-            page_text = self.clean_text(page_content)
-
-            # Enhanced problem detection using multiple patterns
-            problem_patterns = [
-                r'([①②③④⑤⑥⑦⑧⑨⑩])\s*(.*?)(?=[①②③④⑤⑥⑦⑧⑨⑩]|$)',
-                r'([1-9]+[\.、])\s*(.*?)(?=[1-9]+[\.、]|$)',
-                r'(第[一二三四五六七八九十\d]+题)\s*(.*?)(?=第[一二三四五六七八九十\d]+题|$)',
-                r'(例题\d*)\s*(.*?)(?=例题|$)',
-            ]
-
-            for pattern in problem_patterns:
-                matches = re.findall(pattern, page_text, re.DOTALL)
-                for match in matches:
-                    if len(match) >= 2:
-                        problem_text = match[1].strip()
-                        if len(problem_text) > 20 and self.is_math_problem(problem_text):
-                            problem = self.extract_problem_structure(problem_text)
-                            problem["source"] = f"{source_file} (Page {i})"
-                            problem["id"] = f"{Path(source_file).stem}_page{i}_enhanced{len(problems)+1}"
-                            problem["extraction_method"] = "enhanced_markdown_style"
-                            problem["page_number"] = i
-
-                            if problem["stem"]:
-                                problems.append(problem)
-
+        families = ("circled", "numbered", "question", "example")
+
+        # A problem cut by a page break is held back and joined with the top of the next page
+        cleaned_pages = ((record["page"], self.clean_text(record["text"])) for record in pages)
+        for i, page_text in stitch_pages(cleaned_pages, family_markers(families)):
+            # Enhanced problem detection: segments between each family of markers, in linear time
+            budget = PageBudget(self.page_budget)
+            for family, marker, problem_text in segment_page(page_text, families, budget):
+                problem_text = problem_text.strip()
+                if len(problem_text) > 20 and self.is_math_problem(problem_text):
+                    problem = self.extract_problem_structure(problem_text)
+                    problem["source"] = f"{source_file} (Page {i})"
+                    problem["id"] = f"{Path(source_file).stem}_page{i}_enhanced{len(problems)+1}"
+                    problem["extraction_method"] = "enhanced_markdown_style"
+                    problem["page_number"] = i
+
+                    if problem["stem"]:
+                        problems.append(problem)
+
+            if budget.expired():
+                print(f"  Page {i}: segmentation stopped at the {budget.seconds}s page budget")
             # If no structured problems found, look for math content blocks
-            if not problems:
+            elif not problems:
                 math_blocks = re.split(r'[。！？]', page_text)
                 for block in math_blocks:
                     block = block.strip()
@@ -9,63 +9,93 @@ import sys
 import json
 import re
 import tempfile
-import subprocess
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from PIL import Image
-import fitz  # PyMuPDF
+from ocr_engine import OCREnginePool, get_shared_pool
+from ocr_cache import cache_key, get_shared_cache
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE, embedded_scan_image, encode_pixmap, page_image, render_pixmap
+from page_preprocess import NUMPY_AVAILABLE, preprocess_pixmap
+from page_pipeline import PagePipeline, Stage, parse_stage_workers
+from selective_reocr import SelectiveReOCR
+from problem_lexer import problem_spans, span_parts
+from page_stitcher import PageStitcher, lexer_markers
+from keyword_automaton import first_label, keyword_labels
+from checkpoint_journal import CheckpointJournal, default_journal_path
+from shard_results import add_shard_arguments, merge_shards, shard_pages, shard_path, write_shard
+
+# Per-process state for parallel page workers
+_worker_extractor = None
+
+def _init_page_worker(temp_dir, render_mode, two_pass):
+    """Set up a page worker process sharing the parent's temp directory"""
+    global _worker_extractor
+    # Page workers are already separate processes, so OCR runs inline in each
+    _worker_extractor = MathProblemOCRExtractor(temp_dir=tempfile.mkdtemp(dir=temp_dir),
+                                                ocr_pool=OCREnginePool(workers=0),
+                                                render_mode=render_mode,
+                                                two_pass=two_pass)
+
+def _page_text_worker(pdf_path, page_num):
+    """Render and OCR one page inside a worker process; problems are segmented by the parent"""
+    start = time.time()
+    text = _worker_extractor.page_text(pdf_path, page_num)
+    return page_num, text, time.time() - start
 
 class MathProblemOCRExtractor:
-    def __init__(self):
+    ZOOM = 2  # 2x zoom for better OCR
+
+    def __init__(self, temp_dir=None, ocr_pool=None, ocr_cache=None, render_mode=None, two_pass=False,
+                 journal=None, shard_edges=False):
         self.extracted_problems = []
-        self.temp_dir = tempfile.mkdtemp()
+        # 'rgb', 'gray' or 'bilevel' page images (see page_render)
+        self.render_mode = render_mode or DEFAULT_RENDER_MODE
+        self.temp_dir = temp_dir or tempfile.mkdtemp()
+        self.ocr_pool = ocr_pool or get_shared_pool()
+        self.ocr_cache = ocr_cache or get_shared_cache()
+        self.documents = get_document_cache()
+        # Low-zoom page pass plus high-zoom re-reads of low-confidence lines
+        self.reocr = SelectiveReOCR(self.ocr_pool, render_mode=self.render_mode) if two_pass else None
+        # Optional CheckpointJournal: finished pages are recorded and skipped on resume
+        self.journal = journal
+        # A shard run leaves the spans at the edges of its pages to the shard merge (see shard_results)
+        self.shard_edges = shard_edges
 
     def pdf_to_images(self, pdf_path, max_pages=10):
         """Convert PDF pages to images for OCR"""
         images = []
-        doc = fitz.open(pdf_path)
+        total_pages = self.documents.page_count(pdf_path)
 
         # Limit to first max_pages for testing
-        pages_to_process = min(len(doc), max_pages)
-        print(f"Processing first {pages_to_process} pages of {len(doc)} total pages")
+        pages_to_process = min(total_pages, max_pages)
+        print(f"Processing first {pages_to_process} pages of {total_pages} total pages")
 
         for page_num in range(pages_to_process):
-            page = doc[page_num]
-            # Convert page to image
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for better OCR
-            img_path = os.path.join(self.temp_dir, f"page_{page_num + 1}.png")
-            pix.save(img_path)
-            images.append(img_path)
+            images.append(self.render_page(pdf_path, page_num))
 
-        doc.close()
         return images
 
-    def ocr_image(self, image_path, lang='chi_sim+eng'):
-        """Perform OCR on an image"""
+    def render_page(self, pdf_path, page_num):
+        """Write a page image for OCR, using the embedded scan when the page is one"""
+        with self.documents.page(pdf_path, page_num) as page:
+            # Convert page to image
+            image, ext, method = page_image(page, self.ZOOM, self.render_mode)
+        img_path = os.path.join(self.temp_dir, f"page_{page_num + 1}.{ext}")
+        with open(img_path, 'wb') as f:
+            f.write(image)
+        return img_path
+
+    def ocr_image(self, image_path, lang='chi_sim+eng', cache_key=None):
+        """Perform OCR on an image, storing the result under cache_key if given"""
         try:
-            # Use Tesseract OCR
-            output_base = os.path.splitext(image_path)[0]
-            txt_path = f"{output_base}.txt"
-
-            cmd = [
-                'tesseract',
-                image_path,
-                output_base,
-                '-l', lang,
-                '--oem', '3',  # Use LSTM OCR engine
-                '--psm', '6'   # Assume uniform text block
-            ]
-
-            result = subprocess.run(cmd, capture_output=True, text=True)
-
-            if result.returncode == 0 and os.path.exists(txt_path):
-                with open(txt_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                # Clean up temp file
-                os.remove(txt_path)
-                return text
-            else:
-                print(f"OCR failed for {image_path}: {result.stderr}")
-                return ""
+            # LSTM OCR engine, assume uniform text block
+            text, words = self.ocr_pool.ocr(image_path, psm=6, lang=lang, oem=3, words=True)
+            if cache_key:
+                self.ocr_cache.put(cache_key, text, words=words)
+            return text
 
         except Exception as e:
             print(f"OCR error for {image_path}: {e}")
@@ -79,70 +109,41 @@ class MathProblemOCRExtractor:
         text = re.sub(r'(\d)\s*([＋+\-×÷])\s*(\d)', r'\1\2\3', text)  # Fix math expressions
         return text.strip()
 
-    def extract_math_problems(self, text, page_num, source_file):
-        """Extract math problems from OCR text"""
+    def extract_math_problems(self, text, page_num, source_file, first_number=1):
+        """Extract math problems from OCR text (numbered from first_number within the page)"""
         problems = []
-
-        # Common math problem patterns
-        problem_patterns = [
-            # Numbered problems
-            r'(\d+[\.、]\s*[^.\n]+(?:\n[^.\n]+)*?)',
-            # Chinese numbered problems
-            r'([①②③④⑤⑥⑦⑧⑨⑩]\s*[^①②③④⑤⑥⑦⑧⑨⑩\n]+(?:\n[^①②③④⑤⑥⑦⑧⑨⑩\n]+)*?)',
-            # Problems with "题" or "计算"
-            r'((?:题|计算|求|解)[^.\n]+(?:\n[^.\n]+)*?)',
-        ]
-
-        for pattern in problem_patterns:
-            matches = re.findall(pattern, text, re.MULTILINE)
-            for match in matches:
-                match = match.strip()
-                if len(match) > 15:  # Minimum length for a valid problem
-                    problem = {
-                        "id": f"{Path(source_file).stem}_{page_num}_{len(problems)+1}",
-                        "source": f"{source_file} (Page {page_num})",
-                        "stem": match,
-                        "taxonomy": "math",
-                        "steps": [],
-                        "transitions": [],
-                        "scoring": {"total": 5, "steps": []},
-                        "answer": "",
-                        "analysis": "",
-                        "knowledgePoints": self.extract_knowledge_points(match),
-                        "difficulty": self.estimate_difficulty(match),
-                        "type": self.classify_problem_type(match)
-                    }
-                    problems.append(problem)
+        source_stem = Path(source_file).stem
+
+        # One pass over the page cuts it into non-overlapping problems at their boundaries
+        for span in problem_spans(text):
+            stem, answer, analysis = span_parts(text, span)
+            if len(stem) <= 15:  # Minimum length for a valid problem
+                continue
+            # Text before the first numbered item only counts when it reads like a task
+            if span["kind"] == "text" and not re.search(r'题|计算|求|解', stem):
+                continue
+
+            problem = {
+                "id": f"{source_stem}_{page_num}_{first_number + len(problems)}",
+                "source": f"{source_file} (Page {page_num})",
+                "stem": stem,
+                "taxonomy": "math",
+                "steps": [],
+                "transitions": [],
+                "scoring": {"total": 5, "steps": []},
+                "answer": answer,
+                "analysis": analysis,
+                "knowledgePoints": self.extract_knowledge_points(stem),
+                "difficulty": self.estimate_difficulty(stem),
+                "type": self.classify_problem_type(stem)
+            }
+            problems.append(problem)
 
         return problems
 
     def extract_knowledge_points(self, text):
-        """Extract knowledge points from problem text"""
-        knowledge_points = []
-
-        # Common 4th grade math topics
-        topic_keywords = {
-            "加法": "加法运算",
-            "减法": "减法运算",
-            "乘法": "乘法运算",
-            "除法": "除法运算",
-            "分数": "分数",
-            "小数": "小数",
-            "面积": "面积计算",
-            "周长": "周长计算",
-            "体积": "体积计算",
-            "时间": "时间计算",
-            "应用题": "应用题",
-            "几何": "几何图形",
-            "平均数": "平均数",
-            "统计": "统计图表"
-        }
-
-        for keyword, point in topic_keywords.items():
-            if keyword in text:
-                knowledge_points.append(point)
-
-        return knowledge_points if knowledge_points else ["基础运算"]
+        """Extract knowledge points from problem text (common 4th grade math topics)"""
+        return keyword_labels(text, "knowledge.ocr") or ["基础运算"]
 
     def estimate_difficulty(self, text):
         """Estimate problem difficulty"""
@@ -155,50 +156,315 @@ class MathProblemOCRExtractor:
 
     def classify_problem_type(self, text):
         """Classify problem type"""
-        if "应用题" in text or "解决" in text:
-            return "word_problem"
-        elif "选择" in text:
-            return "multiple_choice"
-        elif "判断" in text:
-            return "true_false"
-        elif "填空" in text:
-            return "fill_in_blank"
+        return first_label(text, "type", "calculation")
+
+    def ocr_page(self, source_file, page_num, lang='chi_sim+eng'):
+        """OCR a single page, serving it from the OCR cache when possible"""
+        if self.reocr:
+            return self.ocr_page_two_pass(source_file, page_num, lang)
+
+        key = cache_key(source_file, page_num, self.ZOOM, lang, 6, 3, self.render_mode)
+        cached = self.ocr_cache.get(key)
+        if cached is not None:
+            return cached['text']
+
+        image_path = self.render_page(source_file, page_num)
+        try:
+            return self.ocr_image(image_path, lang=lang, cache_key=key)
+        finally:
+            # Clean up image file
+            if os.path.exists(image_path):
+                os.remove(image_path)
+
+    def ocr_page_two_pass(self, source_file, page_num, lang='chi_sim+eng'):
+        """OCR a page at low zoom, re-reading only its low-confidence lines at high zoom"""
+        key = cache_key(source_file, page_num, self.reocr.low_zoom, lang, 6, 3, self.reocr.cache_mode())
+        cached = self.ocr_cache.get(key)
+        if cached is not None:
+            return cached['text']
+
+        try:
+            text, words, stats = self.reocr.ocr_page(source_file, page_num, lang=lang, psm=6, oem=3)
+        except Exception as e:
+            print(f"OCR error for page {page_num + 1}: {e}")
+            return ""
+
+        self.reocr.report(page_num + 1, stats)
+        self.ocr_cache.put(key, text, words=words)
+        return text
+
+    def page_text(self, source_file, page_num):
+        """Render and OCR a single page; returns its cleaned text"""
+        return self.clean_ocr_text(self.ocr_page(source_file, page_num))
+
+    def finish_held_span(self, stitcher, holder, page_counts, pdf_path):
+        """Problems of the span still held, on their own
+
+        holder is (page number, problems) of the page the span was journaled
+        with; that page is journaled again with them added and nothing held.
+        """
+        held = stitcher.flush()
+        if not held:
+            return []
+        page, text = held
+        held_problems = self.extract_math_problems(text, page, pdf_path, page_counts.get(page, 0) + 1)
+        if self.journal:
+            self.journal.record(pdf_path, holder[0], holder[1] + held_problems)
+        return held_problems
+
+    def numbered_problems(self, pdf_path, page, finished):
+        """Problems an earlier run numbered for a page, wherever they were journaled"""
+        source = f"{pdf_path} (Page {page})"
+        return sum(1 for page_problems in finished.values() for problem in page_problems
+                   if problem["source"] == source)
+
+    def segment_span(self, pdf_path, page, text, page_problems):
+        """Problems of a span cut at a shard edge, numbered after the page's problems (for merge_shards)"""
+        first_number = self.numbered_problems(pdf_path, page, {page: page_problems}) + 1
+        return self.extract_math_problems(text, page, pdf_path, first_number)
+
+    def segment_pages(self, pdf_path, page_indexes, page_texts):
+        """Stitch, segment and journal pages in page order; returns all their problems
+
+        page_texts yields (page index, cleaned text) in page order for the
+        pages of page_indexes not finished in an earlier run, leaving out
+        pages that failed; finished pages are replayed from the journal in
+        between. Segmenting here, in page order, lets a problem cut by a page
+        break be joined with the top of the next page.
+        """
+        finished = self.journal.finished(pdf_path) if self.journal else {}
+        stitcher = PageStitcher(lexer_markers())
+        if self.shard_edges and page_indexes:
+            stitcher.lead_page = page_indexes[0] + 1
+        page_counts = {}
+        # (page number, journaled problems, restored from the journal) of the page the held span was journaled with
+        holder = None
+        all_problems = []
+
+        def in_page_order():
+            replayed = [page_num for page_num in page_indexes if page_num + 1 in finished]
+            for page_num, text in page_texts:
+                while replayed and replayed[0] < page_num:
+                    yield replayed.pop(0), None
+                yield page_num, text
+            for page_num in replayed:
+                yield page_num, None
+
+        for page_num, text in in_page_order():
+            if text is None:
+                # A span held from a page read in this run was never joined with this page, so it is
+                # finished on its own; one restored from the journal already is part of this page
+                if holder and not holder[2]:
+                    all_problems.extend(self.finish_held_span(stitcher, holder, page_counts, pdf_path))
+                all_problems.extend(finished[page_num + 1])
+                # The span the earlier run held back after this page carries on to the next page read
+                stitcher.held = self.journal.held(pdf_path, page_num + 1)
+                if stitcher.held:
+                    held_page = stitcher.held[0]
+                    page_counts[held_page] = self.numbered_problems(pdf_path, held_page, finished)
+                holder = (page_num + 1, finished[page_num + 1], True)
+                print(f"Page {page_num + 1} finished in an earlier run")
+                continue
+
+            page_problems = []
+            carried, text = stitcher.feed(page_num + 1, text)
+            if carried:
+                # The previous page's last problem, reported on the page it starts on
+                page, carried_text = carried
+                page_problems = self.extract_math_problems(carried_text, page, pdf_path,
+                                                           page_counts.get(page, 0) + 1)
+            own_problems = self.extract_math_problems(text, page_num + 1, pdf_path)
+            page_counts[page_num + 1] = len(own_problems)
+            page_problems += own_problems
+            all_problems.extend(page_problems)
+            print(f"Found {len(page_problems)} problems on page {page_num + 1}")
+
+            # The held span is journaled with the page, so a resumed run can still join it with the next one
+            if self.journal:
+                self.journal.record(pdf_path, page_num + 1, page_problems, held=stitcher.held,
+                                    lead=stitcher.pop_lead())
+            holder = (page_num + 1, page_problems, False)
+
+        if holder and not self.shard_edges:
+            all_problems.extend(self.finish_held_span(stitcher, holder, page_counts, pdf_path))
+        return all_problems
+
+    def page_indexes(self, pdf_path, max_pages=10, pages=None, workers_note=""):
+        """Page indexes to process, in page order: an explicit list (e.g. one shard's pages) or the first max_pages"""
+        total_pages = self.documents.page_count(pdf_path)
+        if pages is not None:
+            page_indexes = sorted(page_num for page_num in pages if 0 <= page_num < total_pages)
+            print(f"Processing {len(page_indexes)} selected pages of {total_pages} total pages{workers_note}")
         else:
-            return "calculation"
+            page_indexes = list(range(min(total_pages, max_pages)))
+            print(f"Processing first {len(page_indexes)} pages of {total_pages} total pages{workers_note}")
+        return page_indexes
 
-    def process_pdf(self, pdf_path, max_pages=10):
-        """Process a PDF file with OCR"""
+    def process_pdf(self, pdf_path, max_pages=10, workers=1, pages=None):
+        """Process a PDF file with OCR (an explicit page index list overrides max_pages)"""
         print(f"Processing PDF: {pdf_path}")
 
         if not os.path.exists(pdf_path):
             print(f"File not found: {pdf_path}")
             return []
 
-        # Convert PDF to images
-        images = self.pdf_to_images(pdf_path, max_pages)
-        all_problems = []
+        if workers and workers > 1:
+            return self.process_pdf_parallel(pdf_path, max_pages, workers, pages)
 
-        for i, image_path in enumerate(images):
-            print(f"OCR processing page {i+1}/{len(images)}...")
+        start = time.time()
 
-            # Perform OCR
-            text = self.ocr_image(image_path)
-            text = self.clean_ocr_text(text)
+        page_indexes = self.page_indexes(pdf_path, max_pages, pages)
+        finished = self.journal.finished(pdf_path) if self.journal else {}
 
-            if text:
-                # Extract problems from OCR text
-                problems = self.extract_math_problems(text, i+1, pdf_path)
-                all_problems.extend(problems)
-                print(f"Found {len(problems)} problems on page {i+1}")
-            else:
-                print(f"No text extracted from page {i+1}")
+        def page_texts():
+            for i in page_indexes:
+                if i + 1 in finished:
+                    continue
+                print(f"OCR processing page {i+1}...")
 
-            # Clean up image file
-            if os.path.exists(image_path):
-                os.remove(image_path)
+                # Perform OCR (rendering only pages missing from the cache)
+                text = self.clean_ocr_text(self.ocr_page(pdf_path, i))
+                if not text:
+                    print(f"No text extracted from page {i+1}")
+                yield i, text
+
+        all_problems = self.segment_pages(pdf_path, page_indexes, page_texts())
+
+        self.report_throughput(len(page_indexes), time.time() - start)
+        return all_problems
+
+    def process_pdf_parallel(self, pdf_path, max_pages=10, workers=None, pages=None):
+        """Process PDF pages across a process pool, keeping page order
+
+        Workers render and OCR pages in any order; their texts are segmented
+        here as soon as every page before them is in, so problems, IDs and
+        stitching match a sequential run.
+        """
+        workers = workers or os.cpu_count() or 1
+        page_indexes = self.page_indexes(pdf_path, max_pages, pages, f" with {workers} workers")
+
+        start = time.time()
+        finished = self.journal.finished(pdf_path) if self.journal else {}
+        # Pages finished in an earlier run are replayed without being resubmitted
+        todo = [page_num for page_num in page_indexes if page_num + 1 not in finished]
+
+        def page_texts():
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_page_worker,
+                                     initargs=(self.temp_dir, self.render_mode,
+                                               self.reocr is not None)) as executor:
+                futures = {executor.submit(_page_text_worker, pdf_path, page_num): page_num for page_num in todo}
+                texts = {}
+                next_page = 0
+
+                for future in as_completed(futures):
+                    try:
+                        page_num, text, elapsed = future.result()
+                        print(f"Read page {page_num + 1} ({elapsed:.1f}s)")
+                    except Exception as e:
+                        print(f"Page worker failed: {e}")
+                        page_num, text = futures[future], None
+                    texts[page_num] = text
+
+                    # Hand on every page whose predecessors are all in; failed pages are left out
+                    while next_page < len(todo) and todo[next_page] in texts:
+                        text = texts.pop(todo[next_page])
+                        if text is not None:
+                            yield todo[next_page], text
+                        next_page += 1
+
+        all_problems = self.segment_pages(pdf_path, page_indexes, page_texts())
+
+        self.report_throughput(len(page_indexes), time.time() - start)
+        return all_problems
+
+    def process_pdf_pipelined(self, pdf_path, max_pages=10, stage_workers=None, queue_size=4, pages=None):
+        """Process PDF pages through render -> preprocess -> OCR stages, then segment them
 
+        Stages run concurrently on different pages, joined by bounded queues
+        (see page_pipeline). Rendering holds the document lock; NumPy
+        preprocessing of clean-mode pages runs after it is released. Results
+        come out in page order and are segmented as they do, so a problem
+        cut by a page break is joined with the top of the next page.
+        """
+        print(f"Processing PDF: {pdf_path}")
+        if not os.path.exists(pdf_path):
+            print(f"File not found: {pdf_path}")
+            return []
+
+        lang = 'chi_sim+eng'
+        zoom = self.ZOOM
+        workers = {"render": 1, "preprocess": 2, "ocr": self.ocr_pool.workers or 1}
+        workers.update(stage_workers or {})
+
+        page_indexes = self.page_indexes(pdf_path, max_pages, pages, " through the pipeline (" +
+                                         ', '.join(f'{name} x{count}' for name, count in workers.items()) + ")")
+        finished = self.journal.finished(pdf_path) if self.journal else {}
+
+        def render(page_num):
+            job = {"page": page_num, "key": cache_key(pdf_path, page_num, zoom, lang, 6, 3, self.render_mode)}
+            if self.reocr:
+                return job  # Two-pass OCR renders its own low- and high-zoom images
+            cached = self.ocr_cache.get(job["key"])
+            if cached is not None:
+                job["text"] = cached['text']
+                return job
+
+            with self.documents.page(pdf_path, page_num) as page:
+                scan = embedded_scan_image(page, mode=self.render_mode)
+                if scan is not None:
+                    job["image"] = scan[0]
+                else:
+                    pix = render_pixmap(page, zoom, self.render_mode)
+                    if self.render_mode == 'clean' and NUMPY_AVAILABLE:
+                        job["pixmap"] = pix
+                    else:
+                        job["image"] = encode_pixmap(pix, self.render_mode, dpi=72 * zoom)[0]
+            return job
+
+        def preprocess(job):
+            pix = job.pop("pixmap", None)
+            if pix is not None:
+                job["image"] = preprocess_pixmap(pix, dpi=72 * zoom)[0]
+            return job
+
+        def ocr(job):
+            if "text" in job:
+                return job
+            if self.reocr:
+                job["text"] = self.ocr_page_two_pass(pdf_path, job["page"], lang)
+                return job
+            text, words = self.ocr_pool.ocr(job.pop("image"), psm=6, lang=lang, oem=3, words=True)
+            self.ocr_cache.put(job["key"], text, words=words)
+            job["text"] = text
+            return job
+
+        pipeline = PagePipeline([Stage("render", render, workers["render"]),
+                                 Stage("preprocess", preprocess, workers["preprocess"]),
+                                 Stage("ocr", ocr, workers["ocr"])],
+                                queue_size=queue_size)
+
+        start = time.time()
+        todo = [page_num for page_num in page_indexes if page_num + 1 not in finished]
+
+        def page_texts():
+            # Sink: pipeline results come out in input order, one per page
+            for page_num, job in zip(todo, pipeline.run(todo)):
+                if job is None:
+                    print(f"Page {page_num + 1} failed")
+                    continue
+                yield page_num, self.clean_ocr_text(job["text"])
+
+        all_problems = self.segment_pages(pdf_path, page_indexes, page_texts())
+
+        self.report_throughput(len(page_indexes), time.time() - start)
         return all_problems
 
+    def report_throughput(self, page_count, elapsed):
+        """Print pages/second for a processing run"""
+        rate = page_count / elapsed if elapsed > 0 else 0.0
+        print(f"Processed {page_count} pages in {elapsed:.1f}s ({rate:.2f} pages/sec)")
+
     def cleanup(self):
         """Clean up temporary files"""
         if os.path.exists(self.temp_dir):
@@ -211,17 +477,56 @@ def main():
         "/Users/tywg001/Downloads/mathlearning/aoshu/学霸提优大试卷四年级上册数学人教版.pdf"
     ]
 
-    extractor = MathProblemOCRExtractor()
+    # Number of OCR worker processes (1 = sequential)
+    workers = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+    # OCR_TWO_PASS=1 reads pages at low zoom and re-reads only unsure lines at high zoom
+    two_pass = os.environ.get("OCR_TWO_PASS") == "1"
+    # OCR_PIPELINE=1 overlaps render, preprocess and OCR across pages;
+    # OCR_STAGE_WORKERS sets threads per stage, e.g. "render=1,preprocess=2,ocr=4"
+    pipeline = os.environ.get("OCR_PIPELINE") == "1"
+    stage_workers = parse_stage_workers(os.environ.get("OCR_STAGE_WORKERS"),
+                                        {"render": 1, "preprocess": 2, "ocr": workers})
+
+    parser = argparse.ArgumentParser(description="Extract math problems from scanned PDFs with OCR")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip pages an interrupted run already finished (from its checkpoint journal)")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
+
+    output_file = "/Users/tywg001/Downloads/mathlearning/extracted_problems_ocr.json"
+    run_file = shard_path(output_file, args.shard) if args.shard else output_file
+    journal = None if args.merge else CheckpointJournal(default_journal_path(run_file), resume=args.resume)
+    extractor = MathProblemOCRExtractor(two_pass=two_pass, journal=journal, shard_edges=bool(args.shard))
     all_problems = []
+    assigned = {}
 
     try:
-        for pdf_file in pdf_files:
-            problems = extractor.process_pdf(pdf_file, max_pages=5)  # Process first 5 pages for testing
-            all_problems.extend(problems)
-            print(f"Extracted {len(problems)} problems from {Path(pdf_file).name}")
+        if args.merge:
+            try:
+                all_problems = merge_shards(output_file, extractor.segment_span)
+            except ValueError as e:
+                print(f"Cannot merge shards: {e}")
+                return
+        else:
+            for pdf_file in pdf_files:
+                pages = []
+                if os.path.exists(pdf_file):
+                    # Process first 5 pages for testing
+                    pages = shard_pages(range(min(extractor.documents.page_count(pdf_file), 5)), args.shard)
+                assigned[pdf_file] = [page_num + 1 for page_num in pages]
+
+                if pipeline:
+                    problems = extractor.process_pdf_pipelined(pdf_file, stage_workers=stage_workers, pages=pages)
+                else:
+                    problems = extractor.process_pdf(pdf_file, workers=workers, pages=pages)
+                all_problems.extend(problems)
+                print(f"Extracted {len(problems)} problems from {Path(pdf_file).name}")
+
+            if args.shard:
+                write_shard(output_file, args.shard, assigned, journal)
+                return
 
         # Save results
-        output_file = "/Users/tywg001/Downloads/mathlearning/extracted_problems_ocr.json"
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(all_problems, f, ensure_ascii=False, indent=2)
 
@@ -243,6 +548,8 @@ def main():
             print(f"\n... and {len(all_problems) - 5} more problems")
 
     finally:
+        if journal:
+            journal.close()
         extractor.cleanup()
 
 if __name__ == "__main__":
@@ -7,7 +7,6 @@ Extracts math problems from PDF files for math learning system
 import os
 import sys
 import json
-import re
 from pathlib import Path
 
 # Try to import the PDF libraries
@@ -18,6 +17,10 @@ except ImportError as e:
     print(f"Error importing PDF libraries: {e}")
     sys.exit(1)
 
+from page_stream import iter_backend_pages
+from page_stitcher import section_markers, stitch_pages
+from problem_patterns import collapse_whitespace, is_math_problem, labelled_value, split_sections, starts_with_part
+
 class MathProblemExtractor:
     def __init__(self):
         self.extracted_problems = []
@@ -26,31 +29,14 @@ class MathProblemExtractor:
     def clean_text(self, text):
         """Clean extracted text"""
         # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = collapse_whitespace(text)
         # Remove empty lines
         lines = [line.strip() for line in text.split('\n') if line.strip()]
         return '\n'.join(lines)
 
     def is_math_problem(self, text):
         """Check if text looks like a math problem"""
-        # Look for common math problem indicators
-        math_indicators = [
-            r'\d+\s*[＋+\-×÷]\s*\d+',  # Basic operations
-            r'解.*?题',  # Solve problem
-            r'计算.*?式',  # Calculate expression
-            r'求.*?值',  # Find value
-            r'应用题',  # Word problem
-            r'选择题',  # Multiple choice
-            r'填空题',  # Fill in blank
-            r'判断题',  # True/False
-            r'[①②③④⑤⑥⑦⑧⑨⑩]',  # Problem numbers
-            r'[1-9]\.\s*',  # Numbered problems
-        ]
-
-        for pattern in math_indicators:
-            if re.search(pattern, text):
-                return True
-        return False
+        return is_math_problem(text)
 
     def extract_problem_structure(self, text):
         """Extract structured problem from text"""
@@ -75,21 +61,17 @@ class MathProblemExtractor:
         for line in lines:
             if line.strip():
                 # Stop at answer indicators
-                if re.match(r'答案|答|解|解析', line):
+                if starts_with_part(line):
                     break
                 stem_lines.append(line)
 
         problem["stem"] = '\n'.join(stem_lines).strip()
 
         # Extract answer if present
-        answer_match = re.search(r'答案[:：]\s*(.*?)(?:\n|$)', text)
-        if answer_match:
-            problem["answer"] = answer_match.group(1).strip()
+        problem["answer"] = labelled_value("answer", text)
 
         # Extract analysis if present
-        analysis_match = re.search(r'解析[:：]\s*(.*?)(?:\n|$)', text)
-        if analysis_match:
-            problem["analysis"] = analysis_match.group(1).strip()
+        problem["analysis"] = labelled_value("analysis", text)
 
         # Determine difficulty based on content
         if len(problem["stem"]) > 200:
@@ -99,50 +81,33 @@ class MathProblemExtractor:
 
         return problem
 
-    def extract_from_pdf(self, pdf_path):
-        """Extract math problems from a PDF file"""
-        print(f"Processing PDF: {pdf_path}")
-
-        try:
-            # Try PyMuPDF first (better for Chinese text)
-            doc = fitz.open(pdf_path)
-            text_content = ""
-
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                text = page.get_text()
-                text_content += f"\n--- Page {page_num + 1} ---\n{text}"
+    def iter_pages(self, pdf_path):
+        """Stream page records, retrying a page PyMuPDF fails on with PyPDF2 (see page_stream)"""
+        backend_pages = {}
 
-            doc.close()
+        for record in iter_backend_pages(pdf_path):
+            backend_pages[record["method"]] = backend_pages.get(record["method"], 0) + 1
+            yield record
 
-        except Exception as e:
-            print(f"Error with PyMuPDF, trying PyPDF2: {e}")
+        print("Pages per backend: " + ", ".join(f"{method} {count}" for method, count in backend_pages.items()))
 
-            # Fallback to PyPDF2
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text_content = ""
-
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text = page.extract_text()
-                    text_content += f"\n--- Page {page_num + 1} ---\n{text}"
+    def extract_from_pdf(self, pdf_path):
+        """Extract math problems from a PDF file"""
+        print(f"Processing PDF: {pdf_path}")
 
-        # Process extracted text
-        return self.process_text_content(text_content, pdf_path)
+        # Pages are extracted and segmented one at a time
+        return self.process_pages(self.iter_pages(pdf_path), pdf_path)
 
-    def process_text_content(self, text_content, source_file):
-        """Process extracted text to find math problems"""
+    def process_pages(self, pages, source_file):
+        """Find math problems in a stream of page records"""
         problems = []
 
-        # Split by pages
-        pages = text_content.split('--- Page')
-
-        for i, page_content in enumerate(pages[1:], 1):  # Skip first empty split
-            page_text = self.clean_text(page_content)
-
+        # A problem cut by a page break is held back and joined with the top of the next page
+        cleaned_pages = ((record["page"], self.clean_text(record["text"])) for record in pages)
+        for i, page_text in stitch_pages(cleaned_pages, section_markers()):
             # Split into potential problems
             # Look for problem number patterns
-            problem_sections = re.split(r'(?:[①②③④⑤⑥⑦⑧⑨⑩]|[1-9]+[\.、])', page_text)
+            problem_sections = split_sections(page_text)
 
             for section in problem_sections:
                 section = section.strip()
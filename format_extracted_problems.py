@@ -6,6 +6,7 @@ Format and clean extracted problems to match system structure
 import json
 import re
 from pathlib import Path
+from keyword_automaton import first_label, keyword_labels
 
 def clean_problem_text(text):
     """Clean and format problem text"""
@@ -34,47 +35,25 @@ def format_problem_structure(problem):
     # Clean the stem
     stem = clean_problem_text(problem.get('stem', ''))
 
-    # Determine problem type based on content
-    taxonomy = "数学应用题"
-    if any(keyword in stem for keyword in ["计算", "算式", "×", "÷"]):
-        taxonomy = "计算题"
-    elif any(keyword in stem for keyword in ["选择", "判断"]):
-        taxonomy = "选择题"
-    elif any(keyword in stem for keyword in ["应用", "实际", "生活"]):
-        taxonomy = "应用题"
-    elif "填空" in stem:
-        taxonomy = "填空题"
+    # Determine problem type based on content (all keyword tables are read from one scan of the stem)
+    taxonomy = first_label(stem, "format.taxonomy", "数学应用题")
 
     # Enhanced knowledge points
-    knowledge_points = ["数学思维训练"]
-    if any(keyword in stem for keyword in ["加法", "减法", "加", "减"]):
-        knowledge_points.append("加减运算")
-    if any(keyword in stem for keyword in ["乘法", "除法", "×", "÷"]):
-        knowledge_points.append("乘除运算")
-    if any(keyword in stem for keyword in ["面积", "周长", "图形", "几何"]):
-        knowledge_points.append("几何图形")
-    if any(keyword in stem for keyword in ["时间", "分钟", "小时", "秒"]):
-        knowledge_points.append("时间问题")
-    if any(keyword in stem for keyword in ["千克", "克", "米", "厘米", "长度", "重量"]):
-        knowledge_points.append("计量单位")
-    if any(keyword in stem for keyword in ["计算器", "计算"]):
-        knowledge_points.append("计算工具使用")
-    if any(keyword in stem for keyword in ["规律", "模式", "序列"]):
-        knowledge_points.append("规律探索")
+    knowledge_points = ["数学思维训练"] + keyword_labels(stem, "format.knowledge")
 
     # Determine difficulty based on content complexity
     difficulty = "medium"
     stem_length = len(stem)
-    if stem_length > 200 or any(keyword in stem for keyword in ["亿", "万", "规律", "模式"]):
+    if stem_length > 200 or keyword_labels(stem, "format.hard"):
         difficulty = "hard"
-    elif stem_length < 50 or all(keyword not in stem for keyword in ["应用", "计算", "选择"]):
+    elif stem_length < 50 or not keyword_labels(stem, "format.core"):
         difficulty = "easy"
 
     # Create steps based on problem type
-    steps = []
-    if "计算" in stem:
+    step_kind = first_label(stem, "format.steps", None)
+    if step_kind == "calculation":
         steps = ["理解计算要求", "确定计算方法", "进行计算", "检查计算结果"]
-    elif "应用" in stem or "实际" in stem:
+    elif step_kind == "application":
         steps = ["理解应用场景", "分析已知条件", "建立数学模型", "进行计算求解", "验证答案合理性"]
     else:
         steps = ["理解题目要求", "分析已知条件", "选择解题方法", "进行计算求解", "验证答案合理性"]
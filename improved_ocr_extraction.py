@@ -8,99 +8,393 @@ import os
 import sys
 import json
 import re
-import tempfile
-import subprocess
+import queue
+import threading
+import argparse
+from concurrent.futures import Future, InvalidStateError, as_completed
 from pathlib import Path
 from PIL import Image
 import fitz  # PyMuPDF
+from ocr_engine import get_shared_pool
+from ocr_cache import cache_key, get_shared_cache
+from page_triage import PageTriage
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE, embedded_scan_xref, page_image
+from selective_reocr import SelectiveReOCR
+from page_layout import PageLayout
+from checkpoint_journal import CheckpointJournal, default_journal_path
+from shard_results import add_shard_arguments, merge_shards, shard_pages, shard_path, write_shard
+from keyword_automaton import first_label, keyword_labels
+from problem_patterns import is_math_section
+from page_stitcher import PageStitcher
+
+# Where extract_structured_problems starts a new problem; also where pages are cut for stitching
+PROBLEM_SEPARATORS = re.compile(r'(?:\d+[\.、]|[①②③④⑤⑥⑦⑧⑨⑩]|练习|习题|测试)\s*')
+
+def cleaned_offsets(raw, clean):
+    """Offset in raw of each character of clean
+
+    Cleaning only drops characters and turns whitespace runs into single
+    spaces, so clean is matched against raw in one forward pass.
+    """
+    offsets = []
+    position = 0
+    for char in clean:
+        while position < len(raw) and raw[position] != char and not (char == ' ' and raw[position].isspace()):
+            position += 1
+        offsets.append(min(position, len(raw) - 1))
+        position += 1
+    return offsets
 
 class ImprovedMathProblemExtractor:
-    def __init__(self):
-        self.extracted_problems = []
-        self.temp_dir = tempfile.mkdtemp()
-
-    def pdf_to_high_quality_images(self, pdf_path, start_page=0, max_pages=20):
-        """Convert PDF pages to high quality images for better OCR"""
-        images = []
-        doc = fitz.open(pdf_path)
-
-        # Process pages from start_page
-        end_page = min(len(doc), start_page + max_pages)
-        print(f"Processing pages {start_page+1} to {end_page} of {len(doc)} total pages")
-
-        for page_num in range(start_page, end_page):
-            page = doc[page_num]
-            # Higher resolution for better OCR
-            pix = page.get_pixmap(matrix=fitz.Matrix(3, 3))  # 3x zoom
-            img_path = os.path.join(self.temp_dir, f"page_{page_num + 1}.png")
-            pix.save(img_path)
-            images.append((page_num + 1, img_path))
-
-        doc.close()
-        return images
-
-    def ocr_with_multiple_configs(self, image_path):
-        """Try multiple OCR configurations for best results"""
-        best_text = ""
-        best_score = 0
+    ZOOM = 3  # Higher resolution for better OCR
+
+    OCR_CONFIGS = [
+        # Config 1: Standard Chinese math text
+        {
+            'lang': 'chi_sim+eng',
+            'psm': 6,  # Assume uniform text block
+            'oem': 3   # Default LSTM OCR engine
+        },
+        # Config 2: Single column text
+        {
+            'lang': 'chi_sim+eng',
+            'psm': 4,  # Single column text
+            'oem': 3
+        },
+        # Config 3: Sparse text
+        {
+            'lang': 'chi_sim+eng',
+            'psm': 11, # Sparse text
+            'oem': 3
+        }
+    ]
 
-        configs = [
-            # Config 1: Standard Chinese math text
-            {
-                'lang': 'chi_sim+eng',
-                'psm': 6,  # Assume uniform text block
-                'oem': 3   # Default LSTM OCR engine
-            },
-            # Config 2: Single column text
-            {
-                'lang': 'chi_sim+eng',
-                'psm': 4,  # Single column text
-                'oem': 3
-            },
-            # Config 3: Sparse text
-            {
-                'lang': 'chi_sim+eng',
-                'psm': 11, # Sparse text
-                'oem': 3
-            }
-        ]
+    # Words tesseract is less sure of than this are noise (speckles, picture fragments)
+    MIN_WORD_CONFIDENCE = 10
 
-        for config in configs:
+    def __init__(self, ocr_pool=None, ocr_cache=None, parallel_configs=False, score_threshold=200,
+                 render_mode=None, two_pass=False, layout=False, journal=None, shard_edges=False):
+        self.extracted_problems = []
+        # 'rgb', 'gray' or 'bilevel' page images (see page_render)
+        self.render_mode = render_mode or DEFAULT_RENDER_MODE
+        self.ocr_pool = ocr_pool or get_shared_pool()
+        self.ocr_cache = ocr_cache or get_shared_cache()
+        self.documents = get_document_cache()
+        # Run OCR configs concurrently and stop at the first one scoring >= score_threshold
+        self.parallel_configs = parallel_configs
+        self.score_threshold = score_threshold
+        # Per-document count of pages each config won, used to order configs
+        self.config_wins = {}
+        # Two-pass mode: configs compete on a low-zoom render, then only the
+        # winner's low-confidence lines are re-read at high zoom
+        self.reocr = None
+        if two_pass:
+            self.reocr = SelectiveReOCR(self.ocr_pool, high_zoom=self.ZOOM, render_mode=self.render_mode)
+            self.ZOOM = self.reocr.low_zoom
+        # Layout mode: each column/region is OCR'd separately and stitched in reading order
+        self.layout = PageLayout() if layout else None
+        # Optional CheckpointJournal: finished pages are recorded and skipped on resume
+        self.journal = journal
+        # A shard run leaves the spans at the edges of its pages to the shard merge (see shard_results)
+        self.shard_edges = shard_edges
+
+    def page_order(self, pdf_path, start_page=0, max_pages=20, page_indexes=None):
+        """Page indexes to process: an explicit list (e.g. from page triage) or a range"""
+        total_pages = self.documents.page_count(pdf_path)
+
+        if page_indexes is not None:
+            page_order = [page_num for page_num in page_indexes if 0 <= page_num < total_pages]
+            print(f"Processing {len(page_order)} selected pages of {total_pages} total pages")
+        else:
+            # Process pages from start_page
+            end_page = min(total_pages, start_page + max_pages)
+            page_order = range(start_page, end_page)
+            print(f"Processing pages {start_page+1} to {end_page} of {total_pages} total pages")
+
+        return page_order
+
+    def stream_page_images(self, pdf_path, start_page=0, max_pages=20, max_buffered=2, lookup=None,
+                           page_indexes=None):
+        """Render PDF pages in memory and yield (page_num, image_bytes, cached) one at a time
+
+        A background thread renders ahead of the consumer, holding at most
+        max_buffered pages in memory; nothing is written to disk. Single-image
+        scanned pages hand over the embedded scan at native resolution.
+        lookup(page_index), when given, returns (cached, skip): cached is
+        yielded with the page, which is not rendered (image None) when skip
+        is true. An explicit page_indexes list (e.g. from page triage)
+        overrides the range.
+        """
+        page_order = self.page_order(pdf_path, start_page, max_pages, page_indexes)
+
+        pages = queue.Queue(maxsize=max(1, max_buffered))
+        stop = threading.Event()
+        done = object()
+
+        def render():
             try:
-                output_base = os.path.splitext(image_path)[0]
-                txt_path = f"{output_base}_config{configs.index(config)}.txt"
-
-                cmd = [
-                    'tesseract',
-                    image_path,
-                    output_base,
-                    '-l', config['lang'],
-                    '--oem', str(config['oem']),
-                    '--psm', str(config['psm'])
-                ]
+                for page_num in page_order:
+                    if stop.is_set():
+                        break
+                    cached, skip = lookup(page_num) if lookup else (None, False)
+                    if skip:
+                        item = (page_num + 1, None, cached)
+                    else:
+                        # The document handle is shared, so hold it only while rendering
+                        with self.documents.page(pdf_path, page_num) as page:
+                            image, ext, method = page_image(page, self.ZOOM, self.render_mode)
+                        item = (page_num + 1, image, cached)
+                        del image
+                    while not stop.is_set():
+                        try:
+                            pages.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+            except Exception as e:
+                print(f"Render error for {pdf_path}: {e}")
+            finally:
+                while not stop.is_set():
+                    try:
+                        pages.put(done, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+        renderer = threading.Thread(target=render, daemon=True)
+        renderer.start()
+
+        try:
+            while True:
+                item = pages.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            stop.set()
+            renderer.join()
+
+    def is_embedded_scan(self, pdf_path, page_index):
+        """True when a page is OCR'd from its embedded scan rather than rendered at ZOOM"""
+        with self.documents.page(pdf_path, page_index) as page:
+            return embedded_scan_xref(page) is not None
+
+    def config_cache_key(self, config, doc_key=None, page_index=None):
+        """Cache key for one config on one page, or None when the page is unknown"""
+        if doc_key is None or page_index is None:
+            return None
+        return cache_key(doc_key, page_index, self.ZOOM, config['lang'], config['psm'], config['oem'],
+                         self.render_mode)
+
+    def submit_config(self, image, config, key=None):
+        """Submit one OCR config to the shared pool, answering from the cache when possible
+
+        Returns a Future resolving to (text, OCRWords); fresh results are
+        cached under key.
+        """
+        result = Future()
+        cached = self.ocr_cache.get(key) if key else None
+        if cached is not None and cached['words'] is not None:
+            result.set_result((cached['text'], cached['words']))
+            return result
+        if image is None:
+            # The page was skipped on an earlier cache lookup; never hand the pool a missing image
+            result.set_exception(ValueError("page image was not rendered"))
+            return result
+
+        inner = self.ocr_pool.submit(image, psm=config['psm'], lang=config['lang'],
+                                     oem=config['oem'], words=True)
+
+        def on_done(future):
+            if future.cancelled():
+                return
+            try:
+                text, words = future.result()
+                if key:
+                    self.ocr_cache.put(key, text, words=words)
+                result.set_result((text, words))
+            except InvalidStateError:
+                pass  # Caller already cancelled this config
+            except Exception as e:
+                try:
+                    result.set_exception(e)
+                except InvalidStateError:
+                    pass
+
+        inner.add_done_callback(on_done)
+        result.add_done_callback(lambda r: inner.cancel() if r.cancelled() else None)
+        return result
+
+    def run_tesseract(self, image, config, key=None):
+        """OCR in-memory image bytes with one config on the shared engine pool
+
+        Returns (text, OCRWords).
+        """
+        return self.submit_config(image, config, key).result()
+
+    def two_pass_cache_key(self, pdf_path, page_index, method):
+        """Cache key for a page's refined two-pass result; method is 'configs' or 'layout'"""
+        return cache_key(pdf_path, page_index, self.ZOOM, 'chi_sim+eng', 6, 3, f"{self.reocr.cache_mode()}+{method}")
+
+    def cached_two_pass(self, pdf_path, page_index, method):
+        """(text, OCRWords) of a page already refined in an earlier run, else None"""
+        if not self.reocr:
+            return None
+        cached = self.ocr_cache.get(self.two_pass_cache_key(pdf_path, page_index, method))
+        if cached is None or cached['words'] is None:
+            return None
+        return cached['text'], cached['words']
+
+    def refine_page(self, pdf_path, page_num, text, words, method):
+        """Re-read a page's low-confidence lines at high zoom and cache the merged words"""
+        words, stats = self.reocr.refine(pdf_path, page_num - 1, words, self.ZOOM)
+        stats["method"] = "rendered"
+        self.reocr.report(page_num, stats)
+        self.ocr_cache.put(self.two_pass_cache_key(pdf_path, page_num - 1, method), text, words=words)
+        return words
+
+    def cached_configs(self, doc_key, page_index):
+        """{config index: (text, OCRWords)} for the configs the cache answers on a page, one get() each"""
+        cached = {}
+        for index, config in enumerate(self.OCR_CONFIGS):
+            key = self.config_cache_key(config, doc_key, page_index)
+            entry = self.ocr_cache.get(key) if key else None
+            if entry is not None and entry['words'] is not None:
+                cached[index] = (entry['text'], entry['words'])
+        return cached
+
+    def cache_settles(self, cached):
+        """Whether cached config results decide a page without OCR
+
+        That is every config, or with early exit one config that already
+        passes the score threshold (the others were cancelled when it won).
+        """
+        if len(cached) == len(self.OCR_CONFIGS):
+            return True
+        return self.parallel_configs and any(text and self.score_ocr_words(words) >= self.score_threshold
+                                             for text, words in cached.values())
+
+    def score_ocr_words(self, words):
+        """Score an OCR result by its confidence-weighted character count"""
+        return words.confident_chars()
+
+    def ordered_configs(self, doc_key):
+        """Return config indexes, previously winning configs for this document first"""
+        wins = self.config_wins.get(doc_key, {})
+        return sorted(range(len(self.OCR_CONFIGS)), key=lambda i: -wins.get(i, 0))
+
+    def record_config_win(self, doc_key, index):
+        """Remember which config produced the best text on a page"""
+        wins = self.config_wins.setdefault(doc_key, {})
+        wins[index] = wins.get(index, 0) + 1
+
+    def ocr_with_multiple_configs(self, image, doc_key=None, page_index=None, cached=None):
+        """Try multiple OCR configurations for best results
+
+        cached holds results already taken from the cache for this page
+        (see cached_configs); those configs are not run again.
+        Returns (text, OCRWords) of the best config, or ("", None).
+        """
+        cached = cached or {}
+        if self.parallel_configs:
+            return self.ocr_configs_early_exit(image, doc_key, page_index, cached)
 
-                result = subprocess.run(cmd, capture_output=True, text=True)
+        best_text = ""
+        best_words = None
+        best_score = 0
+        best_index = None
 
-                if result.returncode == 0 and os.path.exists(txt_path):
-                    with open(txt_path, 'r', encoding='utf-8') as f:
-                        text = f.read()
+        for index, config in enumerate(self.OCR_CONFIGS):
+            try:
+                if index in cached:
+                    text, words = cached[index]
+                else:
+                    text, words = self.run_tesseract(image, config,
+                                                     self.config_cache_key(config, doc_key, page_index))
 
-                    # Score based on Chinese characters and math symbols
-                    chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-                    math_symbols = len(re.findall(r'[+\-×÷=＜＞≤≥]', text))
-                    score = chinese_chars + math_symbols * 5
+                if text:
+                    # Score based on how much text tesseract is confident in
+                    score = self.score_ocr_words(words)
 
                     if score > best_score:
                         best_score = score
                         best_text = text
-
-                    # Clean up
-                    os.remove(txt_path)
+                        best_words = words
+                        best_index = index
 
             except Exception as e:
                 continue
 
-        return best_text
+        if best_index is not None:
+            self.record_config_win(doc_key, best_index)
+        return best_text, best_words
+
+    def ocr_configs_early_exit(self, image, doc_key=None, page_index=None, cached=None):
+        """Run OCR configs concurrently and stop once one scores above the threshold
+
+        The config that won most often on earlier pages of the same document
+        is tried alone first; the rest only run if it falls short. Cached
+        results are scored first and their configs are not run again.
+        """
+        cached = cached or {}
+        order = [index for index in self.ordered_configs(doc_key) if index not in cached]
+        if self.config_wins.get(doc_key):
+            rounds = [order[:1], order[1:]]
+        else:
+            rounds = [order]
+
+        best_text = ""
+        best_words = None
+        best_score = 0
+        best_index = None
+
+        for index, (text, words) in cached.items():
+            score = self.score_ocr_words(words) if text else 0
+            if score > best_score:
+                best_score = score
+                best_text = text
+                best_words = words
+                best_index = index
+        if best_score >= self.score_threshold:
+            rounds = []
+
+        for round_indexes in rounds:
+            if not round_indexes:
+                continue
+            futures = {}
+            for index in round_indexes:
+                config = self.OCR_CONFIGS[index]
+                key = self.config_cache_key(config, doc_key, page_index)
+                futures[self.submit_config(image, config, key)] = index
+
+            passed = False
+            for future in as_completed(futures):
+                try:
+                    text, words = future.result()
+                except Exception as e:
+                    continue
+
+                score = self.score_ocr_words(words) if text else 0
+                if score > best_score:
+                    best_score = score
+                    best_text = text
+                    best_words = words
+                    best_index = futures[future]
+
+                if best_score >= self.score_threshold:
+                    passed = True
+                    break
+
+            if passed:
+                # Drop the configs that have not started yet
+                for future in futures:
+                    future.cancel()
+                break
+
+        if best_index is not None:
+            self.record_config_win(doc_key, best_index)
+        return best_text, best_words
 
     def clean_and_structure_ocr_text(self, text):
         """Clean OCR text and identify math problems"""
@@ -113,42 +407,40 @@ class ImprovedMathProblemExtractor:
 
     def is_math_problem_section(self, text):
         """Check if text section contains math problems"""
-        # Indicators of math problem sections
-        indicators = [
-            r'练习',
-            r'习题',
-            r'测试',
-            r'计算',
-            r'解题',
-            r'应用题',
-            r'选择题',
-            r'填空题',
-            r'判断题',
-            r'解答题',
-            r'\d+\s*[\.、]',
-            r'[①②③④⑤⑥⑦⑧⑨⑩]'
-        ]
-
-        for indicator in indicators:
-            if re.search(indicator, text):
-                return True
-        return False
-
-    def extract_structured_problems(self, text, page_num, source_file):
-        """Extract structured math problems from text"""
+        return is_math_section(text)
+
+    def problem_spans(self, text):
+        """Return (start, end) character spans of the sections between problem separators"""
+        separators = list(PROBLEM_SEPARATORS.finditer(text))
+        ends = [match.start() for match in separators[1:]] + [len(text)]
+        return [(match.end(), end) for match, end in zip(separators, ends)]
+
+    def extract_structured_problems(self, text, page_num, source_file, words=None, first_number=1, offsets=None):
+        """Extract structured math problems from cleaned OCR text
+
+        When the page's OCRWords are given (text being the cleaned
+        words.text()), each problem carries the mean confidence of its
+        words as ocrConfidence. For text that is only part of the cleaned
+        page, offsets gives the words.text() offset of each of its
+        characters. Problems are numbered from first_number within the page.
+        """
         problems = []
+        if words is not None and offsets is None:
+            offsets = cleaned_offsets(words.text(), text)
 
         # Split by common problem separators
-        problem_sections = re.split(r'(?:\d+[\.、]|[①②③④⑤⑥⑦⑧⑨⑩]|练习|习题|测试)\s*', text)
-
-        for i, section in enumerate(problem_sections[1:], 1):  # Skip first empty section
-            section = section.strip()
+        for i, (start, end) in enumerate(self.problem_spans(text), first_number):
+            section = text[start:end].strip()
 
             if len(section) > 10:  # Minimum viable problem length
                 # Try to extract different parts of the problem
                 problem = self.create_problem_struct(section, page_num, i, source_file)
 
                 if problem['stem'] and self.is_valid_math_problem(problem['stem']):
+                    if offsets is not None:
+                        confidence = words.span_confidence(offsets[start], offsets[end - 1] + 1)
+                        if confidence is not None:
+                            problem['ocrConfidence'] = round(confidence)
                     problems.append(problem)
 
         return problems
@@ -208,57 +500,8 @@ class ImprovedMathProblemExtractor:
         return ""
 
     def extract_knowledge_points(self, text):
-        """Extract knowledge points from problem text"""
-        knowledge_points = []
-
-        # Comprehensive topic mapping for 4th grade math
-        topic_keywords = {
-            "加法": "加法运算",
-            "减法": "减法运算",
-            "乘法": "乘法运算",
-            "除法": "除法运算",
-            "四则": "四则混合运算",
-            "分数": "分数",
-            "小数": "小数",
-            "面积": "面积计算",
-            "周长": "周长计算",
-            "体积": "体积计算",
-            "时间": "时间计算",
-            "应用题": "应用题",
-            "几何": "几何图形",
-            "图形": "几何图形",
-            "平均数": "平均数",
-            "统计": "统计图表",
-            "概率": "概率初步",
-            "角度": "角度计算",
-            "三角形": "三角形",
-            "四边形": "四边形",
-            "圆形": "圆形",
-            "长方形": "长方形",
-            "正方形": "正方形",
-            "平行四边形": "平行四边形",
-            "梯形": "梯形",
-            "多位数": "多位数",
-            "估算": "估算",
-            "验算": "验算",
-            "单位": "单位换算",
-            "路程": "路程问题",
-            "速度": "速度问题",
-            "效率": "效率问题",
-            "植树": "植树问题",
-            "鸡兔": "鸡兔同笼",
-            "和差": "和差问题",
-            "和倍": "和倍问题",
-            "差倍": "差倍问题",
-            "年龄": "年龄问题",
-            "盈亏": "盈亏问题"
-        }
-
-        for keyword, point in topic_keywords.items():
-            if keyword in text:
-                knowledge_points.append(point)
-
-        return list(set(knowledge_points)) if knowledge_points else ["基础运算"]
+        """Extract knowledge points from problem text (topic mapping for 4th grade math)"""
+        return keyword_labels(text, "knowledge.improved") or ["基础运算"]
 
     def estimate_difficulty(self, text):
         """Estimate problem difficulty"""
@@ -268,14 +511,15 @@ class ImprovedMathProblemExtractor:
         # Length factor
         difficulty_score += min(len(text) // 50, 3)
 
-        # Complexity factors
-        if any(word in text for word in ["应用题", "解决", "实际"]):
+        # Complexity factors: practical context, harder concepts, multi-step analysis
+        factors = keyword_labels(text, "difficulty.improved")
+        if "practical" in factors:
             difficulty_score += 2
 
-        if any(word in text for word in ["分数", "小数", "面积", "体积"]):
+        if "concept" in factors:
             difficulty_score += 1
 
-        if any(word in text for word in ["综合", "分析", "多种方法"]):
+        if "complex" in factors:
             difficulty_score += 2
 
         if difficulty_score >= 5:
@@ -287,22 +531,7 @@ class ImprovedMathProblemExtractor:
 
     def classify_problem_type(self, text):
         """Classify problem type"""
-        type_keywords = {
-            "word_problem": ["应用题", "解决", "实际", "问题"],
-            "multiple_choice": ["选择", "选项", "A.", "B.", "C.", "D."],
-            "true_false": ["判断", "对错", "正确", "错误"],
-            "fill_in_blank": ["填空", "括号", "横线"],
-            "calculation": ["计算", "求", "算式", "得数"],
-            "geometry": ["几何", "图形", "面积", "周长", "体积"],
-            "measurement": ["单位", "长度", "重量", "时间"],
-            "data_analysis": ["统计", "图表", "平均数"]
-        }
-
-        for problem_type, keywords in type_keywords.items():
-            if any(keyword in text for keyword in keywords):
-                return problem_type
-
-        return "calculation"
+        return first_label(text, "type.improved", "calculation")
 
     def is_valid_math_problem(self, text):
         """Validate if text is a genuine math problem"""
@@ -318,49 +547,203 @@ class ImprovedMathProblemExtractor:
 
         return has_math and reasonable_length
 
-    def process_pdf(self, pdf_path, start_page=0, max_pages=20):
-        """Process a PDF file with improved OCR"""
+    def ocr_pages_by_configs(self, pdf_path, start_page=0, max_pages=20, pages=None):
+        """Yield (page_num, text, words) with whole pages read by the competing OCR configs"""
+        # Render pages in memory, one at a time, skipping pages the cache settles.
+        # Cached results are fetched once and handed on with the page, so an
+        # eviction between the lookup and the OCR cannot leave a page without image.
+        def lookup(page_index):
+            refined = self.cached_two_pass(pdf_path, page_index, 'configs')
+            if refined is not None:
+                return (refined, None), True
+            cached = self.cached_configs(pdf_path, page_index)
+            return (None, cached), self.cache_settles(cached)
+
+        for page_num, image, (refined, cached) in self.stream_page_images(pdf_path, start_page, max_pages,
+                                                                          lookup=lookup, page_indexes=pages):
+            print(f"Processing page {page_num}...")
+
+            if refined is not None:
+                # Refined in an earlier run: neither pass runs again
+                yield page_num, refined[0], refined[1]
+                continue
+
+            # Perform OCR with multiple configurations
+            text, words = self.ocr_with_multiple_configs(image, doc_key=pdf_path, page_index=page_num - 1,
+                                                         cached=cached)
+            del image
+
+            if self.reocr and words is not None and not self.is_embedded_scan(pdf_path, page_num - 1):
+                words = self.refine_page(pdf_path, page_num, text, words, 'configs')
+
+            yield page_num, text, words
+
+    def ocr_pages_by_layout(self, pdf_path, start_page=0, max_pages=20, pages=None):
+        """Yield (page_num, text, words) with each layout region read on its own"""
+        for page_index in self.page_order(pdf_path, start_page, max_pages, pages):
+            page_num = page_index + 1
+            print(f"Processing page {page_num}...")
+
+            refined = self.cached_two_pass(pdf_path, page_index, 'layout')
+            if refined is not None:
+                yield page_num, refined[0], refined[1]
+                continue
+
+            key = cache_key(pdf_path, page_index, self.ZOOM, 'chi_sim+eng', 6, 3, f"{self.render_mode}+layout")
+            cached = self.ocr_cache.get(key)
+            if cached is not None and cached['words'] is not None:
+                text, words = cached['text'], cached['words']
+            else:
+                try:
+                    text, words, regions = self.layout.ocr_regions(pdf_path, page_index, self.ocr_pool, self.ZOOM,
+                                                                   mode=self.render_mode)
+                except Exception as e:
+                    print(f"OCR error on page {page_num}: {e}")
+                    continue
+                print(f"Page {page_num}: read {len(regions)} layout regions")
+                self.ocr_cache.put(key, text, words=words)
+
+            if self.reocr:
+                # Region crops are always rendered at ZOOM, so every page can be refined
+                words = self.refine_page(pdf_path, page_num, text, words, 'layout')
+
+            yield page_num, text, words
+
+    def finish_held_span(self, stitcher, holder, page_counts, pdf_path):
+        """Problems of the span still held, on their own
+
+        holder is (page number, problems) of the page the span was journaled
+        with; that page is journaled again with them added and nothing held.
+        """
+        held = stitcher.flush()
+        if not held:
+            return []
+        page, text = held
+        held_problems = self.extract_structured_problems(text, page, pdf_path, first_number=page_counts.get(page, 0) + 1)
+        if self.journal:
+            self.journal.record(pdf_path, holder[0], holder[1] + held_problems)
+        return held_problems
+
+    def numbered_problems(self, pdf_path, page, finished):
+        """Highest problem number an earlier run gave a page, wherever it was journaled"""
+        source = f"{pdf_path} (Page {page})"
+        return max((int(problem["id"].rsplit('_', 1)[1]) for page_problems in finished.values()
+                    for problem in page_problems if problem["source"] == source), default=0)
+
+    def segment_span(self, pdf_path, page, text, page_problems):
+        """Problems of a span cut at a shard edge, numbered after the page's problems (for merge_shards)"""
+        first_number = self.numbered_problems(pdf_path, page, {page: page_problems}) + 1
+        return self.extract_structured_problems(text, page, pdf_path, first_number=first_number)
+
+    def process_pdf(self, pdf_path, start_page=0, max_pages=20, pages=None):
+        """Process a PDF file with improved OCR (a page index list overrides the range)
+
+        Pages are read in page order, and a problem cut by a page break is
+        held back and joined with the top of the next page. Problems joined
+        that way span two pages' words, so they carry no ocrConfidence.
+        """
         print(f"\nProcessing PDF: {pdf_path}")
 
         if not os.path.exists(pdf_path):
             print(f"File not found: {pdf_path}")
             return []
 
-        # Convert PDF to images
-        images = self.pdf_to_high_quality_images(pdf_path, start_page, max_pages)
+        if pages is not None:
+            pages = sorted(pages)
+        # First page of the run, whose leading fragment a shard run leaves to the merge
+        lead_page = (pages[0] if pages else start_page) + 1
+
+        # Pages finished in an earlier run are replayed from the journal, not OCR'd again
+        finished = self.journal.finished(pdf_path) if self.journal else {}
+        replayed = []
+        if finished:
+            page_indexes = self.page_order(pdf_path, start_page, max_pages, pages)
+            replayed = [page_index + 1 for page_index in page_indexes if page_index + 1 in finished]
+            pages = [page_index for page_index in page_indexes if page_index + 1 not in finished]
+            print(f"{len(replayed)} pages finished in an earlier run")
+
+        if self.layout:
+            page_results = self.ocr_pages_by_layout(pdf_path, start_page, max_pages, pages)
+        else:
+            page_results = self.ocr_pages_by_configs(pdf_path, start_page, max_pages, pages)
+
+        def in_page_order():
+            # (page number, text, words, replayed): journaled pages between the pages read now
+            for page_num, text, words in page_results:
+                while replayed and replayed[0] < page_num:
+                    yield replayed.pop(0), None, None, True
+                yield page_num, text, words, False
+            for page_num in replayed:
+                yield page_num, None, None, True
+
+        stitcher = PageStitcher(PROBLEM_SEPARATORS, lead_page if self.shard_edges else None)
+        # Highest problem number used on each page, so a carried problem numbers on after them
+        page_counts = {}
+        # (page number, journaled problems, restored from the journal) of the page the held span was journaled with
+        holder = None
         all_problems = []
 
-        for page_num, image_path in images:
-            print(f"Processing page {page_num}...")
+        for page_num, text, words, replay in in_page_order():
+            if replay:
+                # A span held from a page read in this run was never joined with this page, so it is
+                # finished on its own; one restored from the journal already is part of this page
+                if holder and not holder[2]:
+                    all_problems.extend(self.finish_held_span(stitcher, holder, page_counts, pdf_path))
+                all_problems.extend(finished[page_num])
+                # The span the earlier run held back after this page carries on to the next page read
+                stitcher.held = self.journal.held(pdf_path, page_num)
+                if stitcher.held:
+                    held_page = stitcher.held[0]
+                    page_counts[held_page] = self.numbered_problems(pdf_path, held_page, finished)
+                holder = (page_num, finished[page_num], True)
+                continue
 
-            # Perform OCR with multiple configurations
-            text = self.ocr_with_multiple_configs(image_path)
+            if words is not None:
+                # Drop noise words; the text is rebuilt from the words that remain
+                words = words.filtered(self.MIN_WORD_CONFIDENCE)
+                text = words.text()
 
+            clean_text = ""
             if text:
                 # Clean and structure text
                 clean_text = self.clean_and_structure_ocr_text(text)
-
-                if self.is_math_problem_section(clean_text):
-                    # Extract structured problems
-                    problems = self.extract_structured_problems(clean_text, page_num, pdf_path)
-                    all_problems.extend(problems)
-                    print(f"Found {len(problems)} problems on page {page_num}")
-                else:
+                if not self.is_math_problem_section(clean_text):
                     print(f"Page {page_num}: No math problem sections detected")
+                    clean_text = ""
             else:
                 print(f"No text extracted from page {page_num}")
 
-            # Clean up image file
-            if os.path.exists(image_path):
-                os.remove(image_path)
-
+            # A page without problem sections still ends a span held from the page before
+            problems = []
+            carried, own_text = stitcher.feed(page_num, clean_text)
+            if carried:
+                # The previous page's last problem, reported on the page it starts on
+                page, carried_text = carried
+                problems = self.extract_structured_problems(carried_text, page, pdf_path,
+                                                            first_number=page_counts.get(page, 0) + 1)
+            if clean_text:
+                # Extract structured problems; own_text is the part of the page between the carried and held spans
+                offsets = None
+                if words is not None:
+                    end = len(clean_text) - (len(stitcher.held[1]) if stitcher.held else 0)
+                    offsets = cleaned_offsets(text, clean_text)[end - len(own_text):end]
+                problems += self.extract_structured_problems(own_text, page_num, pdf_path, words, offsets=offsets)
+                page_counts[page_num] = len(self.problem_spans(own_text))
+                print(f"Found {len(problems)} problems on page {page_num}")
+
+            all_problems.extend(problems)
+            # The held span is journaled with the page, so a resumed run can still join it with the next one
+            if self.journal:
+                self.journal.record(pdf_path, page_num, problems, held=stitcher.held, lead=stitcher.pop_lead())
+            holder = (page_num, problems, False)
+
+        if holder and not self.shard_edges:
+            all_problems.extend(self.finish_held_span(stitcher, holder, page_counts, pdf_path))
         return all_problems
 
     def cleanup(self):
-        """Clean up temporary files"""
-        if os.path.exists(self.temp_dir):
-            import shutil
-            shutil.rmtree(self.temp_dir)
+        """Release resources held by the extractor"""
+        pass
 
 def main():
     pdf_files = [
@@ -368,21 +751,47 @@ def main():
         "/Users/tywg001/Downloads/mathlearning/aoshu/学霸提优大试卷四年级上册数学人教版.pdf"
     ]
 
-    extractor = ImprovedMathProblemExtractor()
+    parser = argparse.ArgumentParser(description="Extract math problems from triaged PDF pages with multi-config OCR")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip pages an interrupted run already finished (from its checkpoint journal)")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
+
+    output_file = "/Users/tywg001/Downloads/mathlearning/final_extracted_problems.json"
+    run_file = shard_path(output_file, args.shard) if args.shard else output_file
+    journal = None if args.merge else CheckpointJournal(default_journal_path(run_file), resume=args.resume)
+    # OCR_LAYOUT=1 reads multi-column pages region by region in reading order
+    extractor = ImprovedMathProblemExtractor(parallel_configs=True, layout=os.environ.get("OCR_LAYOUT") == "1",
+                                             journal=journal, shard_edges=bool(args.shard))
+    triage = PageTriage()
     all_problems = []
+    assigned = {}
 
     try:
-        for pdf_file in pdf_files:
-            # Try different page ranges to find content pages
-            for start_page in [0, 10, 20, 30]:
-                problems = extractor.process_pdf(pdf_file, start_page=start_page, max_pages=10)
+        if args.merge:
+            try:
+                all_problems = merge_shards(output_file, extractor.segment_span)
+            except ValueError as e:
+                print(f"Cannot merge shards: {e}")
+                return
+        else:
+            for pdf_file in pdf_files:
+                assigned[pdf_file] = []
+                if not os.path.exists(pdf_file):
+                    print(f"File not found: {pdf_file}")
+                    continue
+
+                # OCR the whole book, but only pages the triage pass ranks as content pages;
+                # shards take runs of consecutive pages, so the ranking is put back in page order
+                pages = shard_pages(sorted(triage.select_pages(pdf_file)), args.shard)
+                assigned[pdf_file] = [page_num + 1 for page_num in pages]
+                problems = extractor.process_pdf(pdf_file, pages=pages)
                 all_problems.extend(problems)
+                print(f"Found {len(problems)} problems on {len(pages)} triaged pages")
 
-                if len(problems) > 0:
-                    print(f"Found {len(problems)} problems starting from page {start_page+1}")
-                    break  # Stop if we found problems in this range
-                else:
-                    print(f"No problems found starting from page {start_page+1}")
+            if args.shard:
+                write_shard(output_file, args.shard, assigned, journal)
+                return
 
         # Remove duplicates based on similar stems
         unique_problems = []
@@ -395,7 +804,6 @@ def main():
                 seen_stems.add(stem_normalized)
 
         # Save results
-        output_file = "/Users/tywg001/Downloads/mathlearning/final_extracted_problems.json"
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(unique_problems, f, ensure_ascii=False, indent=2)
 
@@ -437,6 +845,8 @@ def main():
             print(f"  Stem: {problem.get('stem', 'N/A')[:300]}...")
 
     finally:
+        if journal:
+            journal.close()
         extractor.cleanup()
 
 if __name__ == "__main__":
@@ -112,17 +112,21 @@ class ProblemIntegrator:
 
     def calculate_confidence_score(self, problem):
         """Calculate confidence score for OCR extracted problem"""
-        score = 50  # Base score
-
         stem = problem.get('stem', '')
 
-        # Add points for math content
-        if any(op in stem for op in ['+', '-', '×', '÷', '=']):
-            score += 20
+        if problem.get('ocrConfidence') is not None:
+            # Mean tesseract word confidence measured at extraction time
+            score = problem['ocrConfidence']
+        else:
+            score = 50  # Base score
+
+            # Add points for math content
+            if any(op in stem for op in ['+', '-', '×', '÷', '=']):
+                score += 20
 
-        # Add points for Chinese content
-        if any('\u4e00' <= char <= '\u9fff' for char in stem):
-            score += 15
+            # Add points for Chinese content
+            if any('\u4e00' <= char <= '\u9fff' for char in stem):
+                score += 15
 
         # Add points for reasonable length
         if 20 <= len(stem) <= 300:
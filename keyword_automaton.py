@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Keyword Automaton for Problem Classification
+One table of (namespace, keyword, label) rows replaces the keyword dicts
+and `keyword in text` chains of the extractors, and one scan of a stem
+finds every keyword of every namespace
+
+The keywords are compiled into a single regex alternation, longest first,
+tried at every position that starts with a keyword's first character, so
+each position yields the longest keyword starting there. Shorter keywords
+inside it (四边形 in 平行四边形, 应用 in 应用题) come from a precomputed
+containment table, so the result is exactly the set of keywords that `in`
+would find.
+
+Labels of a namespace come back in table order, without repeats, so the
+first label is what an if/elif chain over the same keywords returns.
+"""
+
+import re
+import bisect
+from functools import lru_cache
+
+KEYWORD_TABLE = [
+    # MathProblemOCRExtractor.extract_knowledge_points
+    ("knowledge.ocr", "加法", "加法运算"),
+    ("knowledge.ocr", "减法", "减法运算"),
+    ("knowledge.ocr", "乘法", "乘法运算"),
+    ("knowledge.ocr", "除法", "除法运算"),
+    ("knowledge.ocr", "分数", "分数"),
+    ("knowledge.ocr", "小数", "小数"),
+    ("knowledge.ocr", "面积", "面积计算"),
+    ("knowledge.ocr", "周长", "周长计算"),
+    ("knowledge.ocr", "体积", "体积计算"),
+    ("knowledge.ocr", "时间", "时间计算"),
+    ("knowledge.ocr", "应用题", "应用题"),
+    ("knowledge.ocr", "几何", "几何图形"),
+    ("knowledge.ocr", "平均数", "平均数"),
+    ("knowledge.ocr", "统计", "统计图表"),
+
+    # TargetedMathExtractor.get_knowledge_points
+    ("knowledge.targeted", "加法", "加法运算"),
+    ("knowledge.targeted", "减法", "减法运算"),
+    ("knowledge.targeted", "乘法", "乘法运算"),
+    ("knowledge.targeted", "除法", "除法运算"),
+    ("knowledge.targeted", "分数", "分数"),
+    ("knowledge.targeted", "小数", "小数"),
+    ("knowledge.targeted", "面积", "面积计算"),
+    ("knowledge.targeted", "周长", "周长计算"),
+    ("knowledge.targeted", "应用题", "应用题"),
+    ("knowledge.targeted", "几何", "几何图形"),
+    ("knowledge.targeted", "平均数", "平均数"),
+    ("knowledge.targeted", "统计", "统计图表"),
+
+    # ImprovedMathProblemExtractor.extract_knowledge_points
+    ("knowledge.improved", "加法", "加法运算"),
+    ("knowledge.improved", "减法", "减法运算"),
+    ("knowledge.improved", "乘法", "乘法运算"),
+    ("knowledge.improved", "除法", "除法运算"),
+    ("knowledge.improved", "四则", "四则混合运算"),
+    ("knowledge.improved", "分数", "分数"),
+    ("knowledge.improved", "小数", "小数"),
+    ("knowledge.improved", "面积", "面积计算"),
+    ("knowledge.improved", "周长", "周长计算"),
+    ("knowledge.improved", "体积", "体积计算"),
+    ("knowledge.improved", "时间", "时间计算"),
+    ("knowledge.improved", "应用题", "应用题"),
+    ("knowledge.improved", "几何", "几何图形"),
+    ("knowledge.improved", "图形", "几何图形"),
+    ("knowledge.improved", "平均数", "平均数"),
+    ("knowledge.improved", "统计", "统计图表"),
+    ("knowledge.improved", "概率", "概率初步"),
+    ("knowledge.improved", "角度", "角度计算"),
+    ("knowledge.improved", "三角形", "三角形"),
+    ("knowledge.improved", "四边形", "四边形"),
+    ("knowledge.improved", "圆形", "圆形"),
+    ("knowledge.improved", "长方形", "长方形"),
+    ("knowledge.improved", "正方形", "正方形"),
+    ("knowledge.improved", "平行四边形", "平行四边形"),
+    ("knowledge.improved", "梯形", "梯形"),
+    ("knowledge.improved", "多位数", "多位数"),
+    ("knowledge.improved", "估算", "估算"),
+    ("knowledge.improved", "验算", "验算"),
+    ("knowledge.improved", "单位", "单位换算"),
+    ("knowledge.improved", "路程", "路程问题"),
+    ("knowledge.improved", "速度", "速度问题"),
+    ("knowledge.improved", "效率", "效率问题"),
+    ("knowledge.improved", "植树", "植树问题"),
+    ("knowledge.improved", "鸡兔", "鸡兔同笼"),
+    ("knowledge.improved", "和差", "和差问题"),
+    ("knowledge.improved", "和倍", "和倍问题"),
+    ("knowledge.improved", "差倍", "差倍问题"),
+    ("knowledge.improved", "年龄", "年龄问题"),
+    ("knowledge.improved", "盈亏", "盈亏问题"),
+
+    # classify_problem_type (MathProblemOCRExtractor) and get_type (TargetedMathExtractor)
+    ("type", "应用题", "word_problem"),
+    ("type", "解决", "word_problem"),
+    ("type", "选择", "multiple_choice"),
+    ("type", "判断", "true_false"),
+    ("type", "填空", "fill_in_blank"),
+
+    # ImprovedMathProblemExtractor.classify_problem_type
+    ("type.improved", "应用题", "word_problem"),
+    ("type.improved", "解决", "word_problem"),
+    ("type.improved", "实际", "word_problem"),
+    ("type.improved", "问题", "word_problem"),
+    ("type.improved", "选择", "multiple_choice"),
+    ("type.improved", "选项", "multiple_choice"),
+    ("type.improved", "A.", "multiple_choice"),
+    ("type.improved", "B.", "multiple_choice"),
+    ("type.improved", "C.", "multiple_choice"),
+    ("type.improved", "D.", "multiple_choice"),
+    ("type.improved", "判断", "true_false"),
+    ("type.improved", "对错", "true_false"),
+    ("type.improved", "正确", "true_false"),
+    ("type.improved", "错误", "true_false"),
+    ("type.improved", "填空", "fill_in_blank"),
+    ("type.improved", "括号", "fill_in_blank"),
+    ("type.improved", "横线", "fill_in_blank"),
+    ("type.improved", "计算", "calculation"),
+    ("type.improved", "求", "calculation"),
+    ("type.improved", "算式", "calculation"),
+    ("type.improved", "得数", "calculation"),
+    ("type.improved", "几何", "geometry"),
+    ("type.improved", "图形", "geometry"),
+    ("type.improved", "面积", "geometry"),
+    ("type.improved", "周长", "geometry"),
+    ("type.improved", "体积", "geometry"),
+    ("type.improved", "单位", "measurement"),
+    ("type.improved", "长度", "measurement"),
+    ("type.improved", "重量", "measurement"),
+    ("type.improved", "时间", "measurement"),
+    ("type.improved", "统计", "data_analysis"),
+    ("type.improved", "图表", "data_analysis"),
+    ("type.improved", "平均数", "data_analysis"),
+
+    # TargetedMathExtractor.get_difficulty
+    ("difficulty.targeted", "应用题", "hard"),
+    ("difficulty.targeted", "综合", "hard"),
+
+    # ImprovedMathProblemExtractor.estimate_difficulty: factors worth 2, 1 and 2 points
+    ("difficulty.improved", "应用题", "practical"),
+    ("difficulty.improved", "解决", "practical"),
+    ("difficulty.improved", "实际", "practical"),
+    ("difficulty.improved", "分数", "concept"),
+    ("difficulty.improved", "小数", "concept"),
+    ("difficulty.improved", "面积", "concept"),
+    ("difficulty.improved", "体积", "concept"),
+    ("difficulty.improved", "综合", "complex"),
+    ("difficulty.improved", "分析", "complex"),
+    ("difficulty.improved", "多种方法", "complex"),
+
+    # format_extracted_problems.format_problem_structure
+    ("format.taxonomy", "计算", "计算题"),
+    ("format.taxonomy", "算式", "计算题"),
+    ("format.taxonomy", "×", "计算题"),
+    ("format.taxonomy", "÷", "计算题"),
+    ("format.taxonomy", "选择", "选择题"),
+    ("format.taxonomy", "判断", "选择题"),
+    ("format.taxonomy", "应用", "应用题"),
+    ("format.taxonomy", "实际", "应用题"),
+    ("format.taxonomy", "生活", "应用题"),
+    ("format.taxonomy", "填空", "填空题"),
+    ("format.knowledge", "加法", "加减运算"),
+    ("format.knowledge", "减法", "加减运算"),
+    ("format.knowledge", "加", "加减运算"),
+    ("format.knowledge", "减", "加减运算"),
+    ("format.knowledge", "乘法", "乘除运算"),
+    ("format.knowledge", "除法", "乘除运算"),
+    ("format.knowledge", "×", "乘除运算"),
+    ("format.knowledge", "÷", "乘除运算"),
+    ("format.knowledge", "面积", "几何图形"),
+    ("format.knowledge", "周长", "几何图形"),
+    ("format.knowledge", "图形", "几何图形"),
+    ("format.knowledge", "几何", "几何图形"),
+    ("format.knowledge", "时间", "时间问题"),
+    ("format.knowledge", "分钟", "时间问题"),
+    ("format.knowledge", "小时", "时间问题"),
+    ("format.knowledge", "秒", "时间问题"),
+    ("format.knowledge", "千克", "计量单位"),
+    ("format.knowledge", "克", "计量单位"),
+    ("format.knowledge", "米", "计量单位"),
+    ("format.knowledge", "厘米", "计量单位"),
+    ("format.knowledge", "长度", "计量单位"),
+    ("format.knowledge", "重量", "计量单位"),
+    ("format.knowledge", "计算器", "计算工具使用"),
+    ("format.knowledge", "计算", "计算工具使用"),
+    ("format.knowledge", "规律", "规律探索"),
+    ("format.knowledge", "模式", "规律探索"),
+    ("format.knowledge", "序列", "规律探索"),
+    ("format.hard", "亿", "hard"),
+    ("format.hard", "万", "hard"),
+    ("format.hard", "规律", "hard"),
+    ("format.hard", "模式", "hard"),
+    ("format.core", "应用", "core"),
+    ("format.core", "计算", "core"),
+    ("format.core", "选择", "core"),
+    ("format.steps", "计算", "calculation"),
+    ("format.steps", "应用", "application"),
+    ("format.steps", "实际", "application"),
+]
+
+# Keeps batches apart when they are scanned as one string; no keyword contains it
+_BATCH_SEPARATOR = '\x00'
+
+class KeywordAutomaton:
+    """Finds every table keyword in a text in one scan and maps them to labels per namespace"""
+
+    def __init__(self, table):
+        self.table = list(table)
+        keywords = list(dict.fromkeys(keyword for namespace, keyword, label in self.table))
+
+        # Table rows of every keyword found when a keyword matches: its own and those of keywords inside it
+        rows = {}
+        for index, (namespace, keyword, label) in enumerate(self.table):
+            rows.setdefault(keyword, []).append(index)
+        self._rows = {keyword: sorted(index for other in keywords if other in keyword for index in rows[other])
+                      for keyword in keywords}
+
+        longest_first = sorted(keywords, key=len, reverse=True)
+        first_chars = ''.join(sorted({keyword[0] for keyword in keywords}))
+        self.regex = re.compile(f"(?=[{re.escape(first_chars)}])(?=({'|'.join(map(re.escape, longest_first))}))")
+
+    def scan(self, text):
+        """Indexes of the table rows whose keyword occurs in text, in table order"""
+        found = set()
+        for match in self.regex.finditer(text):
+            found.update(self._rows[match.group(1)])
+        return sorted(found)
+
+    def labels(self, rows):
+        """{namespace: labels} of matched rows, labels in table order without repeats"""
+        labels = {}
+        for index in rows:
+            namespace, keyword, label = self.table[index]
+            namespace_labels = labels.setdefault(namespace, [])
+            if label not in namespace_labels:
+                namespace_labels.append(label)
+        return labels
+
+    def classify(self, text):
+        """{namespace: labels} for one text"""
+        return self.labels(self.scan(text))
+
+    def classify_batch(self, texts):
+        """{namespace: labels} for each of many texts, scanned as one string"""
+        texts = list(texts)
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+
+        found = [set() for _ in texts]
+        for match in self.regex.finditer(_BATCH_SEPARATOR.join(texts)):
+            found[bisect.bisect_right(starts, match.start()) - 1].update(self._rows[match.group(1)])
+        return [self.labels(sorted(rows)) for rows in found]
+
+_automaton = None
+
+def get_automaton():
+    """Return the automaton of KEYWORD_TABLE (compiled once)"""
+    global _automaton
+    if _automaton is None:
+        _automaton = KeywordAutomaton(KEYWORD_TABLE)
+    return _automaton
+
+@lru_cache(maxsize=4096)
+def _classify(text):
+    return get_automaton().classify(text)
+
+def keyword_labels(text, namespace):
+    """Labels of one namespace found in text (a new list)
+
+    Classifications are memoized, so the knowledge point, type and
+    difficulty lookups of one stem share a single scan.
+    """
+    return list(_classify(text).get(namespace, ()))
+
+def first_label(text, namespace, default):
+    """The first label of a namespace found in text, as an if/elif chain over its keywords would pick"""
+    labels = _classify(text).get(namespace)
+    return labels[0] if labels else default
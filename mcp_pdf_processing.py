@@ -7,12 +7,14 @@ Uses markitdown and pdf-extraction MCP servers to process PDF files
 import os
 import sys
 import json
-import re
 import subprocess
 import asyncio
 from pathlib import Path
 import tempfile
 
+from page_stitcher import section_markers, stitch_pages
+from problem_patterns import collapse_whitespace, is_math_problem, labelled_value, split_sections, starts_with_part
+
 class MCPPDFProcessor:
     def __init__(self):
         self.extracted_problems = []
@@ -21,30 +23,14 @@ class MCPPDFProcessor:
     def clean_text(self, text):
         """Clean extracted text"""
         # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = collapse_whitespace(text)
         # Remove empty lines
         lines = [line.strip() for line in text.split('\n') if line.strip()]
         return '\n'.join(lines)
 
     def is_math_problem(self, text):
         """Check if text looks like a math problem"""
-        math_indicators = [
-            r'\d+\s*[＋+\-×÷]\s*\d+',  # Basic operations
-            r'解.*?题',  # Solve problem
-            r'计算.*?式',  # Calculate expression
-            r'求.*?值',  # Find value
-            r'应用题',  # Word problem
-            r'选择题',  # Multiple choice
-            r'填空题',  # Fill in blank
-            r'判断题',  # True/False
-            r'[①②③④⑤⑥⑦⑧⑨⑩]',  # Problem numbers
-            r'[1-9]\.\s*',  # Numbered problems
-        ]
-
-        for pattern in math_indicators:
-            if re.search(pattern, text):
-                return True
-        return False
+        return is_math_problem(text)
 
     def extract_problem_structure(self, text):
         """Extract structured problem from text"""
@@ -75,21 +61,17 @@ class MCPPDFProcessor:
         for line in lines:
             if line.strip():
                 # Stop at answer indicators
-                if re.match(r'答案|答|解|解析', line):
+                if starts_with_part(line):
                     break
                 stem_lines.append(line)
 
         problem["stem"] = '\n'.join(stem_lines).strip()
 
         # Extract answer if present
-        answer_match = re.search(r'答案[:：]\s*(.*?)(?:\n|$)', text)
-        if answer_match:
-            problem["answer"] = answer_match.group(1).strip()
+        problem["answer"] = labelled_value("answer", text)
 
         # Extract analysis if present
-        analysis_match = re.search(r'解析[:：]\s*(.*?)(?:\n|$)', text)
-        if analysis_match:
-            problem["analysis"] = analysis_match.group(1).strip()
+        problem["analysis"] = labelled_value("analysis", text)
 
         # Determine difficulty based on content
         if len(problem["stem"]) > 200:
@@ -202,19 +184,13 @@ else:
         return None
 
     def fallback_pymupdf_extraction(self, pdf_path):
-        """Fallback to PyMuPDF extraction"""
+        """Fallback to PyMuPDF extraction, returning a stream of page records"""
         try:
-            import fitz
-            doc = fitz.open(pdf_path)
-            text_content = ""
-
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                text = page.get_text()
-                text_content += f"\n--- Page {page_num + 1} ---\n{text}"
-
-            doc.close()
-            return text_content
+            from pdf_documents import get_document_cache
+            from page_stream import iter_text_pages
+            # Open the document up front so an unreadable PDF fails here
+            get_document_cache().page_count(pdf_path)
+            return iter_text_pages(pdf_path)
 
         except Exception as e:
             print(f"PyMuPDF extraction failed: {e}")
@@ -267,7 +243,11 @@ else:
             return []
 
         print(f"\nUsing extraction method: {method_used}")
-        print(f"Extracted content length: {len(extracted_content)} characters")
+        if isinstance(extracted_content, str):
+            print(f"Extracted content length: {len(extracted_content)} characters")
+            # MCP servers return the whole document as one block
+            from page_stream import page_record
+            extracted_content = [page_record(None, method_used, extracted_content)]
 
         # Process the extracted content
         problems = self.process_text_content(extracted_content, pdf_path, method_used)
@@ -275,27 +255,29 @@ else:
 
         return problems
 
-    def process_text_content(self, text_content, source_file, method):
-        """Process extracted text to find math problems"""
+    def process_text_content(self, pages, source_file, method):
+        """Process a stream of page records to find math problems"""
         problems = []
-
-        # Clean the text
-        cleaned_text = self.clean_text(text_content)
-
-        # Split into potential problems
-        # Look for problem number patterns
-        problem_sections = re.split(r'(?:[①②③④⑤⑥⑦⑧⑨⑩]|[1-9]+[\.、])', cleaned_text)
-
-        for i, section in enumerate(problem_sections[1:], 1):  # Skip first empty split
-            section = section.strip()
-            if len(section) > 20 and self.is_math_problem(section):
-                problem = self.extract_problem_structure(section)
-                problem["source"] = f"{source_file} (Method: {method})"
-                problem["id"] = f"{Path(source_file).stem}_{method}_{i}"
-                problem["extraction_method"] = method
-
-                if problem["stem"]:  # Only add if we have a valid stem
-                    problems.append(problem)
+        i = 0
+
+        # Clean the text; a problem cut by a page break is held back and joined with the top of the next page
+        cleaned_pages = ((record["page"], self.clean_text(record["text"])) for record in pages)
+        for page, cleaned_text in stitch_pages(cleaned_pages, section_markers()):
+            # Split into potential problems
+            # Look for problem number patterns
+            problem_sections = split_sections(cleaned_text)
+
+            for section in problem_sections[1:]:  # Skip text before the first number
+                i += 1
+                section = section.strip()
+                if len(section) > 20 and self.is_math_problem(section):
+                    problem = self.extract_problem_structure(section)
+                    problem["source"] = f"{source_file} (Method: {method})"
+                    problem["id"] = f"{Path(source_file).stem}_{method}_{i}"
+                    problem["extraction_method"] = method
+
+                    if problem["stem"]:  # Only add if we have a valid stem
+                        problems.append(problem)
 
         return problems
 
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Content-addressed OCR Result Cache
+Stores raw OCR text, word confidences and word records on disk, keyed by
+(PDF content hash, page index, zoom, lang, psm, oem, render mode), with LRU eviction
+
+Usage:
+    python ocr_cache.py stats
+    python ocr_cache.py list [--pdf HASH] [--limit N]
+    python ocr_cache.py prune [--max-mb N] [--older-than-days D] [--pdf HASH]
+    python ocr_cache.py clear
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from ocr_words import OCRWords
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'mathlearning-ocr')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Inserts between exact size checks, to catch writes from other processes sharing the file
+PRUNE_INTERVAL = 256
+# Eviction from put() trims to this fraction of the bound, so it is not repeated on every insert
+PRUNE_LOW_WATER = 0.9
+
+_TABLE_COLUMNS = ['pdf_hash', 'page_index', 'zoom', 'lang', 'psm', 'oem', 'mode', 'text', 'confidences',
+                  'words', 'size', 'created', 'last_access']
+
+# Memoized content hashes, keyed by (path, size, mtime)
+_pdf_hashes = {}
+
+def pdf_content_hash(pdf_path):
+    """Return the SHA-256 of a PDF's bytes, computed once per file version"""
+    stat = os.stat(pdf_path)
+    memo_key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime)
+
+    digest = _pdf_hashes.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _pdf_hashes[memo_key] = digest
+
+    return digest
+
+def cache_key(pdf_path, page_index, zoom, lang, psm, oem, mode='gray'):
+    """Build the cache key for one OCR run over one page"""
+    return (pdf_content_hash(pdf_path), page_index, float(zoom), lang, psm, oem, mode)
+
+class OCRCache:
+    """SQLite-backed OCR result store with size-bounded LRU eviction"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get('OCR_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.db_path = os.path.join(self.cache_dir, 'ocr_cache.sqlite3')
+        self._lock = threading.Lock()
+        # Page workers in other processes share the file, so wait on their locks
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(ocr_results)')]
+        if columns and columns != _TABLE_COLUMNS:
+            # Written by an older version with a different key or payload
+            self._conn.execute('DROP TABLE ocr_results')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                pdf_hash TEXT NOT NULL,
+                page_index INTEGER NOT NULL,
+                zoom REAL NOT NULL,
+                lang TEXT NOT NULL,
+                psm INTEGER NOT NULL,
+                oem INTEGER NOT NULL,
+                mode TEXT NOT NULL,
+                text TEXT NOT NULL,
+                confidences TEXT NOT NULL,
+                words BLOB,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (pdf_hash, page_index, zoom, lang, psm, oem, mode)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON ocr_results (last_access)')
+        self._conn.commit()
+
+        # Running size estimate, so put() only sums the table when the bound may be crossed.
+        # Replaced rows are counted twice, which errs towards pruning early.
+        self._estimated_bytes = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM ocr_results').fetchone()[0]
+        self._puts_since_prune = 0
+
+    def get(self, key):
+        """Return {'text', 'confidences', 'words'} for a key, or None on a miss
+
+        words is an OCRWords, or None when the result was stored without them.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT text, confidences, words FROM ocr_results WHERE pdf_hash=? AND page_index=? '
+                'AND zoom=? AND lang=? AND psm=? AND oem=? AND mode=?', key).fetchone()
+            if row is None:
+                return None
+
+            self._conn.execute(
+                'UPDATE ocr_results SET last_access=? WHERE pdf_hash=? AND page_index=? '
+                'AND zoom=? AND lang=? AND psm=? AND oem=? AND mode=?', (time.time(),) + tuple(key))
+            self._conn.commit()
+
+        return {"text": row[0], "confidences": json.loads(row[1]),
+                "words": OCRWords.from_bytes(row[2]) if row[2] else None}
+
+    def contains(self, key):
+        """Check for a key without touching its access time"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM ocr_results WHERE pdf_hash=? AND page_index=? '
+                'AND zoom=? AND lang=? AND psm=? AND oem=? AND mode=?', key).fetchone()
+        return row is not None
+
+    def put(self, key, text, confidences=None, words=None):
+        """Store an OCR result and evict least recently used entries over the size bound
+
+        When words (an OCRWords) is given, the confidences are taken from it.
+        The bound is enforced when the running size estimate crosses it, and
+        checked exactly every PRUNE_INTERVAL inserts; eviction then trims to
+        PRUNE_LOW_WATER of it.
+        """
+        if words is not None:
+            confidences = words.conf.tolist()
+        confidences_json = json.dumps(confidences or [])
+        words_blob = words.to_bytes() if words is not None else None
+        size = len(text.encode('utf-8')) + len(confidences_json) + len(words_blob or b'')
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO ocr_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                tuple(key) + (text, confidences_json, words_blob, size, now, now))
+            self._conn.commit()
+            self._estimated_bytes += size
+            self._puts_since_prune += 1
+            due = self._estimated_bytes > (self.max_bytes or 0) or self._puts_since_prune >= PRUNE_INTERVAL
+
+        if self.max_bytes and due:
+            total = self.total_bytes()
+            if total > self.max_bytes:
+                self.prune(max_bytes=int(self.max_bytes * PRUNE_LOW_WATER))
+            else:
+                with self._lock:
+                    self._estimated_bytes = total
+                    self._puts_since_prune = 0
+
+    def total_bytes(self):
+        """Total stored payload size in bytes"""
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM ocr_results').fetchone()[0]
+
+    def prune(self, max_bytes=None, older_than_days=None, pdf_hash=None):
+        """Remove entries by document, age, then LRU order down to max_bytes; returns count removed"""
+        removed = 0
+
+        with self._lock:
+            if pdf_hash:
+                removed += self._conn.execute(
+                    'DELETE FROM ocr_results WHERE pdf_hash=?', (pdf_hash,)).rowcount
+
+            if older_than_days is not None:
+                cutoff = time.time() - older_than_days * 86400
+                removed += self._conn.execute(
+                    'DELETE FROM ocr_results WHERE last_access < ?', (cutoff,)).rowcount
+
+            if max_bytes is not None:
+                total = self._conn.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM ocr_results').fetchone()[0]
+                if total > max_bytes:
+                    victims = []
+                    for rowid, size in self._conn.execute(
+                            'SELECT rowid, size FROM ocr_results ORDER BY last_access'):
+                        if total <= max_bytes:
+                            break
+                        victims.append((rowid,))
+                        total -= size
+                    self._conn.executemany('DELETE FROM ocr_results WHERE rowid=?', victims)
+                    removed += len(victims)
+
+            self._conn.commit()
+            if max_bytes is not None:
+                self._estimated_bytes = total
+            else:
+                self._estimated_bytes = self._conn.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM ocr_results').fetchone()[0]
+            self._puts_since_prune = 0
+
+        return removed
+
+    def clear(self):
+        """Remove every cached result"""
+        with self._lock:
+            self._conn.execute('DELETE FROM ocr_results')
+            self._conn.commit()
+            self._conn.execute('VACUUM')
+            self._estimated_bytes = 0
+
+    def stats(self):
+        """Summary counts for the cache"""
+        with self._lock:
+            entries, total, documents = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COUNT(DISTINCT pdf_hash) FROM ocr_results').fetchone()
+        return {
+            "path": self.db_path,
+            "entries": entries,
+            "documents": documents,
+            "bytes": total,
+            "max_bytes": self.max_bytes
+        }
+
+    def entries(self, pdf_hash=None, limit=50):
+        """List cached entries, most recently used first"""
+        query = ('SELECT pdf_hash, page_index, zoom, lang, psm, oem, mode, size, last_access '
+                 'FROM ocr_results')
+        params = ()
+        if pdf_hash:
+            query += ' WHERE pdf_hash=?'
+            params = (pdf_hash,)
+        query += ' ORDER BY last_access DESC LIMIT ?'
+
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+
+        return [dict(zip(["pdf_hash", "page_index", "zoom", "lang", "psm", "oem", "mode",
+                              "size", "last_access"], row))
+                for row in rows]
+
+# One cache connection per process; forked page workers must not reuse the parent's
+_shared_caches = {}
+
+def get_shared_cache():
+    """Return this process's shared OCR cache"""
+    cache = _shared_caches.get(os.getpid())
+    if cache is None:
+        cache = OCRCache()
+        _shared_caches[os.getpid()] = cache
+    return cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the OCR result cache")
+    parser.add_argument('--cache-dir', help="Cache directory (default: $OCR_CACHE_DIR or ~/.cache/mathlearning-ocr)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('stats', help="Show entry count and size")
+
+    list_parser = subparsers.add_parser('list', help="List cached pages, most recent first")
+    list_parser.add_argument('--pdf', help="Only entries for this PDF content hash")
+    list_parser.add_argument('--limit', type=int, default=50)
+
+    prune_parser = subparsers.add_parser('prune', help="Evict entries")
+    prune_parser.add_argument('--max-mb', type=float, help="Evict least recently used entries down to this size")
+    prune_parser.add_argument('--older-than-days', type=float, help="Evict entries not used for this many days")
+    prune_parser.add_argument('--pdf', help="Evict all entries for this PDF content hash")
+
+    subparsers.add_parser('clear', help="Remove every entry")
+
+    args = parser.parse_args()
+    cache = OCRCache(cache_dir=args.cache_dir, max_bytes=None)
+
+    if args.command == 'stats':
+        stats = cache.stats()
+        print(f"Cache: {stats['path']}")
+        print(f"Entries: {stats['entries']} across {stats['documents']} documents")
+        print(f"Size: {stats['bytes'] / (1024 * 1024):.1f} MB")
+
+    elif args.command == 'list':
+        for entry in cache.entries(pdf_hash=args.pdf, limit=args.limit):
+            last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_access']))
+            print(f"{entry['pdf_hash'][:12]}  page {entry['page_index'] + 1:>4}  zoom {entry['zoom']:g}  "
+                  f"{entry['lang']} psm {entry['psm']} oem {entry['oem']} {entry['mode']}  "
+                  f"{entry['size']:>8} B  {last_used}")
+
+    elif args.command == 'prune':
+        if args.max_mb is None and args.older_than_days is None and not args.pdf:
+            parser.error("prune needs --max-mb, --older-than-days or --pdf")
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+        removed = cache.prune(max_bytes=max_bytes, older_than_days=args.older_than_days, pdf_hash=args.pdf)
+        print(f"Removed {removed} entries")
+
+    elif args.command == 'clear':
+        cache.clear()
+        print("Cache cleared")
+
+if __name__ == "__main__":
+    main()
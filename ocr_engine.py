@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Shared OCR Engine Pool
+Long-lived OCR worker processes that load the tesseract language model once
+and serve page OCR jobs for every extractor
+"""
+
+import io
+import os
+import atexit
+import shutil
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, InvalidStateError
+from concurrent.futures.process import BrokenProcessPool
+from ocr_words import OCRWords
+
+# Prefer the in-process tesseract API so the traineddata is loaded once per worker
+try:
+    import tesserocr
+    from PIL import Image
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+OCR_AVAILABLE = TESSEROCR_AVAILABLE or shutil.which('tesseract') is not None
+
+DEFAULT_LANG = 'chi_sim+eng'
+DEFAULT_OEM = 3
+
+# Per-process engines, keyed by (lang, oem)
+_engines = {}
+
+def _get_engine(lang, oem):
+    """Return this process's engine for (lang, oem), loading the model on first use"""
+    engine = _engines.get((lang, oem))
+    if engine is None:
+        engine = tesserocr.PyTessBaseAPI(lang=lang, oem=tesserocr.OEM(oem))
+        _engines[(lang, oem)] = engine
+    return engine
+
+def _worker_context():
+    """Start method for the pool's workers: forkserver, or spawn where there is none
+
+    The pool is started, and restarted after a crash, by whichever thread
+    submits first, often a page pipeline stage thread. A plain fork there
+    would copy a multithreaded process, locks held by other threads
+    included; forkserver workers fork from a single-threaded server that
+    has this module (and the OCR libraries) already imported.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def _init_worker(lang, oem):
+    """Preload the default engine when a worker process starts"""
+    if TESSEROCR_AVAILABLE:
+        _get_engine(lang, oem)
+
+def _ocr_job(image, lang, psm, oem, confidences=False, words=False):
+    """OCR an image path or encoded image bytes
+
+    Returns the text, (text, word_confidences) when confidences is set, or
+    (text, OCRWords) when words is set.
+    """
+    is_bytes = isinstance(image, (bytes, bytearray, memoryview))
+    structured = confidences or words
+
+    if TESSEROCR_AVAILABLE:
+        engine = _get_engine(lang, oem)
+        engine.SetPageSegMode(tesserocr.PSM(psm))
+        if is_bytes:
+            engine.SetImage(Image.open(io.BytesIO(image)))
+        else:
+            engine.SetImageFile(image)
+        if not structured:
+            return engine.GetUTF8Text()
+        output = engine.GetTSVText(0)
+    else:
+        # Fallback: one tesseract process per job
+        cmd = [
+            'tesseract',
+            'stdin' if is_bytes else image,
+            'stdout',
+            '-l', lang,
+            '--oem', str(oem),
+            '--psm', str(psm)
+        ]
+        if structured:
+            cmd.append('tsv')
+
+        result = subprocess.run(cmd, input=bytes(image) if is_bytes else None, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip())
+        output = result.stdout.decode('utf-8', errors='replace')
+        if not structured:
+            return output
+
+    if output and not output.startswith('level'):
+        output = 'level\n' + output  # The API's TSV has no header row
+    word_records = OCRWords.from_tsv(output)
+    if words:
+        return word_records.text(), word_records
+    return word_records.text(), word_records.conf.tolist()
+
+class OCREnginePool:
+    """Pool of OCR worker processes with automatic restart of crashed workers
+
+    With workers=0 jobs run inline in the calling process, which still reuses
+    one loaded engine per process (used inside existing page-worker processes).
+    """
+
+    def __init__(self, workers=None, lang=DEFAULT_LANG, oem=DEFAULT_OEM, max_retries=2):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.lang = lang
+        self.oem = oem
+        self.max_retries = max_retries
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._generation = 0
+
+    def _current(self):
+        """Return the live executor and its generation, starting it if needed"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=_worker_context(),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.lang, self.oem))
+            return self._executor, self._generation
+
+    def _restart(self, generation):
+        """Replace a broken executor, once per generation"""
+        with self._lock:
+            if generation != self._generation:
+                return  # Another job already restarted it
+            print(f"OCR worker crashed, restarting pool (restart #{self.restarts + 1})")
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._generation += 1
+            self.restarts += 1
+
+    def submit(self, image, psm=6, lang=None, oem=None, confidences=False, words=False):
+        """Submit an OCR job and return a Future resolving to the text
+
+        With confidences=True the Future resolves to (text, word_confidences),
+        with words=True to (text, OCRWords).
+        """
+        job = (image, lang or self.lang, psm, self.oem if oem is None else oem, confidences, words)
+        result = Future()
+
+        if self.workers == 0:
+            try:
+                result.set_result(_ocr_job(*job))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+
+        self._dispatch(job, result, 0)
+        return result
+
+    def _dispatch(self, job, result, attempt):
+        """Send a job to the executor, resubmitting it if the pool breaks"""
+        executor, generation = self._current()
+
+        def retry_or_fail(error):
+            if attempt < self.max_retries:
+                self._restart(generation)
+                self._dispatch(job, result, attempt + 1)
+            else:
+                _settle(result, exception=error)
+
+        try:
+            inner = executor.submit(_ocr_job, *job)
+        except (BrokenProcessPool, RuntimeError) as e:
+            retry_or_fail(e)
+            return
+
+        def on_done(future):
+            if future.cancelled() or result.done():
+                return
+            try:
+                _settle(result, value=future.result())
+            except BrokenProcessPool as e:
+                retry_or_fail(e)
+            except Exception as e:
+                _settle(result, exception=e)
+
+        inner.add_done_callback(on_done)
+        # Cancelling the outer future drops the job if it has not started yet
+        result.add_done_callback(lambda r: inner.cancel() if r.cancelled() else None)
+
+    def ocr(self, image, psm=6, lang=None, oem=None, confidences=False, words=False):
+        """OCR an image and block until the text is available"""
+        return self.submit(image, psm=psm, lang=lang, oem=oem, confidences=confidences, words=words).result()
+
+    def shutdown(self):
+        """Stop all worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+def _settle(future, value=None, exception=None):
+    """Complete a future unless it was already cancelled"""
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(value)
+    except InvalidStateError:
+        pass
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+def get_shared_pool(workers=None):
+    """Return the process-wide OCR pool shared by all extractor classes"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = OCREnginePool(workers=workers)
+            atexit.register(_shared_pool.shutdown)
+        return _shared_pool
@@ -7,58 +7,59 @@ import os
 import sys
 import json
 import re
+import time
+import argparse
 from pathlib import Path
 
 # Add the virtual environment path
 sys.path.insert(0, './pdf_env/lib/python3.13/site-packages')
 
 import fitz  # PyMuPDF
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE
+from page_stream import page_record
+from page_fusion import PageFusion
+from page_segmenter import DEFAULT_PAGE_BUDGET, PageBudget, segment_page
+from page_stitcher import PageStitcher, family_markers
+from problem_patterns import collapse_whitespace, is_math_problem, labelled_value, strip_solution
+from checkpoint_journal import CheckpointJournal, default_journal_path
+from shard_results import add_shard_arguments, merge_shards, shard_pages, shard_path, write_shard
 import PyPDF2
 
-# Try to import OCR libraries
-try:
-    import pytesseract
-    from PIL import Image
-    import io
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
-    print("Warning: OCR libraries not available. Install with: pip install pytesseract pillow")
+# OCR runs on the shared tesseract engine pool
+from ocr_engine import OCR_AVAILABLE, get_shared_pool
+
+if not OCR_AVAILABLE:
+    print("Warning: OCR engine not available. Install tesseract (and optionally tesserocr)")
 
 class OCRMathProblemExtractor:
-    def __init__(self):
+    FAMILIES = ("circled", "numbered", "question")
+
+    def __init__(self, ocr_pool=None, render_mode=None, journal=None, page_budget=DEFAULT_PAGE_BUDGET,
+                 shard_edges=False):
         self.extracted_problems = []
         self.current_problem = {}
+        self.ocr_pool = ocr_pool or get_shared_pool()
+        # 'rgb', 'gray' or 'bilevel' page images (see page_render)
+        self.render_mode = render_mode or DEFAULT_RENDER_MODE
+        # Whole scanned pages are read at zoom 1 with automatic page segmentation
+        self.fusion = PageFusion(self.ocr_pool, zoom=1, psm=3, render_mode=self.render_mode)
+        # Optional CheckpointJournal: finished pages are recorded and skipped on resume
+        self.journal = journal
+        # Seconds of segmentation allowed per page
+        self.page_budget = page_budget
+        # A shard run leaves the spans at the edges of its pages to the shard merge (see shard_results)
+        self.shard_edges = shard_edges
 
     def clean_text(self, text):
         """Clean OCR-extracted text"""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        # Fix common OCR errors in Chinese math text
-        text = re.sub(r'[\u3000]+', ' ', text)  # Remove full-width spaces
-        return text
+        # Remove excessive whitespace (full-width spaces included)
+        return collapse_whitespace(text)
 
     def is_math_problem(self, text):
         """Check if text looks like a math problem"""
-        math_indicators = [
-            r'\d+\s*[＋+\-×÷]\s*\d+',  # Basic operations
-            r'解.*?题',  # Solve problem
-            r'计算.*?式',  # Calculate expression
-            r'求.*?值',  # Find value
-            r'应用题',  # Word problem
-            r'选择题',  # Multiple choice
-            r'填空题',  # Fill in blank
-            r'判断题',  # True/False
-            r'[①②③④⑤⑥⑦⑧⑨⑩]',  # Problem numbers
-            r'[1-9]\.\s*',  # Numbered problems
-            r'千克|克|米|厘米|分钟|小时',  # Units
-            r'苹果|书|学生|班级|学校',  # Common math problem subjects
-        ]
-
-        for pattern in math_indicators:
-            if re.search(pattern, text):
-                return True
-        return False
+        # Units and common subjects count too, OCR'd pages often lose the numbering
+        return is_math_problem(text, context=True)
 
     def extract_problem_structure(self, text):
         """Extract structured problem from OCR text"""
@@ -83,21 +84,13 @@ class OCRMathProblemExtractor:
 
         # Extract problem stem
         # Remove answer/solution indicators
-        stem = re.sub(r'答案[:：].*?$', '', text, flags=re.MULTILINE)
-        stem = re.sub(r'答[:：].*?$', '', stem, flags=re.MULTILINE)
-        stem = re.sub(r'解[:：].*?$', '', stem, flags=re.MULTILINE)
-        stem = re.sub(r'解析[:：].*?$', '', stem, flags=re.MULTILINE)
-        problem["stem"] = stem.strip()
+        problem["stem"] = strip_solution(text).strip()
 
         # Extract answer
-        answer_match = re.search(r'答案[:：]\s*(.*?)(?:\n|$)', text)
-        if answer_match:
-            problem["answer"] = answer_match.group(1).strip()
+        problem["answer"] = labelled_value("answer", text)
 
         # Extract analysis
-        analysis_match = re.search(r'解析[:：]\s*(.*?)(?:\n|$)', text)
-        if analysis_match:
-            problem["analysis"] = analysis_match.group(1).strip()
+        problem["analysis"] = labelled_value("analysis", text)
 
         # Determine difficulty
         stem_length = len(problem["stem"])
@@ -118,83 +111,131 @@ class OCRMathProblemExtractor:
 
         return problem
 
-    def extract_text_with_ocr(self, pdf_path):
-        """Extract text using OCR for scanned PDFs"""
-        try:
-            doc = fitz.open(pdf_path)
-            text_content = ""
+    def iter_pages_with_ocr(self, pdf_path, pages=None):
+        """Yield a text record per page, using OCR for the parts of a page that are scanned
 
-            for page_num in range(len(doc)):
-                page = doc[page_num]
+        Text-layer blocks are used as they are and only images without text
+        coverage are OCR'd (see page_fusion). The shared document is only
+        locked while a page is being read or rendered. Pages finished in an
+        earlier run are not read again; their records carry the journaled
+        "problems" instead. An explicit page index list (e.g. one shard's
+        pages) limits the pages read.
+        """
+        documents = get_document_cache()
+        finished = self.journal.finished(pdf_path) if self.journal else {}
 
-                # First try regular text extraction
-                text = page.get_text()
-                if len(text.strip()) > 50:  # If we have meaningful text
-                    text_content += f"\n--- Page {page_num + 1} ---\n{text}"
-                    continue
+        try:
+            total_pages = documents.page_count(pdf_path)
+            if pages is None:
+                pages = range(total_pages)
 
-                # If no text, use OCR
-                if OCR_AVAILABLE:
-                    print(f"  Using OCR for page {page_num + 1}")
-                    # Get page as image
-                    pix = page.get_pixmap()
-                    img_data = pix.tobytes("ppm")
-                    img = Image.open(io.BytesIO(img_data))
+            for page_num in pages:
+                if not 0 <= page_num < total_pages:
+                    continue
+                if page_num + 1 in finished:
+                    record = page_record(page_num + 1, "journal", "")
+                    record["problems"] = finished[page_num + 1]
+                    record["held"] = self.journal.held(pdf_path, page_num + 1)
+                    yield record
+                    continue
 
-                    # Use Tesseract OCR
-                    ocr_text = pytesseract.image_to_string(img, lang='chi_sim+eng')
-                    text_content += f"\n--- Page {page_num + 1} (OCR) ---\n{ocr_text}"
+                if not OCR_AVAILABLE:
+                    start = time.time()
+                    with documents.page(pdf_path, page_num) as page:
+                        text = page.get_text()
+                    yield page_record(page_num + 1, "text", text, extract=time.time() - start)
+                    continue
 
-            doc.close()
-            return text_content
+                text, stats = self.fusion.read_page(pdf_path, page_num)
+                if stats["method"] != "text":
+                    print(f"  Using OCR for {stats['ocr_blocks']} block(s) of page {page_num + 1} "
+                          f"({stats['pixel_ratio']:.0%} of the page)")
+                yield page_record(page_num + 1, stats["method"], text, **stats["timings"])
 
         except Exception as e:
             print(f"Error in OCR extraction: {e}")
-            return ""
 
-    def process_text_content(self, text_content, source_file):
-        """Process extracted text to find math problems"""
+    def segment_problems(self, text, page, source_file, budget, kind="ocr", first_number=1):
+        """Problems between circled, numbered and 第N题 markers of one page's text, in linear time"""
         problems = []
+        for family, marker, problem_text in segment_page(text, self.FAMILIES, budget):
+            problem_text = problem_text.strip()
+            if len(problem_text) > 20 and self.is_math_problem(problem_text):
+                problem = self.extract_problem_structure(problem_text)
+                problem["source"] = f"{source_file} (Page {page})"
+                problem["id"] = f"{Path(source_file).stem}_page{page}_{kind}{first_number + len(problems)}"
+                problem["extraction_method"] = "ocr_markdown_style"
+                problem["page_number"] = page
+
+                if problem["stem"]:
+                    problems.append(problem)
+        return problems
 
-        # Clean the text
-        cleaned_text = self.clean_text(text_content)
-
-        # Split into pages
-        pages = cleaned_text.split('--- Page')
-
-        for i, page_content in enumerate(pages[1:], 1):
-            page_text = page_content.strip()
-
-            # Remove page number indicators
-            page_text = re.sub(r'^\s*\d+\s*\(OCR\)\s*---', '', page_text, flags=re.MULTILINE)
-            page_text = re.sub(r'^\s*\d+\s*---', '', page_text, flags=re.MULTILINE)
-
-            # Look for problem patterns
-            problem_patterns = [
-                r'([①②③④⑤⑥⑦⑧⑨⑩])\s*(.*?)(?=[①②③④⑤⑥⑦⑧⑨⑩]|$)',
-                r'([1-9]+[\.、])\s*(.*?)(?=[1-9]+[\.、]|$)',
-                r'(第[一二三四五六七八九十\d]+题)\s*(.*?)(?=第[一二三四五六七八九十\d]+题|$)',
-            ]
-
-            found_problems = False
-            for pattern in problem_patterns:
-                matches = re.findall(pattern, page_text, re.DOTALL)
-                for match in matches:
-                    if len(match) >= 2:
-                        problem_text = match[1].strip()
-                        if len(problem_text) > 20 and self.is_math_problem(problem_text):
-                            problem = self.extract_problem_structure(problem_text)
-                            problem["source"] = f"{source_file} (Page {i})"
-                            problem["id"] = f"{Path(source_file).stem}_page{i}_ocr{len(problems)+1}"
-                            problem["extraction_method"] = "ocr_markdown_style"
-                            problem["page_number"] = i
-
-                            if problem["stem"]:
-                                problems.append(problem)
-                                found_problems = True
-
+    def finish_held_span(self, stitcher, holder, problems, source_file):
+        """Segment the span still held, on its own
+
+        holder is (page number, problems) of the page the span was journaled
+        with; that page is journaled again with the span's problems added
+        and nothing held.
+        """
+        held = stitcher.flush()
+        if not held:
+            return
+        held_problems = self.segment_problems(held[1], held[0], source_file, PageBudget(self.page_budget), "end")
+        problems.extend(held_problems)
+        if self.journal:
+            self.journal.record(source_file, holder[0], holder[1] + held_problems)
+
+    def segment_span(self, source_file, page, text, page_problems):
+        """Problems of a span cut at a shard edge, numbered after the page's problems (for merge_shards)"""
+        prefix = f"{Path(source_file).stem}_page{page}_end"
+        first_number = 1 + sum(1 for problem in page_problems if problem["id"].startswith(prefix))
+        return self.segment_problems(text, page, source_file, PageBudget(self.page_budget), "end", first_number)
+
+    def process_pages(self, pages, source_file):
+        """Find math problems in a stream of page records"""
+        problems = []
+        page_count = 0
+        char_count = 0
+        # A problem cut by a page break is held back and joined with the top of the next page
+        stitcher = PageStitcher(family_markers(self.FAMILIES))
+        # (page number, journaled problems, restored from the journal) of the page the held span was journaled with
+        holder = None
+
+        for record in pages:
+            i = record["page"]
+            if self.shard_edges and stitcher.lead_page is None:
+                stitcher.lead_page = i
+            if "problems" in record:
+                # Finished in an earlier run: replay from the journal. A span held from a page read
+                # in this run was never joined with this page, so it is finished on its own; one
+                # restored from the journal was, and is already part of this page's problems.
+                if holder and not holder[2]:
+                    self.finish_held_span(stitcher, holder, problems, source_file)
+                problems.extend(record["problems"])
+                # The span that run held back after this page carries on to the next page read
+                stitcher.held = record.get("held")
+                holder = (i, record["problems"], True)
+                continue
+
+            page_start = len(problems)
+            carried, page_text = stitcher.feed(i, self.clean_text(record["text"]))
+            page_count += 1
+            char_count += len(record["text"])
+
+            budget = PageBudget(self.page_budget)
+            if carried:
+                # The previous page's last problem, reported on the page it starts on
+                problems.extend(self.segment_problems(carried[1], carried[0], source_file, budget, "end"))
+            own_start = len(problems)
+            problems.extend(self.segment_problems(page_text, i, source_file, budget))
+            # A held last problem counts too, it is segmented with the next page
+            found_problems = len(problems) > own_start or stitcher.held is not None
+
+            if budget.expired():
+                print(f"  Page {i}: segmentation stopped at the {budget.seconds}s page budget")
             # If no structured problems found, look for math content
-            if not found_problems:
+            elif not found_problems:
                 # Split by sentences and look for math content
                 sentences = re.split(r'[。！？]', page_text)
                 for sentence in sentences:
@@ -202,31 +243,39 @@ class OCRMathProblemExtractor:
                     if len(sentence) > 30 and self.is_math_problem(sentence):
                         problem = self.extract_problem_structure(sentence)
                         problem["source"] = f"{source_file} (Page {i})"
-                        problem["id"] = f"{Path(source_file).stem}_page{i}_sentence{len(problems)+1}"
+                        problem["id"] = f"{Path(source_file).stem}_page{i}_sentence{len(problems) - own_start + 1}"
                         problem["extraction_method"] = "ocr_sentence"
                         problem["page_number"] = i
 
                         if problem["stem"]:
                             problems.append(problem)
 
+            # The held span is journaled with the page, so a resumed run can still join it with the next one
+            if self.journal:
+                self.journal.record(source_file, i, problems[page_start:], held=stitcher.held,
+                                    lead=stitcher.pop_lead())
+            holder = (i, problems[page_start:], False)
+
+        if holder and not self.shard_edges:
+            self.finish_held_span(stitcher, holder, problems, source_file)
+
+        if page_count:
+            print(f"Extracted {char_count} characters of text from {page_count} pages")
+        else:
+            print("No content extracted")
+
         return problems
 
-    def extract_from_pdf(self, pdf_path):
-        """Extract math problems from PDF using OCR"""
+    def extract_from_pdf(self, pdf_path, pages=None):
+        """Extract math problems from PDF using OCR (all pages, or an explicit page index list)"""
         print(f"Processing PDF: {pdf_path}")
 
         if not OCR_AVAILABLE:
             print("OCR not available, skipping scanned PDFs")
             return []
 
-        text_content = self.extract_text_with_ocr(pdf_path)
-        if not text_content:
-            print("No content extracted")
-            return []
-
-        print(f"Extracted {len(text_content)} characters of text")
-
-        problems = self.process_text_content(text_content, pdf_path)
+        # Pages are extracted, OCR'd and segmented one at a time
+        problems = self.process_pages(self.iter_pages_with_ocr(pdf_path, pages), pdf_path)
         print(f"Found {len(problems)} problems")
         return problems
 
@@ -237,24 +286,50 @@ def main():
         "/Users/tywg001/Downloads/mathlearning/aoshu/第二十二届华罗庚金杯少年数学邀请赛 决赛试题参考答案 （小学中年级组）.pdf"
     ]
 
-    extractor = OCRMathProblemExtractor()
-    all_problems = []
+    parser = argparse.ArgumentParser(description="Extract math problems from PDFs with OCR")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip pages an interrupted run already finished (from its checkpoint journal)")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
 
-    print(f"{'='*80}")
-    print("OCR-BASED PDF EXTRACTION FOR MATH PROBLEMS")
-    print(f"{'='*80}")
+    output_file = "/Users/tywg001/Downloads/mathlearning/ocr_extracted_problems.json"
 
-    for pdf_file in pdf_files:
-        if os.path.exists(pdf_file):
-            print(f"\nProcessing: {pdf_file}")
-            problems = extractor.extract_from_pdf(pdf_file)
-            all_problems.extend(problems)
-            print(f"Extracted {len(problems)} problems from {Path(pdf_file).name}")
-        else:
-            print(f"File not found: {pdf_file}")
+    if args.merge:
+        try:
+            all_problems = merge_shards(output_file, OCRMathProblemExtractor().segment_span)
+        except ValueError as e:
+            print(f"Cannot merge shards: {e}")
+            return
+    else:
+        run_file = shard_path(output_file, args.shard) if args.shard else output_file
+        journal = CheckpointJournal(default_journal_path(run_file), resume=args.resume)
+        extractor = OCRMathProblemExtractor(journal=journal, shard_edges=bool(args.shard))
+        all_problems = []
+        assigned = {}
+
+        print(f"{'='*80}")
+        print("OCR-BASED PDF EXTRACTION FOR MATH PROBLEMS")
+        print(f"{'='*80}")
+
+        for pdf_file in pdf_files:
+            if os.path.exists(pdf_file):
+                print(f"\nProcessing: {pdf_file}")
+                pages = shard_pages(range(get_document_cache().page_count(pdf_file)), args.shard)
+                assigned[pdf_file] = [page_num + 1 for page_num in pages]
+                problems = extractor.extract_from_pdf(pdf_file, pages)
+                all_problems.extend(problems)
+                print(f"Extracted {len(problems)} problems from {Path(pdf_file).name}")
+            else:
+                assigned[pdf_file] = []
+                print(f"File not found: {pdf_file}")
+
+        if args.shard:
+            write_shard(output_file, args.shard, assigned, journal)
+            journal.close()
+            return
+        journal.close()
 
     # Save results
-    output_file = "/Users/tywg001/Downloads/mathlearning/ocr_extracted_problems.json"
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(all_problems, f, ensure_ascii=False, indent=2)
 
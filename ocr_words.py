@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Word-level OCR Results
+Column-oriented storage for tesseract word records (bounding box, confidence,
+block/paragraph/line ids and text) backed by typed arrays instead of one
+dict per word
+"""
+
+import struct
+from array import array
+from bisect import bisect_right
+
+# (attribute, array typecode) for every numeric column, in serialization order
+_COLUMNS = (
+    ('left', 'i'),
+    ('top', 'i'),
+    ('width', 'i'),
+    ('height', 'i'),
+    ('conf', 'b'),     # -1..100
+    ('block', 'H'),
+    ('par', 'H'),
+    ('line', 'H'),
+    ('ends', 'I')      # End offset of each word in text_data
+)
+
+_HEADER = struct.Struct('<II')
+
+class OCRWords:
+    """Word records of one OCR run"""
+
+    def __init__(self):
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode))
+        self._text_parts = ['']  # Word texts appended since text_data was last joined
+        self._offsets = None
+
+    @property
+    def text_data(self):
+        """All word texts back to back, joined once after a run of appends"""
+        if len(self._text_parts) > 1:
+            self._text_parts = [''.join(self._text_parts)]
+        return self._text_parts[0]
+
+    @text_data.setter
+    def text_data(self, value):
+        self._text_parts = [value]
+
+    @classmethod
+    def from_tsv(cls, tsv):
+        """Parse tesseract TSV output, keeping word-level rows"""
+        words = cls()
+        texts = []
+        end = 0
+
+        for row in tsv.splitlines()[1:]:
+            fields = row.split('\t')
+            if len(fields) < 12 or fields[0] != '5' or not fields[11]:
+                continue  # Only word-level rows carry text
+
+            words.block.append(int(fields[2]))
+            words.par.append(int(fields[3]))
+            words.line.append(int(fields[4]))
+            words.left.append(int(fields[6]))
+            words.top.append(int(fields[7]))
+            words.width.append(int(fields[8]))
+            words.height.append(int(fields[9]))
+            words.conf.append(max(-1, min(100, int(float(fields[10])))))
+            texts.append(fields[11])
+            end += len(fields[11])
+            words.ends.append(end)
+
+        words.text_data = ''.join(texts)
+        return words
+
+    def append(self, text, bbox, conf, line_id):
+        """Add one word; bbox is (left, top, width, height), line_id (block, par, line)"""
+        for name, value in zip(('left', 'top', 'width', 'height', 'conf', 'block', 'par', 'line'),
+                               tuple(bbox) + (conf,) + tuple(line_id)):
+            getattr(self, name).append(value)
+        self._text_parts.append(text)
+        self.ends.append((self.ends[-1] if self.ends else 0) + len(text))
+        self._offsets = None
+
+    def __len__(self):
+        return len(self.ends)
+
+    def word(self, index):
+        """Text of one word"""
+        start = self.ends[index - 1] if index else 0
+        return self.text_data[start:self.ends[index]]
+
+    def bbox(self, index):
+        """(left, top, width, height) of one word in image pixels"""
+        return self.left[index], self.top[index], self.width[index], self.height[index]
+
+    def line_id(self, index):
+        """(block, paragraph, line) ids of one word"""
+        return self.block[index], self.par[index], self.line[index]
+
+    def lines(self):
+        """Yield (start, end) word index ranges of each text line"""
+        start = 0
+        for index in range(1, len(self) + 1):
+            if index == len(self) or self.line_id(index) != self.line_id(start):
+                yield start, index
+                start = index
+
+    def line_bbox(self, start, end):
+        """(x0, y0, x1, y1) enclosing words[start:end]"""
+        return (min(self.left[start:end]), min(self.top[start:end]),
+                max(left + width for left, width in zip(self.left[start:end], self.width[start:end])),
+                max(top + height for top, height in zip(self.top[start:end], self.height[start:end])))
+
+    def text(self):
+        """Plain text with one line per OCR line and a blank line between blocks
+
+        Also records where each word starts in the returned text, for
+        span_confidence.
+        """
+        parts = []
+        offsets = array('I')
+        position = 0
+        previous = None
+
+        for start, end in self.lines():
+            if previous is not None:
+                separator = '\n\n' if self.block[start] != previous else '\n'
+                parts.append(separator)
+                position += len(separator)
+            previous = self.block[start]
+
+            for index in range(start, end):
+                if index > start:
+                    parts.append(' ')
+                    position += 1
+                word = self.word(index)
+                offsets.append(position)
+                parts.append(word)
+                position += len(word)
+
+        self._offsets = offsets
+        return ''.join(parts) + '\n' if parts else ''
+
+    def mean_confidence(self, start=0, end=None):
+        """Mean confidence of words[start:end], or None when there are none"""
+        values = [value for value in self.conf[start:end] if value >= 0]
+        return sum(values) / len(values) if values else None
+
+    def confident_chars(self):
+        """Character count weighted by each word's confidence (0-100 -> 0-1)"""
+        total = 0
+        start = 0
+        for end, value in zip(self.ends, self.conf):
+            if value > 0:
+                total += (end - start) * value
+            start = end
+        return total / 100
+
+    def span_confidence(self, start_char, end_char):
+        """Mean confidence of the words starting within a character span of text()"""
+        if self._offsets is None:
+            self.text()
+        first = bisect_right(self._offsets, start_char - 1)
+        last = bisect_right(self._offsets, end_char - 1)
+        return self.mean_confidence(first, last)
+
+    def filtered(self, min_confidence):
+        """Copy keeping only words with confidence >= min_confidence"""
+        kept = OCRWords()
+        texts = []
+        end = 0
+
+        for index in range(len(self)):
+            if self.conf[index] < min_confidence:
+                continue
+            for name, typecode in _COLUMNS[:-1]:
+                getattr(kept, name).append(getattr(self, name)[index])
+            word = self.word(index)
+            texts.append(word)
+            end += len(word)
+            kept.ends.append(end)
+
+        kept.text_data = ''.join(texts)
+        return kept
+
+    def to_bytes(self):
+        """Serialize for the OCR cache (native byte order)"""
+        text = self.text_data.encode('utf-8')
+        return b''.join([_HEADER.pack(len(self), len(text))] +
+                        [getattr(self, name).tobytes() for name, typecode in _COLUMNS] +
+                        [text])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild word records serialized with to_bytes"""
+        words = cls()
+        count, text_length = _HEADER.unpack_from(data)
+        position = _HEADER.size
+
+        for name, typecode in _COLUMNS:
+            column = getattr(words, name)
+            size = count * column.itemsize
+            column.frombytes(data[position:position + size])
+            position += size
+
+        words.text_data = data[position:position + text_length].decode('utf-8')
+        return words
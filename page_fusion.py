@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Block-level Text Layer / OCR Fusion
+Reads a page from its text layer and OCRs only the images the text layer
+does not cover, so a page with a printed header over a scanned body is
+complete without OCRing the whole page
+
+Pages with no text layer at all are OCR'd whole (the embedded scan when
+there is one), and fully digital pages are never rendered.
+"""
+
+import time
+import fitz  # PyMuPDF
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE, encode_pixmap, page_image
+
+class PageFusion:
+    def __init__(self, ocr_pool, zoom=1, block_zoom=2, psm=3, block_psm=6, lang='chi_sim+eng',
+                 render_mode=None, min_coverage=0.15, min_image_area=0.02):
+        self.ocr_pool = ocr_pool
+        # Whole pages without a text layer are OCR'd at zoom with psm, image blocks at block_zoom with block_psm
+        self.zoom = zoom
+        self.block_zoom = block_zoom
+        self.psm = psm
+        self.block_psm = block_psm
+        self.lang = lang
+        self.render_mode = render_mode or DEFAULT_RENDER_MODE
+        # An image whose area is covered by text lines at least this much already has its text
+        self.min_coverage = min_coverage
+        # Images smaller than this fraction of the page (icons, bullets, rules) are never OCR'd
+        self.min_image_area = min_image_area
+
+    def text_blocks(self, page):
+        """Return [(rect, text, line_rects)] for the text blocks of the text layer"""
+        flags = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES  # Image data is not needed here
+        blocks = []
+
+        for block in page.get_text('dict', flags=flags)["blocks"]:
+            lines = []
+            line_rects = []
+            for line in block.get("lines", []):
+                text = ''.join(span["text"] for span in line["spans"])
+                if text.strip():
+                    lines.append(text)
+                    line_rects.append(fitz.Rect(line["bbox"]))
+            if lines:
+                blocks.append((fitz.Rect(block["bbox"]), '\n'.join(lines), line_rects))
+
+        return blocks
+
+    def uncovered_images(self, page, blocks):
+        """Return rects of images big enough to matter that carry no text-layer text"""
+        page_area = abs(page.rect) or 1
+        line_rects = [rect for block in blocks for rect in block[2]]
+        images = []
+
+        for info in page.get_image_info():
+            rect = fitz.Rect(info["bbox"]) & page.rect
+            if rect.is_empty or abs(rect) < self.min_image_area * page_area:
+                continue
+            covered = sum(abs(line & rect) for line in line_rects)
+            if covered < self.min_coverage * abs(rect):
+                if not any(abs(rect & other) > 0.9 * abs(rect) for other in images):
+                    images.append(rect)
+
+        return images
+
+    def read_page(self, pdf_path, page_index):
+        """Return (text, stats) for one page
+
+        stats has "method" ("text", "hybrid" or "ocr"), "ocr_blocks",
+        "pixel_ratio" (OCR'd area relative to the whole page)
+        and per-stage "timings".
+        """
+        start = time.time()
+        with get_document_cache().page(pdf_path, page_index) as page:
+            blocks = self.text_blocks(page)
+            extract_time = time.time() - start
+
+            start = time.time()
+            if not blocks:
+                image, ext, method = page_image(page, self.zoom, self.render_mode)
+                clips = None
+            else:
+                images = self.uncovered_images(page, blocks)
+                page_rect = page.rect
+                matrix = fitz.Matrix(self.block_zoom, self.block_zoom)
+                colorspace = fitz.csRGB if self.render_mode == 'rgb' else fitz.csGRAY
+                clips = [(rect, encode_pixmap(page.get_pixmap(matrix=matrix, clip=rect, colorspace=colorspace,
+                                                              alpha=False),
+                                              self.render_mode, dpi=72 * self.block_zoom)[0])
+                         for rect in images]
+            render_time = time.time() - start
+
+        if clips is None:
+            # No text layer: read the whole page
+            start = time.time()
+            text = self.ocr_pool.ocr(image, psm=self.psm, lang=self.lang)
+            return text, {"method": "ocr", "ocr_blocks": 1, "pixel_ratio": 1.0,
+                          "timings": {"extract": extract_time, "render": render_time, "ocr": time.time() - start}}
+
+        if not clips:
+            text = '\n\n'.join(block[1] for block in blocks)
+            return text, {"method": "text", "ocr_blocks": 0, "pixel_ratio": 0.0,
+                          "timings": {"extract": extract_time}}
+
+        # Image blocks are independent, so they are read concurrently on the pool
+        start = time.time()
+        futures = [(rect, self.ocr_pool.submit(image, psm=self.block_psm, lang=self.lang))
+                   for rect, image in clips]
+        del clips
+
+        ocr_blocks = []
+        for rect, future in futures:
+            try:
+                text = future.result().strip()
+            except Exception as e:
+                print(f"OCR error in an image block of page {page_index + 1}: {e}")
+                continue
+            if text:
+                ocr_blocks.append((rect, text))
+        ocr_time = time.time() - start
+
+        ocr_area = sum(abs(rect) for rect, future in futures)
+        stats = {"method": "hybrid", "ocr_blocks": len(futures),
+                 "pixel_ratio": ocr_area / (abs(page_rect) or 1),
+                 "timings": {"extract": extract_time, "render": render_time, "ocr": ocr_time}}
+        return self.merge(blocks, ocr_blocks), stats
+
+    def merge(self, blocks, ocr_blocks):
+        """Interleave OCR'd image blocks with text blocks in reading order
+
+        Text blocks keep their text-layer order; each image goes before the
+        first text block that starts below its top edge in the same column.
+        """
+        parts = [block[1] for block in blocks]
+        positions = []
+
+        for rect, text in ocr_blocks:
+            position = len(blocks)
+            for index, (block_rect, block_text, line_rects) in enumerate(blocks):
+                same_column = block_rect.x0 < rect.x1 and rect.x0 < block_rect.x1
+                if same_column and block_rect.y0 >= rect.y0:
+                    position = index
+                    break
+            positions.append((position, rect.y0, text))
+
+        # Insert from the end so earlier positions stay valid
+        for position, top, text in sorted(positions, reverse=True):
+            parts.insert(position, text)
+
+        return '\n\n'.join(parts)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Page Layout Analysis for Workbook Pages
+Splits a page into columns, text regions and figure regions in reading order,
+so each region can be OCR'd on its own instead of reading across columns
+
+Layout comes from the text layer's block boxes when the page has one, and
+from row/column ink projection profiles of a low-resolution render when not.
+
+Usage:
+    python page_layout.py book.pdf PAGE
+"""
+
+import argparse
+import fitz  # PyMuPDF
+from ocr_words import OCRWords
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE, encode_pixmap
+
+# Byte translation table marking inked pixels in grayscale samples
+_INK = bytes(1 if value < 160 else 0 for value in range(256))
+
+# Tesseract page segmentation mode for each kind of region
+REGION_PSM = {
+    "text": 6,    # Uniform block of text
+    "line": 7,    # Single text line
+    "figure": 11  # Sparse text: labels and numbers inside diagrams
+}
+
+class _InkMask:
+    """One byte per pixel (1 = ink) with the figure boxes known for the page"""
+
+    def __init__(self, data, width, height, figures=None):
+        self.data = data
+        self.width = width
+        self.height = height
+        # Figure boxes in mask pixels; None means classify regions by ink density
+        self.figures = figures
+
+    def column_ink(self, x, y0, y1):
+        return self.data[y0 * self.width + x:y1 * self.width:self.width].count(1)
+
+    def row_ink(self, y, x0, x1):
+        return self.data[y * self.width + x0:y * self.width + x1].count(1)
+
+class PageLayout:
+    def __init__(self, zoom=1, min_gutter=18, min_block_gap=10, gutter_ink=0.05, rule_ink=0.6,
+                 figure_ink=0.3, max_depth=2):
+        # Resolution of the bitmap profiles when there is no text layer
+        self.zoom = zoom
+        # Distances below are in points
+        self.min_gutter = min_gutter        # Narrowest white strip that separates columns
+        self.min_block_gap = min_block_gap  # Vertical white space that ends a region
+        # A gutter may carry ink on this fraction of rows (headings crossing it)
+        self.gutter_ink = gutter_ink
+        # Rows inked across this fraction of the width are rules, not text
+        self.rule_ink = rule_ink
+        # Regions denser than this are figures when there is no text layer
+        self.figure_ink = figure_ink
+        # Column splits nested deeper than this are not searched
+        self.max_depth = max_depth
+
+    def ink_mask(self, page):
+        """Build the mask and its scale (pixels per point) from the text layer or a render"""
+        blocks = page.get_text('blocks')
+        origin = page.rect.tl
+
+        if any(block[6] == 0 and block[4].strip() for block in blocks):
+            # One pixel per point; every text and image block is solid ink
+            width, height = int(page.rect.width) + 1, int(page.rect.height) + 1
+            data = bytearray(width * height)
+            figures = []
+
+            for x0, y0, x1, y1, text, block_no, block_type in blocks:
+                box = (max(0, int(x0 - origin.x)), max(0, int(y0 - origin.y)),
+                       min(width, int(x1 - origin.x) + 1), min(height, int(y1 - origin.y) + 1))
+                if box[2] <= box[0] or box[3] <= box[1]:
+                    continue
+                if block_type == 1:
+                    figures.append(box)
+                for y in range(box[1], box[3]):
+                    data[y * width + box[0]:y * width + box[2]] = b'\x01' * (box[2] - box[0])
+
+            return _InkMask(bytes(data), width, height, figures), 1
+
+        pix = page.get_pixmap(matrix=fitz.Matrix(self.zoom, self.zoom), colorspace=fitz.csGRAY, alpha=False)
+        if pix.stride == pix.width:
+            data = pix.samples.translate(_INK)
+        else:
+            data = b''.join(pix.samples[y * pix.stride:y * pix.stride + pix.width]
+                            for y in range(pix.height)).translate(_INK)
+        return _InkMask(data, pix.width, pix.height), self.zoom
+
+    def find_gutter(self, mask, x0, y0, x1, y1, scale):
+        """Return the widest (gx0, gx1) white column strip in the middle of a box, or None"""
+        limit = max(1, int((y1 - y0) * self.gutter_ink))
+        min_width = max(1, int(self.min_gutter * scale))
+        runs = []
+        run_start = None
+
+        # Only the middle 70% can hold a gutter; the rest is page margin
+        low, high = x0 + (x1 - x0) * 15 // 100, x1 - (x1 - x0) * 15 // 100
+        for x in range(low, high):
+            if mask.column_ink(x, y0, y1) <= limit:
+                if run_start is None:
+                    run_start = x
+            elif run_start is not None:
+                runs.append((run_start, x))
+                run_start = None
+        if run_start is not None:
+            runs.append((run_start, high))
+
+        runs = [run for run in runs if run[1] - run[0] >= min_width]
+        return max(runs, key=lambda run: run[1] - run[0]) if runs else None
+
+    def sections(self, mask, gx0, gx1, y0, y1, scale):
+        """Split rows into (sy0, sy1, spanning) runs by whether they put ink in the gutter
+
+        Spanning runs shorter than a block gap (specks, stray strokes) do not
+        interrupt the columns around them.
+        """
+        min_span = max(1, int(self.min_block_gap * scale))
+        runs = []
+
+        for y in range(y0, y1):
+            spanning = mask.row_ink(y, gx0, gx1) > 0
+            if runs and runs[-1][2] == spanning:
+                runs[-1][1] = y + 1
+            else:
+                runs.append([y, y + 1, spanning])
+
+        merged = []
+        for run in runs:
+            if run[2] and run[1] - run[0] < min_span:
+                run[2] = False
+            if merged and merged[-1][2] == run[2]:
+                merged[-1][1] = run[1]
+            else:
+                merged.append(run)
+        return [tuple(run) for run in merged]
+
+    def split(self, mask, x0, y0, x1, y1, scale, depth=0):
+        """Recursively split a box into (box, kind) regions in reading order"""
+        gutter = self.find_gutter(mask, x0, y0, x1, y1, scale) if depth < self.max_depth else None
+        if gutter is None:
+            return self.blocks(mask, x0, y0, x1, y1, scale)
+
+        gx0, gx1 = gutter
+        regions = []
+        for sy0, sy1, spanning in self.sections(mask, gx0, gx1, y0, y1, scale):
+            if spanning:
+                # Headings and full-width figures crossing the gutter
+                regions.extend(self.blocks(mask, x0, sy0, x1, sy1, scale))
+            else:
+                # Left column before right column
+                regions.extend(self.split(mask, x0, sy0, gx0, sy1, scale, depth + 1))
+                regions.extend(self.split(mask, gx1, sy0, x1, sy1, scale, depth + 1))
+        return regions
+
+    def blocks(self, mask, x0, y0, x1, y1, scale):
+        """Cut one column into regions at blank gaps and rules, merging adjacent text bands"""
+        # Solid text-layer boxes fill whole rows, so only bitmaps have rules
+        rule_limit = max(x1 - x0, 1) * self.rule_ink if mask.figures is None else None
+        min_gap = max(1, int(self.min_block_gap * scale))
+        bands = []
+        band_start = None
+        last_ink = None
+
+        for y in range(y0, y1):
+            ink = mask.row_ink(y, x0, x1)
+            if not ink:
+                continue
+            if rule_limit is not None and ink >= rule_limit:
+                # Table or answer-box rule: close the current band
+                if band_start is not None:
+                    bands.append((band_start, last_ink + 1))
+                    band_start = None
+                continue
+            if band_start is None:
+                band_start = y
+            elif y - last_ink > min_gap:
+                bands.append((band_start, last_ink + 1))
+                band_start = y
+            last_ink = y
+
+        if band_start is not None:
+            bands.append((band_start, last_ink + 1))
+
+        regions = []
+        for by0, by1 in bands:
+            box = self.trim(mask, x0, by0, x1, by1)
+            if box is None or box[2] - box[0] < min_gap:
+                continue  # Nothing, or only a vertical rule
+            kind = self.classify(mask, box, min_gap)
+            if kind == "text" and regions and regions[-1][1] == "text":
+                # Consecutive text bands of a column are read as one block
+                previous = regions[-1][0]
+                regions[-1] = ((min(previous[0], box[0]), previous[1], max(previous[2], box[2]), box[3]), "text")
+            else:
+                regions.append((box, kind))
+
+        return regions
+
+    def trim(self, mask, x0, y0, x1, y1):
+        """Shrink a band to the columns that carry ink"""
+        inked = [x for x in range(x0, x1) if mask.column_ink(x, y0, y1)]
+        if not inked:
+            return None
+        return inked[0], y0, inked[-1] + 1, y1
+
+    def classify(self, mask, box, min_gap):
+        """'figure' or 'text' for one band"""
+        x0, y0, x1, y1 = box
+        area = max((x1 - x0) * (y1 - y0), 1)
+        if y1 - y0 < 3 * min_gap:
+            return "text"  # Too short for a figure; dense bold headings look inky
+
+        if mask.figures is not None:
+            covered = 0
+            for fx0, fy0, fx1, fy1 in mask.figures:
+                covered += max(0, min(x1, fx1) - max(x0, fx0)) * max(0, min(y1, fy1) - max(y0, fy0))
+            return "figure" if covered > area / 2 else "text"
+
+        ink = sum(mask.row_ink(y, x0, x1) for y in range(y0, y1))
+        return "figure" if ink / area > self.figure_ink else "text"
+
+    def analyze(self, page):
+        """Return the page's regions in reading order
+
+        Each region is {"rect": fitz.Rect in page points, "kind": "text" | "line" | "figure", "psm"}.
+        """
+        mask, scale = self.ink_mask(page)
+        origin = page.rect.tl
+        regions = []
+
+        for (x0, y0, x1, y1), kind in self.split(mask, 0, 0, mask.width, mask.height, scale):
+            rect = fitz.Rect(origin.x + x0 / scale, origin.y + y0 / scale,
+                             origin.x + x1 / scale, origin.y + y1 / scale)
+            # Bands shorter than two body lines are read as a single line
+            if kind == "text" and rect.height < 2 * self.min_block_gap:
+                kind = "line"
+            regions.append({"rect": rect, "kind": kind, "psm": REGION_PSM[kind]})
+
+        return regions
+
+    def ocr_regions(self, pdf_path, page_index, ocr_pool, zoom, lang='chi_sim+eng', oem=3, mode=None):
+        """OCR each region of a page separately and stitch them in reading order
+
+        Returns (text, OCRWords, regions). Word boxes are in page pixels at
+        zoom, and every region becomes its own run of blocks, so text() puts
+        a blank line between regions.
+        """
+        mode = mode or DEFAULT_RENDER_MODE
+        matrix = fitz.Matrix(zoom, zoom)
+        colorspace = fitz.csRGB if mode == 'rgb' else fitz.csGRAY
+
+        with get_document_cache().page(pdf_path, page_index) as page:
+            page_rect = page.rect
+            regions = self.analyze(page)
+            images = [encode_pixmap(page.get_pixmap(matrix=matrix, clip=region["rect"], colorspace=colorspace,
+                                                    alpha=False), mode, dpi=72 * zoom)[0]
+                      for region in regions]
+
+        # Regions are independent, so they are read concurrently on the pool
+        futures = [ocr_pool.submit(image, psm=region["psm"], lang=lang, oem=oem, words=True)
+                   for region, image in zip(regions, images)]
+        del images
+
+        merged = OCRWords()
+        # Blocks are renumbered densely across regions, so no two regions share a block
+        # id however many blocks a sparse region returns, and ids stay within 'H'
+        next_block = 0
+        for region_number, (region, future) in enumerate(zip(regions, futures)):
+            try:
+                text, words = future.result()
+            except Exception as e:
+                print(f"OCR error in region {region_number + 1} of page {page_index + 1}: {e}")
+                continue
+
+            offset_x = round((region["rect"].x0 - page_rect.x0) * zoom)
+            offset_y = round((region["rect"].y0 - page_rect.y0) * zoom)
+            region_blocks = {}
+            for index in range(len(words)):
+                left, top, width, height = words.bbox(index)
+                block, par, line = words.line_id(index)
+                if block not in region_blocks:
+                    region_blocks[block] = next_block
+                    next_block += 1
+                merged.append(words.word(index), (offset_x + left, offset_y + top, width, height),
+                              words.conf[index], (region_blocks[block], par, line))
+
+        return merged.text(), merged, regions
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the OCR regions found on a PDF page")
+    parser.add_argument('pdf', help="PDF file")
+    parser.add_argument('page', type=int, help="1-based page number")
+    args = parser.parse_args()
+
+    with get_document_cache().page(args.pdf, args.page - 1) as page:
+        if page is None:
+            parser.error(f"page {args.page} out of range")
+        regions = PageLayout().analyze(page)
+
+    for number, region in enumerate(regions, 1):
+        rect = region["rect"]
+        print(f"{number:>3}  {region['kind']:<6}  psm {region['psm']:>2}  "
+              f"({rect.x0:.0f}, {rect.y0:.0f}) - ({rect.x1:.0f}, {rect.y1:.0f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Staged Page Pipeline
+Runs pages through a chain of stages (e.g. render -> preprocess -> OCR ->
+segment) joined by bounded queues, so every stage works on a different page
+at the same time and a slow stage holds back the ones before it instead of
+letting rendered pages pile up in memory
+
+Each stage has its own worker threads. OCR workers only wait on the OCR
+engine pool, so threads are enough to keep the processes busy. Results come
+out in input order whatever order the workers finish in.
+"""
+
+import sys
+import time
+import queue
+import threading
+
+class Stage:
+    """One pipeline step: fn(value) -> value, on workers threads"""
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        # Counters are updated by this stage's workers and read by the reporter
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.done = 0
+        self.failed = 0
+        self.busy = 0.0
+
+    def count(self, elapsed, failed=False):
+        with self._lock:
+            self.done += 1
+            self.busy += elapsed
+            if failed:
+                self.failed += 1
+
+class PagePipeline:
+    def __init__(self, stages, queue_size=4, report_interval=2.0):
+        self.stages = stages
+        # Items waiting in front of each stage; the first queue is the input
+        self.queue_size = max(1, queue_size)
+        # Seconds between progress lines (0 disables the readout)
+        self.report_interval = report_interval
+
+    def run(self, items):
+        """Yield stage-chain results of items in input order
+
+        A value a stage fails on is reported and yielded as None, so the
+        caller still sees one result per item. Closing the generator early
+        stops every worker.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        done = object()
+        threads = []
+
+        def put(target, item):
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def feed():
+            try:
+                for sequence, value in enumerate(items):
+                    if not put(queues[0], (sequence, value)):
+                        return
+            finally:
+                put(queues[0], done)
+
+        def work(stage, source, target, finished):
+            while not stop.is_set():
+                try:
+                    item = source.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is done:
+                    # Hand the end marker to the next worker of this stage, or on to the next stage
+                    with finished["lock"]:
+                        finished["count"] += 1
+                        last = finished["count"] == stage.workers
+                    put(target if last else source, done)
+                    return
+
+                sequence, value = item
+                if value is not None:
+                    start = time.time()
+                    try:
+                        value = stage.fn(value)
+                        stage.count(time.time() - start)
+                    except Exception as e:
+                        print(f"{stage.name} failed: {e}")
+                        value = None
+                        stage.count(time.time() - start, failed=True)
+                if not put(target, (sequence, value)):
+                    return
+
+        threads.append(threading.Thread(target=feed, daemon=True))
+        for index, stage in enumerate(self.stages):
+            stage.reset()
+            finished = {"count": 0, "lock": threading.Lock()}
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=work, daemon=True,
+                                                args=(stage, queues[index], queues[index + 1], finished)))
+
+        if self.report_interval:
+            threads.append(threading.Thread(target=self.report, args=(queues, stop), daemon=True))
+
+        started = time.time()
+        for thread in threads:
+            thread.start()
+
+        # Results finish out of order across workers; hold them until their turn
+        pending = {}
+        next_sequence = 0
+        output = queues[-1]
+        try:
+            while True:
+                item = output.get()
+                if item is done:
+                    break
+                pending[item[0]] = item[1]
+                while next_sequence in pending:
+                    yield pending.pop(next_sequence)
+                    next_sequence += 1
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            if self.report_interval:
+                self.print_status(queues, time.time() - started, final=True)
+
+    def report(self, queues, stop):
+        """Print a status line every report_interval seconds until stopped"""
+        started = time.time()
+        while not stop.wait(self.report_interval):
+            self.print_status(queues, time.time() - started)
+
+    def print_status(self, queues, elapsed, final=False):
+        """One line: per stage pages done, pages/s, worker utilization and input queue depth"""
+        parts = []
+        for stage, source in zip(self.stages, queues):
+            rate = stage.done / elapsed if elapsed > 0 else 0.0
+            utilization = stage.busy / (elapsed * stage.workers) if elapsed > 0 else 0.0
+            failed = f" {stage.failed} failed" if stage.failed else ""
+            parts.append(f"{stage.name} {stage.done} ({rate:.2f}/s, {utilization:.0%} busy, "
+                         f"q {source.qsize()}/{self.queue_size}){failed}")
+        prefix = "Pipeline done" if final else "Pipeline"
+        print(f"{prefix} {elapsed:.0f}s: " + " | ".join(parts))
+        sys.stdout.flush()
+
+def parse_stage_workers(spec, defaults):
+    """Parse 'render=1,ocr=4' into a {stage: workers} dict over defaults"""
+    workers = dict(defaults)
+    for part in (spec or '').split(','):
+        if '=' in part:
+            name, count = part.split('=', 1)
+            if name.strip() in workers:
+                workers[name.strip()] = max(1, int(count))
+    return workers
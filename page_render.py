@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Page Image Rendering for OCR
+Hands the OCR engine the original embedded scan when a page is a single
+full-page image, and falls back to rasterizing the page otherwise
+
+Render modes:
+    rgb      24-bit color, as get_pixmap renders by default
+    gray     8-bit grayscale, a third of the RGB size (default)
+    bilevel  thresholded 1-bit PBM, a twenty-fourth of the RGB size
+    clean    1-bit PBM after NumPy adaptive thresholding, deskew and speckle
+             removal (page_preprocess); bilevel when NumPy is not installed
+
+The default can be changed with the OCR_RENDER_MODE environment variable.
+"""
+
+import os
+import fitz  # PyMuPDF
+from page_preprocess import NUMPY_AVAILABLE, preprocess_pixmap
+
+# Formats tesseract/leptonica read directly; anything else (JBIG2, JPX, ...) is decoded first
+OCR_READABLE_FORMATS = {'jpeg', 'jpg', 'png', 'pnm', 'pbm', 'pgm', 'ppm', 'tiff', 'tif', 'bmp'}
+
+RENDER_MODES = ('rgb', 'gray', 'bilevel', 'clean')
+DEFAULT_RENDER_MODE = os.environ.get('OCR_RENDER_MODE', 'gray')
+
+# Grayscale values below this become black in bilevel mode
+BILEVEL_THRESHOLD = 160
+
+# Byte translation table mapping grayscale samples to ASCII '1' (ink) / '0' (paper)
+_BILEVEL_BITS = bytes(ord('1') if value < BILEVEL_THRESHOLD else ord('0') for value in range(256))
+
+def bilevel_pbm(pix):
+    """Threshold a grayscale pixmap into binary PBM (P4) bytes, one bit per pixel"""
+    width, height, stride = pix.width, pix.height, pix.stride
+    row_bytes = (width + 7) // 8
+    padding = b'0' * (row_bytes * 8 - width)
+    samples = pix.samples_mv
+    rows = [f'P4\n{width} {height}\n'.encode('ascii')]
+
+    for y in range(height):
+        bits = bytes(samples[y * stride:y * stride + width]).translate(_BILEVEL_BITS) + padding
+        rows.append(int(bits, 2).to_bytes(row_bytes, 'big'))
+
+    return b''.join(rows)
+
+def encode_pixmap(pix, mode, dpi=None):
+    """Encode a pixmap for OCR in the given render mode; returns (image_bytes, ext)
+
+    dpi is the pixmap's resolution, which sizes the clean-mode threshold window.
+    """
+    if mode != 'rgb' and pix.n != 1:
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+    elif pix.alpha or pix.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+
+    if mode == 'clean' and NUMPY_AVAILABLE:
+        return preprocess_pixmap(pix, dpi)[0], 'pbm'
+    if mode in ('bilevel', 'clean'):
+        return bilevel_pbm(pix), 'pbm'
+    return pix.tobytes('pnm'), 'pgm' if pix.n == 1 else 'ppm'
+
+def render_pixmap(page, zoom, mode=None):
+    """Rasterize a page in the colorspace of a render mode"""
+    mode = mode or DEFAULT_RENDER_MODE
+    colorspace = fitz.csRGB if mode == 'rgb' else fitz.csGRAY
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, alpha=False)
+
+def embedded_scan_xref(page, min_coverage=0.9, min_dpi=200):
+    """Return the image xref of a page that is one full-page scan, else None
+
+    Pages with a text layer, vector drawings, several images, soft masks,
+    rotation, a mirrored or flipped placement, a /Decode array or a
+    low-resolution scan do not qualify.
+    """
+    if page.rotation or page.get_text().strip():
+        return None
+
+    images = page.get_images(full=True)
+    if len(images) != 1:
+        return None
+
+    xref, smask, width = images[0][0], images[0][1], images[0][2]
+    if smask:
+        return None
+
+    placements = page.get_image_rects(xref, transform=True)
+    if len(placements) != 1:
+        return None
+
+    rect, matrix = placements[0]
+    page_area = abs(page.rect)
+    if not page_area or abs(rect & page.rect) < min_coverage * page_area:
+        return None
+    if matrix.b or matrix.c or matrix.a <= 0 or matrix.d <= 0:
+        return None  # Rotated, skewed, mirrored or flipped placement
+    if page.parent.xref_get_key(xref, 'Decode')[0] != 'null':
+        return None  # Inverted or remapped samples, which only rendering applies
+    if width / (rect.width / 72) < min_dpi:
+        return None  # Rendering at zoom reads small scans better
+
+    if page.get_drawings():
+        return None  # Vector content on top of the scan
+
+    return xref
+
+def embedded_scan_image(page, min_coverage=0.9, min_dpi=200, mode=None):
+    """Return (image_bytes, ext) for a page that is one full-page scan, else None
+
+    Other pages fall back to rendering. Scans already in a format tesseract
+    reads are passed through compressed, except in clean mode, which exists
+    to straighten and despeckle them; others are decoded in the render mode.
+    """
+    mode = mode or DEFAULT_RENDER_MODE
+    xref = embedded_scan_xref(page, min_coverage, min_dpi)
+    if xref is None:
+        return None
+
+    if mode != 'clean':
+        info = page.parent.extract_image(xref)
+        if info and info.get('ext', '').lower() in OCR_READABLE_FORMATS:
+            return info['image'], info['ext'].lower()
+
+    # Decode at native resolution
+    pix = fitz.Pixmap(page.parent, xref)
+    scan_rect = page.get_image_rects(xref)[0]
+    return encode_pixmap(pix, mode, dpi=pix.width / (scan_rect.width / 72))
+
+def page_image(page, zoom, mode=None):
+    """Return (image_bytes, ext, method) for OCR of one page
+
+    method is 'embedded' when the native scan is used, 'rendered' otherwise.
+    """
+    mode = mode or DEFAULT_RENDER_MODE
+    scan = embedded_scan_image(page, mode=mode)
+    if scan is not None:
+        return scan[0], scan[1], 'embedded'
+
+    image, ext = encode_pixmap(render_pixmap(page, zoom, mode), mode, dpi=72 * zoom)
+    return image, ext, 'rendered'
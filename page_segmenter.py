@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Linear-time Page Segmentation
+Splits page text into problem segments at numbering markers, replacing the
+lazy `(marker)\\s*(.*?)(?=marker|$)` DOTALL patterns
+
+Those patterns test the lookahead at every character of a segment, and
+the numbered-item lookahead re-scans every run of digits it starts inside,
+so a cleaned page (one long line) with few boundaries or long digit runs
+takes quadratic time. Here each marker family is found with one scan that
+starts a marker only where a run begins, and segments are cut between
+consecutive markers, so the work is linear in the page length. A per-page
+time budget bounds whatever the callers do with the segments.
+
+Segments match what the old patterns produced: a marker's body runs to
+the next marker of the same family, or to the end of the page.
+"""
+
+import re
+import time
+
+# Seconds of segmentation and problem building allowed per page
+DEFAULT_PAGE_BUDGET = 2.0
+
+# Marker patterns, each anchored so no run of characters is scanned from more than one start
+MARKER_FAMILIES = {
+    "circled": r'[①②③④⑤⑥⑦⑧⑨⑩]',
+    "numbered": r'(?<![1-9])[1-9]+[\.、]',
+    "question": r'第[一二三四五六七八九十\d]+题',
+    "example": r'例题\d*',
+}
+
+_compiled = {family: re.compile(pattern) for family, pattern in MARKER_FAMILIES.items()}
+
+class PageBudget:
+    """Deadline for the work on one page (no deadline when seconds is falsy)"""
+
+    def __init__(self, seconds=DEFAULT_PAGE_BUDGET):
+        self.seconds = seconds
+        self.deadline = time.perf_counter() + seconds if seconds else None
+
+    def expired(self):
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+def segments(text, family, budget=None):
+    """Yield (marker, body) for every marker of a family, in text order
+
+    The body is the text between the marker and the next marker of the
+    family (or the end), without leading whitespace. Stops early once the
+    budget has expired.
+    """
+    previous = None
+    for match in _compiled[family].finditer(text):
+        if previous is not None:
+            yield previous.group(), text[previous.end():match.start()].lstrip()
+            if budget is not None and budget.expired():
+                return
+        previous = match
+
+    if previous is not None:
+        yield previous.group(), text[previous.end():].lstrip()
+
+def segment_page(text, families, budget=None):
+    """Yield (family, marker, body) for each family in turn, as the per-pattern passes did"""
+    for family in families:
+        for marker, body in segments(text, family, budget):
+            yield family, marker, body
+        if budget is not None and budget.expired():
+            return
+
+def ordered_in_line(text, first, second):
+    """Whether some line has first followed later by second (what re.search(first + '.*?' + second) tests)
+
+    Linear: per line, only the earliest first needs a second after it.
+    """
+    for line in text.split('\n'):
+        start = line.find(first)
+        if start >= 0 and line.find(second, start + len(first)) >= 0:
+            return True
+    return False
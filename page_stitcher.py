@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cross-page Problem Stitching
+Joins a problem that runs over a page break, for extractors that segment
+page by page
+
+A page's trailing span (from its last problem marker to the end) is open
+when it does not end like a finished problem (sentence punctuation, a
+closing bracket, an equals sign). The stitcher holds that one span back
+and, when the next page arrives, joins it with the text before that
+page's first marker, so the problem comes out whole instead of as a
+fragment at the bottom of one page and another at the top of the next.
+Only the open span is ever held, so pages still stream through: the rest
+of each page is returned as soon as it is fed.
+
+Markers are the ones the caller segments with, so the cut falls on a
+boundary its segmentation would use anyway.
+
+A sharded run stops at the edges of its pages: the text before the first
+marker of its first page (lead_page) is set aside instead of segmented,
+and the span held after its last page is left unflushed, so the shard
+merge can join the two across the boundary between shards.
+"""
+
+import re
+from page_segmenter import MARKER_FAMILIES
+from problem_lexer import BOUNDARY_KINDS, TOKEN_PATTERNS
+from problem_patterns import get_pattern
+
+# Endings of a finished problem: sentence punctuation, closing brackets and quotes, an equation to fill in
+CLOSING_CHARS = '。．.？?！!…）)】」』”"=＝'
+
+def family_markers(families):
+    """Marker pattern for page_segmenter families, e.g. ("circled", "numbered")"""
+    return re.compile('|'.join(MARKER_FAMILIES[family] for family in families))
+
+def lexer_markers():
+    """Marker pattern for the problem lexer's boundary tokens"""
+    return re.compile('|'.join(pattern for kind, pattern in TOKEN_PATTERNS if kind in BOUNDARY_KINDS))
+
+def section_markers():
+    """Marker pattern of problem_patterns.split_sections"""
+    return get_pattern("section_marker")
+
+def is_open(span):
+    """Whether a trailing span looks cut off by the page break"""
+    span = span.rstrip()
+    return bool(span) and span[-1] not in CLOSING_CHARS
+
+def join_text(head, tail):
+    """Join the two halves of a problem, with a space unless both sides are CJK"""
+    head = head.rstrip()
+    tail = tail.lstrip()
+    if not head or not tail or (ord(head[-1]) >= 0x2E80 and ord(tail[0]) >= 0x2E80):
+        return head + tail
+    return head + ' ' + tail
+
+class PageStitcher:
+    """Carries the open trailing span of one page over to the next page"""
+
+    def __init__(self, markers, lead_page=None):
+        self.markers = re.compile(markers) if isinstance(markers, str) else markers
+        # (page number, text) of the open span of the last page fed
+        self.held = None
+        # Page whose leading fragment is set aside (a shard's first page), and (page number, text) of it
+        self.lead_page = lead_page
+        self.lead = None
+
+    def feed(self, page, text):
+        """Take the next page's text; return (carried, text)
+
+        carried is (page number, text) of the span held from the previous
+        page, joined with this page's leading fragment when the pages are
+        consecutive and this page starts mid-problem, or None. text is the
+        rest of this page, without its own open trailing span (now held)
+        and, on lead_page, without its leading fragment (see pop_lead).
+        """
+        first = last = None
+        for match in self.markers.finditer(text):
+            first = first or match
+            last = match
+
+        start = 0
+        carried = None
+        if page is not None and page == self.lead_page:
+            start = first.start() if first else len(text)
+            if text[:start].strip():
+                self.lead = (page, text[:start])
+        if self.held:
+            held_page, held_text = self.held
+            self.held = None
+            lead_end = first.start() if first else len(text)
+            if page is not None and held_page == page - 1 and text[:lead_end].strip():
+                carried = (held_page, join_text(held_text, text[:lead_end]))
+                start = lead_end
+            else:
+                carried = (held_page, held_text)
+
+        end = len(text)
+        if last and is_open(text[last.start():]):
+            self.held = (page, text[last.start():])
+            end = last.start()
+
+        return carried, text[start:end]
+
+    def pop_lead(self):
+        """(page number, text) of the leading fragment set aside on lead_page, once, or None"""
+        lead, self.lead = self.lead, None
+        return lead
+
+    def flush(self):
+        """(page number, text) of the span still held when the pages run out, or None"""
+        held, self.held = self.held, None
+        return held
+
+def stitch_pages(pages, markers):
+    """Yield (page number, text) pieces to segment, for a stream of (page number, text)
+
+    Each page's text comes after the span carried over from the page
+    before it (attributed to the page the problem starts on), and the span
+    held at the end comes last.
+    """
+    stitcher = PageStitcher(markers)
+    for page, text in pages:
+        carried, text = stitcher.feed(page, text)
+        if carried:
+            yield carried
+        yield page, text
+
+    held = stitcher.flush()
+    if held:
+        yield held
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Per-page Text Streaming
+Yields one record per PDF page instead of concatenating the whole book into a
+single '--- Page N ---' delimited string, so segmentation can consume pages
+lazily in constant memory
+
+A page record is a dict:
+    {"page": 1-based page number, "method": "text" | "ocr" | "pypdf2" | ...,
+     "text": page text, "timings": {stage: seconds}}
+
+Records from iter_backend_pages also carry "attempts": one
+{"method", "seconds", "error"} entry per backend tried on that page.
+"""
+
+import time
+from pdf_documents import get_document_cache
+
+try:
+    import PyPDF2
+    PYPDF2_AVAILABLE = True
+except ImportError:
+    PYPDF2_AVAILABLE = False
+
+def page_record(page, method, text, **timings):
+    """Build the record for one page"""
+    return {"page": page, "method": method, "text": text, "timings": timings}
+
+def iter_text_pages(pdf_path, start_page=0):
+    """Yield text-layer records page by page with PyMuPDF
+
+    The shared document is only locked while a page is read, never while
+    the consumer holds the generator suspended.
+    """
+    documents = get_document_cache()
+    total_pages = documents.page_count(pdf_path)
+
+    for page_num in range(start_page, total_pages):
+        start = time.time()
+        with documents.page(pdf_path, page_num) as page:
+            text = page.get_text()
+        yield page_record(page_num + 1, "text", text, extract=time.time() - start)
+
+class PyMuPDFBackend:
+    """Text layer through the shared fitz documents"""
+    method = "text"
+
+    def page_count(self, pdf_path):
+        return get_document_cache().page_count(pdf_path)
+
+    def read(self, pdf_path, page_index):
+        with get_document_cache().page(pdf_path, page_index) as page:
+            return page.get_text()
+
+    def close(self):
+        pass
+
+class PyPDF2Backend:
+    """Text layer through PyPDF2, parsing each file at most once"""
+    method = "pypdf2"
+
+    def __init__(self):
+        self._readers = {}  # pdf_path -> (file, PdfReader)
+
+    def _reader(self, pdf_path):
+        if pdf_path not in self._readers:
+            file = open(pdf_path, 'rb')
+            try:
+                self._readers[pdf_path] = (file, PyPDF2.PdfReader(file))
+            except Exception:
+                file.close()
+                raise
+        return self._readers[pdf_path][1]
+
+    def page_count(self, pdf_path):
+        return len(self._reader(pdf_path).pages)
+
+    def read(self, pdf_path, page_index):
+        return self._reader(pdf_path).pages[page_index].extract_text()
+
+    def close(self):
+        for file, reader in self._readers.values():
+            file.close()
+        self._readers.clear()
+
+def default_backends():
+    """PyMuPDF first (better for Chinese text), then PyPDF2 when installed"""
+    backends = [PyMuPDFBackend()]
+    if PYPDF2_AVAILABLE:
+        backends.append(PyPDF2Backend())
+    return backends
+
+def iter_backend_pages(pdf_path, backends=None, start_page=0):
+    """Yield text records page by page, retrying only a failing page with the next backend
+
+    One corrupt page costs a retry of that page, not a re-parse of the
+    document. A page every backend fails on yields a record with method
+    "failed" and empty text, so page numbering stays complete.
+    """
+    backends = backends or default_backends()
+    total_pages = None
+
+    try:
+        for backend in backends:
+            try:
+                total_pages = backend.page_count(pdf_path)
+                break
+            except Exception as e:
+                print(f"{backend.method} cannot open {pdf_path}: {e}")
+        if total_pages is None:
+            return
+
+        for page_num in range(start_page, total_pages):
+            attempts = []
+            record = None
+
+            for backend in backends:
+                start = time.time()
+                try:
+                    text = backend.read(pdf_path, page_num)
+                    error = None
+                except Exception as e:
+                    error = str(e)
+                elapsed = time.time() - start
+                attempts.append({"method": backend.method, "seconds": elapsed, "error": error})
+                if error is None:
+                    record = page_record(page_num + 1, backend.method, text or '', extract=elapsed)
+                    break
+
+            if record is None:
+                print(f"Page {page_num + 1}: no backend could read it")
+                record = page_record(page_num + 1, "failed", '')
+            elif len(attempts) > 1:
+                print(f"Page {page_num + 1}: read with {record['method']} after {attempts[0]['method']} failed")
+            record["attempts"] = attempts
+            yield record
+
+    finally:
+        for backend in backends:
+            backend.close()
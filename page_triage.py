@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Page Triage for Scanned Math Workbooks
+Scores every page from a cheap low-resolution thumbnail and the text layer,
+so the expensive OCR pass only visits pages likely to hold problems
+
+Usage:
+    python page_triage.py book.pdf [--min-score 30]
+"""
+
+import re
+import argparse
+from pathlib import Path
+import fitz  # PyMuPDF
+from pdf_documents import get_document_cache
+
+# Byte translation table marking inked pixels in grayscale samples
+_DARK = bytes(1 if value < 160 else 0 for value in range(256))
+
+# Text-layer hints
+_TOC_PATTERN = re.compile(r'目\s*录|contents', re.IGNORECASE)
+_PROBLEM_PATTERN = re.compile(r'\d+\s*[\.、]|[①②③④⑤⑥⑦⑧⑨⑩]|第[一二三四五六七八九十\d]+题|计算|应用题|练习|例题')
+
+class PageTriage:
+    def __init__(self, thumb_zoom=0.5, blank_ink=0.005, cover_ink=0.35, duplicate_ratio=0.1):
+        self.thumb_zoom = thumb_zoom
+        self.blank_ink = blank_ink
+        self.cover_ink = cover_ink
+        # Pages whose inked pixels differ by less than this fraction count as repeats
+        self.duplicate_ratio = duplicate_ratio
+
+    def render_thumbnail(self, page):
+        """Render a small grayscale thumbnail of a page"""
+        return page.get_pixmap(matrix=fitz.Matrix(self.thumb_zoom, self.thumb_zoom),
+                               colorspace=fitz.csGRAY, alpha=False)
+
+    def row_profile(self, pix):
+        """Count text-like line bands and full-width rules from the row ink profile"""
+        samples = pix.samples
+        text_lines = 0
+        rule_rows = 0
+        in_line = False
+
+        for y in range(pix.height):
+            row = samples[y * pix.stride:y * pix.stride + pix.width]
+            ink = row.translate(_DARK).count(1) / max(pix.width, 1)
+
+            if ink > 0.6:
+                # Table / answer-grid rule
+                rule_rows += 1
+                in_line = False
+            elif ink > 0.01:
+                if not in_line:
+                    text_lines += 1
+                in_line = True
+            else:
+                in_line = False
+
+        return text_lines, rule_rows
+
+    def page_features(self, page):
+        """Measure the cheap per-page signals used for scoring"""
+        pix = self.render_thumbnail(page)
+        ink_mask = pix.samples.translate(_DARK)
+        ink_pixels = ink_mask.count(1)
+        ink_density = ink_pixels / max(len(ink_mask), 1)
+        text_lines, rule_rows = self.row_profile(pix)
+        text = page.get_text().strip()
+
+        return {
+            "ink_density": ink_density,
+            "text_length": len(text),
+            "text_lines": text_lines,
+            "rule_rows": rule_rows,
+            "image_count": len(page.get_images()),
+            "is_toc": bool(_TOC_PATTERN.search(text[:200])),
+            "problem_markers": len(_PROBLEM_PATTERN.findall(text)),
+            "ink_pixels": ink_pixels,
+            # One bit per inked thumbnail pixel; XOR popcount compares two pages
+            "signature": int.from_bytes(ink_mask, 'big')
+        }
+
+    def score_page(self, page_index, features, duplicates):
+        """Score a page 0-100 by how likely it is to contain problems"""
+        reasons = []
+
+        if features["ink_density"] < self.blank_ink and features["text_length"] == 0:
+            return 0, ["blank"]
+
+        # Lines of body text are the strongest signal for exercise pages
+        score = min(features["text_lines"], 40) / 40 * 60
+
+        if 0.02 <= features["ink_density"] <= 0.25:
+            score += 20
+        if features["problem_markers"]:
+            score += min(features["problem_markers"], 10) * 2
+
+        if page_index < 2 and features["ink_density"] > self.cover_ink:
+            score -= 50
+            reasons.append("cover")
+        if features["is_toc"]:
+            score -= 40
+            reasons.append("toc")
+        if features["rule_rows"] > 3 and features["rule_rows"] >= features["text_lines"] / 2:
+            score -= 30
+            reasons.append("answer_grid")
+        if duplicates >= 2:
+            score -= 30
+            reasons.append("repeated")
+
+        return max(0, min(100, round(score))), reasons
+
+    def count_duplicates(self, page_index, features, features_by_page):
+        """Count near-identical pages elsewhere in the book (dividers, blank answer sheets)"""
+        duplicates = 0
+        ink = features["ink_pixels"]
+
+        for other_index, other in features_by_page.items():
+            if other_index == page_index or not ink:
+                continue
+            # Cheap ink-count filter before the full bitmap comparison
+            if abs(other["ink_pixels"] - ink) > ink * self.duplicate_ratio:
+                continue
+            if (features["signature"] ^ other["signature"]).bit_count() <= ink * self.duplicate_ratio:
+                duplicates += 1
+
+        return duplicates
+
+    def triage(self, pdf_path, page_indexes=None):
+        """Score pages of a PDF and return them ranked best-first"""
+        features_by_page = {}
+
+        # Reuse the shared open document that the OCR pass will render from
+        with get_document_cache().document(pdf_path) as doc:
+            if page_indexes is None:
+                page_indexes = range(len(doc))
+
+            for page_index in page_indexes:
+                if 0 <= page_index < len(doc):
+                    features_by_page[page_index] = self.page_features(doc[page_index])
+
+        ranked = []
+
+        for page_index, features in features_by_page.items():
+            duplicates = self.count_duplicates(page_index, features, features_by_page)
+            score, reasons = self.score_page(page_index, features, duplicates)
+            ranked.append({
+                "page_index": page_index,
+                "score": score,
+                "reasons": reasons,
+                "ink_density": round(features["ink_density"], 4),
+                "text_lines": features["text_lines"],
+                "text_length": features["text_length"]
+            })
+
+        ranked.sort(key=lambda entry: (-entry["score"], entry["page_index"]))
+        return ranked
+
+    def select_pages(self, pdf_path, min_score=30, max_pages=None):
+        """Return page indexes worth OCR-ing, best candidates first"""
+        ranked = [entry for entry in self.triage(pdf_path) if entry["score"] >= min_score]
+        if max_pages:
+            ranked = ranked[:max_pages]
+
+        print(f"Triage selected {len(ranked)} pages of {Path(pdf_path).name} for OCR")
+        return [entry["page_index"] for entry in ranked]
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank PDF pages by likelihood of containing math problems")
+    parser.add_argument('pdf', help="PDF file to triage")
+    parser.add_argument('--min-score', type=int, default=30)
+    args = parser.parse_args()
+
+    for entry in PageTriage().triage(args.pdf):
+        marker = "OCR " if entry["score"] >= args.min_score else "skip"
+        print(f"{marker}  page {entry['page_index'] + 1:>4}  score {entry['score']:>3}  "
+              f"ink {entry['ink_density']:.3f}  lines {entry['text_lines']:>3}  "
+              f"{','.join(entry['reasons'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Shared PDF Document Handles
+Keeps a bounded set of open fitz documents so extractors stop re-parsing the
+xref and page tree for every page they render or read
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import fitz  # PyMuPDF
+
+class DocumentCache:
+    """Bounded LRU of open fitz documents
+
+    MuPDF documents must not be used from two threads at once, so every
+    access goes through a per-document lock. Documents in use are never
+    evicted; the least recently used idle ones are closed past max_open.
+    """
+
+    def __init__(self, max_open=8):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"doc", "lock", "users"}
+
+    def _key(self, pdf_path):
+        """Identify a file version so an edited PDF is reopened"""
+        stat = os.stat(pdf_path)
+        return (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime)
+
+    def _acquire(self, pdf_path):
+        """Return the cache entry for a PDF, opening it if needed, and mark it in use"""
+        key = self._key(pdf_path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {"doc": fitz.open(pdf_path), "lock": threading.RLock(), "users": 0}
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry["users"] += 1
+            self._evict()
+
+        return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry["users"] -= 1
+            self._evict()
+
+    def _evict(self):
+        """Close idle documents beyond max_open, least recently used first (lock held)"""
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_open:
+                break
+            entry = self._entries[key]
+            if entry["users"] == 0:
+                entry["doc"].close()
+                del self._entries[key]
+
+    @contextmanager
+    def document(self, pdf_path):
+        """Hold an open document exclusively for the duration of the block"""
+        entry = self._acquire(pdf_path)
+        try:
+            with entry["lock"]:
+                yield entry["doc"]
+        finally:
+            self._release(entry)
+
+    @contextmanager
+    def page(self, pdf_path, page_num):
+        """Hold one page of an open document; yields None when page_num is out of range"""
+        with self.document(pdf_path) as doc:
+            yield doc[page_num] if 0 <= page_num < len(doc) else None
+
+    def page_count(self, pdf_path):
+        """Number of pages in a PDF"""
+        with self.document(pdf_path) as doc:
+            return len(doc)
+
+    def close_all(self):
+        """Close every idle document"""
+        with self._lock:
+            for key in list(self._entries):
+                if self._entries[key]["users"] == 0:
+                    self._entries[key]["doc"].close()
+                    del self._entries[key]
+
+# One cache per process; forked workers must not share the parent's MuPDF handles
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+def get_document_cache():
+    """Return this process's shared document cache"""
+    with _shared_lock:
+        cache = _shared_caches.get(os.getpid())
+        if cache is None:
+            cache = DocumentCache()
+            _shared_caches[os.getpid()] = cache
+        return cache
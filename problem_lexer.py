@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Problem Boundary Lexer
+Walks a page's text once with a single compiled pattern and emits typed
+boundary tokens, then cuts the page into non-overlapping problem spans
+
+Token kinds:
+    number    numbered items: 1.  12、
+    circled   ①-⑩
+    question  第3题  第十二题
+    example   例题  例3
+    exercise  练习  习题
+    answer    答案:  答:  (marks a part of the current problem)
+    analysis  解析:  分析:  (marks a part of the current problem)
+
+Every boundary kind starts a new span that runs to the next boundary, so no
+character belongs to two problems. Answer and analysis markers split their
+span into stem, answer and analysis parts instead of starting a new one.
+"""
+
+import re
+
+# Tokens that open a new problem span
+BOUNDARY_KINDS = ("number", "circled", "question", "example", "exercise")
+# Tokens that mark the parts of the current problem
+PART_KINDS = ("answer", "analysis")
+
+TOKEN_PATTERNS = [
+    # Not part of a decimal ("3.5"), a longer number or an ellipsis ("3...")
+    ("number", r'(?<![\d.])\d{1,3}[\.、](?![\d.])'),
+    ("circled", r'[①②③④⑤⑥⑦⑧⑨⑩]'),
+    ("question", r'第[\d一二三四五六七八九十百]+题'),
+    ("example", r'例题\s*\d*|例\s*\d+'),
+    ("exercise", r'练习|习题'),
+    ("answer", r'答案\s*[:：]?|答\s*[:：]'),
+    ("analysis", r'解析\s*[:：]?|分析\s*[:：]'),
+]
+# Every token starts with one of these; checking it first lets the scanner skip plain text quickly
+TOKEN_FIRST_CHARS = r'\d①②③④⑤⑥⑦⑧⑨⑩第例练习答解分'
+
+class ProblemLexer:
+    """Single-pass tokenizer and span builder for problem boundaries"""
+
+    def __init__(self, patterns=None, first_chars=TOKEN_FIRST_CHARS):
+        self.patterns = patterns or TOKEN_PATTERNS
+        # One alternation with a named group per kind; the first alternative that matches wins
+        alternation = '|'.join(f'(?P<{kind}>{pattern})' for kind, pattern in self.patterns)
+        if first_chars:
+            alternation = f'(?=[{first_chars}])(?:{alternation})'
+        self.regex = re.compile(alternation)
+
+    def tokens(self, text):
+        """Return [(kind, text, start, end)] for every boundary and part marker, in text order"""
+        return [(match.lastgroup, match.group(), match.start(), match.end())
+                for match in self.regex.finditer(text)]
+
+    def spans(self, text, tokens=None):
+        """Cut text into problem spans
+
+        Each span is a dict with the boundary "kind" and "label" (the token
+        text), "start" (the token's position), "body" (first character
+        after the token), "stem_end" (first answer or analysis marker, or
+        "end") and "end" (the next boundary, or the end of the text), plus
+        "answer" and "analysis" (start, end) ranges when the markers appear.
+        Text before the first boundary comes back as a span of kind "text".
+        """
+        if tokens is None:
+            tokens = ((match.lastgroup, None, match.start(), match.end()) for match in self.regex.finditer(text))
+
+        spans = []
+        current = None
+        for kind, label, start, end in tokens:
+            if kind in BOUNDARY_KINDS:
+                if current is None and text[:start].strip():
+                    current = self._open("text", "", 0, 0)
+                self._close(current, start, spans)
+                current = self._open(kind, label if label is not None else text[start:end], start, end)
+            elif kind in PART_KINDS:
+                if current is None:
+                    current = self._open("text", "", 0, 0)
+                current["_markers"].append((kind, start, end))
+
+        if current is None and text.strip():
+            current = self._open("text", "", 0, 0)
+        self._close(current, len(text), spans)
+        return spans
+
+    def _open(self, kind, label, start, body):
+        return {"kind": kind, "label": label, "start": start, "body": body, "_markers": []}
+
+    def _close(self, span, end, spans):
+        """Fix the end of a span and split it at its answer and analysis markers"""
+        if span is None:
+            return
+        markers = span.pop("_markers")
+        span["end"] = end
+        span["stem_end"] = markers[0][1] if markers else end
+        span["answer"] = None
+        span["analysis"] = None
+
+        # A part runs to the next marker or the end of the span; a repeated marker keeps the first part
+        for index, (kind, start, body) in enumerate(markers):
+            if span[kind] is None:
+                span[kind] = (body, markers[index + 1][1] if index + 1 < len(markers) else end)
+        spans.append(span)
+
+_default_lexer = None
+
+def get_lexer():
+    """Return the module's shared lexer (compiled once)"""
+    global _default_lexer
+    if _default_lexer is None:
+        _default_lexer = ProblemLexer()
+    return _default_lexer
+
+def problem_spans(text):
+    """Non-overlapping problem spans of a page (see ProblemLexer.spans)"""
+    return get_lexer().spans(text)
+
+def span_parts(text, span):
+    """Return (stem, answer, analysis) of a span; the stem includes its boundary label"""
+    stem = text[span["start"]:span["stem_end"]].strip()
+    answer = text[span["answer"][0]:span["answer"][1]].strip() if span["answer"] else ""
+    analysis = text[span["analysis"][0]:span["analysis"][1]].strip() if span["analysis"] else ""
+    return stem, answer, analysis
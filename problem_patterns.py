@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Shared Problem Patterns
+Precompiled patterns the extractors use to recognise math problems, pull
+answers and analyses out of them and clean their stems, in one place
+
+Indicator lists that the extractors searched one pattern at a time are
+combined into a single alternation, so each check is one regex call per
+stem. A first-character lookahead skips positions where no indicator can
+start; the 解…题 style pairs are anchored at line starts and tried only
+from the first 解 of a line, which keeps every pattern linear in the
+length of the text.
+"""
+
+import re
+
+def in_line_order(first, second):
+    """Pattern for a line with first followed later by second (what first.*?second finds)
+
+    Anchored at the line start and tried only from the first occurrence of
+    first, so a long line full of first without second is scanned once.
+    """
+    head = re.escape(first[0])
+    before = f'[^{head}\\n]'
+    if len(first) > 1:
+        before = f'(?:{before}|{head}(?!{re.escape(first[1:])}))'
+    return f'^{before}*{re.escape(first)}[^\\n]*{re.escape(second)}'
+
+# Indicators of a math problem; finding any one of them is enough
+MATH_INDICATORS = [
+    r'[①②③④⑤⑥⑦⑧⑨⑩]',  # Problem numbers
+    r'[1-9]\.',  # Numbered problems
+    r'(?<!\d)\d+\s*[＋+\-×÷]\s*\d',  # Basic operations, tried once per run of digits
+    r'应用题|选择题|填空题|判断题',  # Word problem, multiple choice, fill in blank, true/false
+]
+
+# Words that make OCR'd text look like a problem even without numbering
+MATH_CONTEXT_INDICATORS = [
+    r'克|米|分钟|小时',  # Units (千克 and 厘米 included)
+    r'苹果|书|学生|班级|学校',  # Common math problem subjects
+]
+
+# Solve problem, calculate expression, find value
+MATH_PAIRS = [('解', '题'), ('计算', '式'), ('求', '值')]
+
+# Characters an unanchored indicator can start with
+INDICATOR_FIRST_CHARS = '①②③④⑤⑥⑦⑧⑨⑩0123456789应选填判克米分小苹书学班'
+
+def indicator_pattern(indicators):
+    """One pattern that matches wherever any indicator or pair does"""
+    pairs = '|'.join(in_line_order(first, second) for first, second in MATH_PAIRS)
+    return re.compile(f'(?=[{INDICATOR_FIRST_CHARS}])(?:{"|".join(indicators)})|^(?:{pairs})', re.MULTILINE)
+
+PATTERNS = {
+    "math_problem": indicator_pattern(MATH_INDICATORS),
+    "math_problem_context": indicator_pattern(MATH_INDICATORS + MATH_CONTEXT_INDICATORS),
+    # Section headings and numbering of a page region that holds problems
+    "math_section": re.compile(r'练习|习题|测试|计算|解题|解答题|应用题|选择题|填空题|判断题'
+                               r'|(?<!\d)\d+\s*[\.、]|[①②③④⑤⑥⑦⑧⑨⑩]'),
+    # Answer and solution lines: from the label to the end of its line
+    "solution_line": re.compile(r'(?:答案|答|解析|解)[:：].*$', re.MULTILINE),
+    "answer": re.compile(r'答案[:：]\s*(.*?)(?:\n|$)'),
+    "analysis": re.compile(r'解析[:：]\s*(.*?)(?:\n|$)'),
+    # A line or stem that starts an answer or solution part (答案, 答, 解, 解析)
+    "part_start": re.compile(r'[答解]'),
+    "stem_head": re.compile(r'[^答解]*'),
+    # Problem markers and labels rewritten as markdown by markdown_style
+    "markdown_labels": re.compile(r'(?P<item>[①②③④⑤⑥⑦⑧⑨⑩]|(?<![1-9])[1-9]+[\.、])\s*|(?P<label>答案|解析|解)[:：]\s*'),
+    "markdown_answer": re.compile(r'\*\*答案\*\*[:：]?\s*(.*?)(?=\n|$)'),
+    "markdown_analysis": re.compile(r'\*\*解析\*\*[:：]?\s*(.*?)(?=\n|$)'),
+    # Numbered markers start only where a run of digits does, so digit runs are scanned once.
+    # Both branches open with a character class (the lookbehind comes after the first digit),
+    # which lets the regex engine skip ahead to candidate characters.
+    "section_marker": re.compile(r'[①②③④⑤⑥⑦⑧⑨⑩]|[1-9](?<![1-9]{2})[1-9]*[\.、]'),
+    "whitespace": re.compile(r'\s+'),
+}
+
+def get_pattern(name):
+    """Compiled pattern by name, for callers that need the match object"""
+    return PATTERNS[name]
+
+def is_math_problem(text, context=False):
+    """Whether text has any math problem indicator; context adds units and common subjects"""
+    return PATTERNS["math_problem_context" if context else "math_problem"].search(text) is not None
+
+def is_math_section(text):
+    """Whether a page region has problem section headings or numbering"""
+    return PATTERNS["math_section"].search(text) is not None
+
+def strip_solution(text):
+    """Text without its answer and solution lines (each cut from the label to the end of the line)"""
+    return PATTERNS["solution_line"].sub('', text)
+
+def labelled_value(name, text):
+    """Stripped text after the first label of a pattern ('answer', 'analysis', ...), or "" """
+    match = PATTERNS[name].search(text)
+    return match.group(1).strip() if match else ""
+
+def stem_head(text):
+    """Stripped text before the first answer or solution part"""
+    return PATTERNS["stem_head"].match(text).group().strip()
+
+def starts_with_part(line):
+    """Whether a line starts an answer or solution part"""
+    return PATTERNS["part_start"].match(line) is not None
+
+def _markdown_label(match):
+    if match.group('item'):
+        return f"## {match.group('item')} "
+    return f"**{match.group('label')}**: "
+
+def markdown_style(text):
+    """Problem numbers as ## headers and answer, analysis and solution labels in bold, in one pass"""
+    return PATTERNS["markdown_labels"].sub(_markdown_label, text)
+
+def collapse_whitespace(text):
+    """Runs of whitespace (full-width spaces included) as single spaces, stripped"""
+    return PATTERNS["whitespace"].sub(' ', text).strip()
+
+def split_sections(text):
+    """Text split at circled and numbered problem markers"""
+    return PATTERNS["section_marker"].split(text)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Confidence-driven Selective Re-OCR
+Two-pass page OCR: the whole page is read once at low zoom, then only the
+text lines tesseract was unsure of are re-rendered with a clip rectangle at
+high zoom and read again, giving high-zoom accuracy on a fraction of the
+high-zoom pixels
+"""
+
+import fitz  # PyMuPDF
+from ocr_words import OCRWords
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE, encode_pixmap, page_image
+
+LOW_ZOOM = 1.5
+HIGH_ZOOM = 3
+
+class SelectiveReOCR:
+    def __init__(self, ocr_pool, low_zoom=LOW_ZOOM, high_zoom=HIGH_ZOOM, min_line_confidence=60,
+                 padding=2, render_mode=None):
+        self.ocr_pool = ocr_pool
+        self.low_zoom = low_zoom
+        self.high_zoom = high_zoom
+        # Lines whose mean word confidence is below this are re-read
+        self.min_line_confidence = min_line_confidence
+        # Points added around each line box so ascenders and descenders are not cut off
+        self.padding = padding
+        self.render_mode = render_mode or DEFAULT_RENDER_MODE
+        self.documents = get_document_cache()
+
+    def cache_mode(self):
+        """Render-mode value for OCR cache keys of two-pass results"""
+        return f"{self.render_mode}+{self.high_zoom:g}x"
+
+    def low_confidence_lines(self, words):
+        """Return (start, end) word ranges of lines below the confidence threshold"""
+        lines = []
+        for start, end in words.lines():
+            confidence = words.mean_confidence(start, end)
+            if confidence is not None and confidence < self.min_line_confidence:
+                lines.append((start, end))
+        return lines
+
+    def line_clip(self, page, words, start, end, scale):
+        """Page rectangle (in points) around a line of words measured at scale px/pt"""
+        x0, y0, x1, y1 = words.line_bbox(start, end)
+        origin = page.rect.tl
+        clip = fitz.Rect(origin.x + x0 / scale - self.padding, origin.y + y0 / scale - self.padding,
+                         origin.x + x1 / scale + self.padding, origin.y + y1 / scale + self.padding)
+        return clip & page.rect
+
+    def ocr_page(self, pdf_path, page_index, lang='chi_sim+eng', psm=6, oem=3):
+        """Two-pass OCR of one page; returns (text, OCRWords, stats)
+
+        Single-image scanned pages are read once at the scan's native
+        resolution, which is already past the high zoom.
+        """
+        with self.documents.page(pdf_path, page_index) as page:
+            image, ext, method = page_image(page, self.low_zoom, self.render_mode)
+
+        text, words = self.ocr_pool.ocr(image, psm=psm, lang=lang, oem=oem, words=True)
+        del image
+        if method != 'rendered':
+            return text, words, {"method": method, "lines": 0, "reocr_lines": 0, "improved_lines": 0,
+                                 "pixel_ratio": 0.0}
+
+        words, stats = self.refine(pdf_path, page_index, words, self.low_zoom, lang=lang, oem=oem)
+        stats["method"] = method
+        return words.text(), words, stats
+
+    def refine(self, pdf_path, page_index, words, zoom, lang='chi_sim+eng', oem=3):
+        """Re-read low-confidence lines of a zoom-rendered page at high zoom
+
+        Returns (merged OCRWords, stats). A re-read line replaces the original
+        only if its mean confidence is higher.
+        """
+        weak_lines = self.low_confidence_lines(words)
+        matrix = fitz.Matrix(self.high_zoom, self.high_zoom)
+        colorspace = fitz.csRGB if self.render_mode == 'rgb' else fitz.csGRAY
+        clips = []
+        clip_pixels = 0
+
+        with self.documents.page(pdf_path, page_index) as page:
+            page_rect = page.rect
+            for start, end in weak_lines:
+                clip = self.line_clip(page, words, start, end, zoom)
+                if clip.is_empty:
+                    continue
+                pix = page.get_pixmap(matrix=matrix, clip=clip, colorspace=colorspace, alpha=False)
+                clip_pixels += pix.width * pix.height
+                clips.append((start, end, clip, encode_pixmap(pix, self.render_mode, dpi=72 * self.high_zoom)[0]))
+
+        # All weak lines are read concurrently on the pool, one line per job
+        futures = [(start, end, clip, self.ocr_pool.submit(image, psm=7, lang=lang, oem=oem, words=True))
+                   for start, end, clip, image in clips]
+
+        replacements = {}
+        for start, end, clip, future in futures:
+            try:
+                line_text, line_words = future.result()
+            except Exception as e:
+                print(f"Re-OCR error on page {page_index + 1}: {e}")
+                continue
+            new_confidence = line_words.mean_confidence()
+            if new_confidence is not None and new_confidence > words.mean_confidence(start, end):
+                replacements[start] = (end, clip, line_words)
+
+        merged = self.merge(words, replacements, zoom, page_rect)
+
+        full_pixels = page_rect.width * page_rect.height * self.high_zoom ** 2
+        low_pixels = page_rect.width * page_rect.height * zoom ** 2
+        stats = {
+            "lines": sum(1 for line in words.lines()),
+            "reocr_lines": len(clips),
+            "improved_lines": len(replacements),
+            # Pixels OCR'd across both passes, relative to one full high-zoom page
+            "pixel_ratio": (low_pixels + clip_pixels) / full_pixels if full_pixels else 0.0
+        }
+        return merged, stats
+
+    def merge(self, words, replacements, zoom, page_rect):
+        """Copy words, swapping in re-read lines mapped back to pass-one pixels"""
+        merged = OCRWords()
+        # High-zoom clip pixels -> pass-one pixels
+        ratio = zoom / self.high_zoom
+
+        for start, end in words.lines():
+            line_id = words.line_id(start)
+            if start in replacements:
+                end, clip, line_words = replacements[start]
+                offset_x = (clip.x0 - page_rect.x0) * zoom
+                offset_y = (clip.y0 - page_rect.y0) * zoom
+                for index in range(len(line_words)):
+                    left, top, width, height = line_words.bbox(index)
+                    merged.append(line_words.word(index),
+                                  (round(offset_x + left * ratio), round(offset_y + top * ratio),
+                                   round(width * ratio), round(height * ratio)),
+                                  line_words.conf[index], line_id)
+            else:
+                for index in range(start, end):
+                    merged.append(words.word(index), words.bbox(index), words.conf[index], line_id)
+
+        return merged
+
+    def report(self, page_num, stats):
+        """Print a one-line summary of a two-pass page"""
+        if stats["method"] != 'rendered':
+            print(f"Page {page_num}: {stats['method']} scan read in one pass")
+            return
+        print(f"Page {page_num}: re-read {stats['reocr_lines']}/{stats['lines']} lines at "
+              f"{self.high_zoom:g}x, {stats['improved_lines']} improved, "
+              f"{stats['pixel_ratio']:.0%} of full {self.high_zoom:g}x pixels")
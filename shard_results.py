@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Sharded Extraction Runs
+Splits a run's pages into N contiguous shards that separate machines can
+process independently, and merges their shard files back into one result in
+the order an unsharded run would produce
+
+Machines coordinate only through a shared directory: shard i of N writes
+<output>.shard-i-of-N.json next to the final output, and the merge reads
+them all. Documents are matched across machines by PDF content hash, so the
+PDFs may live at different paths on each machine.
+
+Each shard stitches problems across the page breaks inside its own pages.
+At its edges it segments nothing: the fragment before the first problem
+marker of its first page (its lead) and the open span held after its last
+page go into the shard file as text. The merge joins a shard's held span
+with the next shard's lead when their pages are consecutive, and segments
+each on its own otherwise, so a problem running over the break between
+two shards comes out whole, as in an unsharded run.
+"""
+
+import os
+import re
+import glob
+import json
+from ocr_cache import pdf_content_hash
+from page_stitcher import join_text
+
+def parse_shard(spec):
+    """Parse a 1-based 'i/N' shard spec into (i, N)"""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', spec or '')
+    if not match:
+        raise ValueError(f"shard must look like i/N, got {spec!r}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"shard {index}/{count} is out of range")
+    return index, count
+
+def shard_pages(page_indexes, shard):
+    """The contiguous slice of page_indexes that belongs to a shard (all of them when shard is None)"""
+    page_indexes = list(page_indexes)
+    if shard is None:
+        return page_indexes
+    index, count = shard
+    return page_indexes[(index - 1) * len(page_indexes) // count:index * len(page_indexes) // count]
+
+def shard_path(output_file, shard):
+    """Shard result file of one shard, next to the final output"""
+    return f"{output_file}.shard-{shard[0]}-of-{shard[1]}.json"
+
+def write_shard(output_file, shard, assigned, journal):
+    """Write one shard's per-page problems from its checkpoint journal
+
+    assigned maps every PDF of the run, in run order, to the 1-based page
+    numbers the shard was given; that order is the merge order. Assigned pages missing
+    from the journal (failed pages) are listed so the merge can report them.
+    The lead journaled with the first page and the span held after the last
+    finished page are written for the merge to join with the shards next to
+    this one. The file is written under a temporary name and renamed, so a
+    merge never sees half a shard.
+    """
+    documents = []
+    for index, (pdf_file, page_nums) in enumerate(assigned.items()):
+        if not os.path.exists(pdf_file):
+            continue
+        finished = journal.finished(pdf_file)
+        done = sorted(page_num for page_num in page_nums if page_num in finished)
+        documents.append({"index": index, "file": os.path.basename(pdf_file), "path": str(pdf_file),
+                          "pdf": pdf_content_hash(pdf_file),
+                          "pages": {str(page_num): finished[page_num] for page_num in done},
+                          "missing": [page_num for page_num in page_nums if page_num not in finished],
+                          "lead": journal.lead(pdf_file, min(page_nums)) if page_nums else None,
+                          "held": journal.held(pdf_file, done[-1]) if done else None})
+
+    path = shard_path(output_file, shard)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({"shard": shard[0], "shards": shard[1], "documents": documents}, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+    print(f"Shard {shard[0]}/{shard[1]}: {sum(len(doc['pages']) for doc in documents)} pages written to {path}")
+    return path
+
+def merge_shards(output_file, segment):
+    """Combine every shard file of a run into one problem list
+
+    Problems come out by document order, then page number, then their order
+    on the page, matching an unsharded run. segment(pdf_path, page_num, text,
+    page_problems) returns the problems of a span cut at a shard edge, as the
+    extractor would segment it on that page after page_problems. Raises
+    ValueError when shards are missing, disagree on N, or cover the same
+    page twice.
+    """
+    shards = {}
+    for path in glob.glob(glob.escape(output_file) + '.shard-*-of-*.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        shards[(data["shard"], data["shards"])] = data
+
+    counts = {count for index, count in shards}
+    if not shards:
+        raise ValueError(f"no shard files found for {output_file}")
+    if len(counts) > 1:
+        raise ValueError(f"shard files from runs with different shard counts: {sorted(counts)}")
+    count = counts.pop()
+    missing = [index for index in range(1, count + 1) if (index, count) not in shards]
+    if missing:
+        raise ValueError(f"missing shards {', '.join(f'{index}/{count}' for index in missing)}")
+
+    documents = {}  # (index, pdf hash) -> {page number: problems}
+    edges = {}  # (index, pdf hash) -> [(path, lead, held)] in shard order
+    for key in sorted(shards):
+        for document in shards[key]["documents"]:
+            doc_key = (document["index"], document["pdf"])
+            pages = documents.setdefault(doc_key, {})
+            for page_num, problems in document["pages"].items():
+                if int(page_num) in pages:
+                    raise ValueError(f"page {page_num} of {document['file']} appears in more than one shard")
+                pages[int(page_num)] = list(problems)
+            if document["missing"]:
+                print(f"Warning: shard {key[0]}/{count} has no result for pages "
+                      f"{', '.join(map(str, document['missing']))} of {document['file']}")
+            if document["pages"]:
+                edges.setdefault(doc_key, []).append((document.get("path", document["file"]),
+                                                      document.get("lead"), document.get("held")))
+
+    joined = 0
+    for doc_key, shard_edges in edges.items():
+        joined += join_shard_edges(documents[doc_key], shard_edges, segment)
+
+    problems = []
+    for key in sorted(documents):
+        for page_num in sorted(documents[key]):
+            problems.extend(documents[key][page_num])
+
+    print(f"Merged {count} shards: {sum(len(pages) for pages in documents.values())} pages, "
+          f"{len(problems)} problems, {joined} joined across shard boundaries")
+    return problems
+
+def join_shard_edges(pages, shard_edges, segment):
+    """Segment the leads and held spans of one document's shards into its pages; returns the joins made
+
+    shard_edges is (pdf path, lead, held) per shard that has pages of the
+    document, in shard order. A held span is joined with the next shard's
+    lead when it was held from the page just before; a span that is not
+    joined is segmented on its own, a held span at the end of its page and
+    a lead at the start of its page, where an unsharded run puts them.
+    """
+    joined = 0
+    held = None  # (pdf path, page number, text) held after the previous shard
+    for path, lead, shard_held in shard_edges:
+        if lead:
+            lead_page, lead_text = lead
+            if held and held[1] == lead_page - 1:
+                page_problems = pages[held[1]]
+                page_problems.extend(segment(held[0], held[1], join_text(held[2], lead_text), page_problems))
+                joined += 1
+                held = None
+            else:
+                pages[lead_page][:0] = segment(path, lead_page, lead_text, [])
+        if held:
+            pages[held[1]].extend(segment(held[0], held[1], held[2], pages[held[1]]))
+        held = (path, shard_held[0], shard_held[1]) if shard_held else None
+
+    if held:
+        pages[held[1]].extend(segment(held[0], held[1], held[2], pages[held[1]]))
+    return joined
+
+def add_shard_arguments(parser):
+    """Add the --shard and --merge options shared by the extractor scripts"""
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                        help="Process only shard I of N of every document's pages and write a shard file")
+    parser.add_argument('--merge', action='store_true',
+                        help="Combine the shard files of a sharded run into the final output, joining "
+                             "problems that run over a boundary between shards")
@@ -8,82 +8,97 @@ import os
 import json
 import re
 import tempfile
-import subprocess
+import argparse
 from pathlib import Path
 from PIL import Image
 import fitz
+from ocr_engine import get_shared_pool
+from ocr_cache import cache_key, get_shared_cache
+from page_triage import PageTriage
+from problem_lexer import problem_spans, span_parts
+from page_stitcher import PageStitcher, lexer_markers
+from keyword_automaton import first_label, keyword_labels
+from pdf_documents import get_document_cache
+from page_render import DEFAULT_RENDER_MODE, page_image
+from selective_reocr import SelectiveReOCR
+from checkpoint_journal import CheckpointJournal, default_journal_path
+from shard_results import add_shard_arguments, merge_shards, shard_pages, shard_path, write_shard
 
 class TargetedMathExtractor:
-    def __init__(self):
+    ZOOM = 2.5
+
+    def __init__(self, ocr_pool=None, ocr_cache=None, render_mode=None, two_pass=False, journal=None,
+                 shard_edges=False):
         self.extracted_problems = []
+        # 'rgb', 'gray' or 'bilevel' page images (see page_render)
+        self.render_mode = render_mode or DEFAULT_RENDER_MODE
         self.temp_dir = tempfile.mkdtemp()
+        self.ocr_pool = ocr_pool or get_shared_pool()
+        self.ocr_cache = ocr_cache or get_shared_cache()
+        self.documents = get_document_cache()
+        # Low-zoom page pass plus high-zoom re-reads of low-confidence lines
+        self.reocr = SelectiveReOCR(self.ocr_pool, render_mode=self.render_mode) if two_pass else None
+        # Optional CheckpointJournal: finished pages are recorded and skipped on resume
+        self.journal = journal
+        # A shard run leaves the spans at the edges of its pages to the shard merge (see shard_results)
+        self.shard_edges = shard_edges
 
     def convert_page_to_image(self, pdf_path, page_num):
         """Convert a single PDF page to image"""
-        doc = fitz.open(pdf_path)
-        if page_num >= len(doc):
-            doc.close()
-            return None
-
-        page = doc[page_num]
-        pix = page.get_pixmap(matrix=fitz.Matrix(2.5, 2.5))
-        img_path = os.path.join(self.temp_dir, f"page_{page_num + 1}.png")
-        pix.save(img_path)
-        doc.close()
+        # The document stays open in the shared cache across pages
+        with self.documents.page(pdf_path, page_num) as page:
+            if page is None:
+                return None
+            # Native scan image when the page is one, rendered page otherwise
+            image, ext, method = page_image(page, self.ZOOM, self.render_mode)
+
+        img_path = os.path.join(self.temp_dir, f"page_{page_num + 1}.{ext}")
+        with open(img_path, 'wb') as f:
+            f.write(image)
         return img_path
 
-    def ocr_page(self, image_path):
-        """OCR a single page image"""
+    def ocr_page(self, image_path, cache_key=None):
+        """OCR a single page image, storing the result under cache_key if given"""
         try:
-            output_base = os.path.splitext(image_path)[0]
-            txt_path = f"{output_base}.txt"
-
-            cmd = [
-                'tesseract',
-                image_path,
-                output_base,
-                '-l', 'chi_sim+eng',
-                '--oem', '3',
-                '--psm', '6'
-            ]
-
-            result = subprocess.run(cmd, capture_output=True, text=True)
-
-            if result.returncode == 0 and os.path.exists(txt_path):
-                with open(txt_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                os.remove(txt_path)
-                return text
+            text, words = self.ocr_pool.ocr(image_path, psm=6, lang='chi_sim+eng', oem=3, words=True)
+            if cache_key:
+                self.ocr_cache.put(cache_key, text, words=words)
+            return text
 
         except Exception as e:
             print(f"OCR error: {e}")
 
         return ""
 
-    def extract_problems_from_text(self, text, page_num, source_file):
-        """Extract math problems from OCR text"""
+    def ocr_page_two_pass(self, pdf_path, page_num, cache_key=None):
+        """OCR a page at low zoom, re-reading only its low-confidence lines at high zoom"""
+        try:
+            text, words, stats = self.reocr.ocr_page(pdf_path, page_num, lang='chi_sim+eng', psm=6, oem=3)
+        except Exception as e:
+            print(f"OCR error: {e}")
+            return ""
+
+        self.reocr.report(page_num + 1, stats)
+        if cache_key:
+            self.ocr_cache.put(cache_key, text, words=words)
+        return text
+
+    def extract_problems_from_text(self, text, page_num, source_file, first_number=1):
+        """Extract math problems from OCR text (numbered from first_number within the page)"""
         problems = []
 
         # Clean text
         text = re.sub(r'[^\u4e00-\u9fff\w\s+\-×÷=＜＞≤≥\(\)\[\]{}.,，。、:：;；!！?？\d]', '', text)
         text = re.sub(r'\s+', ' ', text)
 
-        # Look for problem patterns
-        problem_patterns = [
-            r'(\d+\.[^.\n]+(?:\n[^.\n]+){0,5})',  # Numbered problems
-            r'([①②③④⑤⑥⑦⑧⑨⑩][^①②③④⑤⑥⑦⑧⑨⑩\n]+(?:\n[^①②③④⑤⑥⑦⑧⑨⑩\n]+){0,3})',  # Chinese numbered
-            r'(计算[^。\n]+(?:\n[^。\n]+){0,2})',  # Calculation problems
-            r'(应用题[^。\n]+(?:\n[^。\n]+){0,5})',  # Word problems
-            r'(练习[^。\n]+(?:\n[^。\n]+){0,10})',  # Exercise sections
-        ]
-
-        for pattern in problem_patterns:
-            matches = re.findall(pattern, text, re.MULTILINE)
-            for match in matches:
-                match = match.strip()
-                if self.is_valid_problem(match):
-                    problem = self.create_problem(match, page_num, len(problems) + 1, source_file)
-                    problems.append(problem)
+        # One pass over the page cuts it into non-overlapping problems at their boundaries
+        for span in problem_spans(text):
+            stem, answer, analysis = span_parts(text, span)
+            if self.is_valid_problem(stem):
+                problem = self.create_problem(stem, page_num, first_number + len(problems), source_file)
+                problem["answer"] = answer
+                problem["analysis"] = analysis
+                problems.append(problem)
 
         return problems
 
@@ -121,22 +136,11 @@ class TargetedMathExtractor:
 
     def get_knowledge_points(self, text):
         """Extract knowledge points"""
-        keywords = {
-            "加法": "加法运算", "减法": "减法运算", "乘法": "乘法运算", "除法": "除法运算",
-            "分数": "分数", "小数": "小数", "面积": "面积计算", "周长": "周长计算",
-            "应用题": "应用题", "几何": "几何图形", "平均数": "平均数", "统计": "统计图表"
-        }
-
-        points = []
-        for keyword, point in keywords.items():
-            if keyword in text:
-                points.append(point)
-
-        return points if points else ["基础运算"]
+        return keyword_labels(text, "knowledge.targeted") or ["基础运算"]
 
     def get_difficulty(self, text):
         """Estimate difficulty"""
-        if len(text) > 150 or "应用题" in text or "综合" in text:
+        if len(text) > 150 or keyword_labels(text, "difficulty.targeted"):
             return "hard"
         elif len(text) > 80:
             return "medium"
@@ -145,39 +149,108 @@ class TargetedMathExtractor:
 
     def get_type(self, text):
         """Classify problem type"""
-        if "应用题" in text or "解决" in text:
-            return "word_problem"
-        elif "选择" in text:
-            return "multiple_choice"
-        elif "判断" in text:
-            return "true_false"
-        elif "填空" in text:
-            return "fill_in_blank"
-        else:
-            return "calculation"
+        return first_label(text, "type", "calculation")
+
+    def finish_held_span(self, stitcher, holder, page_counts, pdf_path):
+        """Problems of the span still held, on their own
+
+        holder is (page number, problems) of the page the span was journaled
+        with; that page is journaled again with them added and nothing held.
+        """
+        held = stitcher.flush()
+        if not held:
+            return []
+        page, text = held
+        held_problems = self.extract_problems_from_text(text, page, pdf_path, page_counts.get(page, 0) + 1)
+        if self.journal:
+            self.journal.record(pdf_path, holder[0], holder[1] + held_problems)
+        return held_problems
+
+    def numbered_problems(self, pdf_path, page, finished):
+        """Problems an earlier run numbered for a page, wherever they were journaled"""
+        source = f"{pdf_path} (Page {page})"
+        return sum(1 for page_problems in finished.values() for problem in page_problems
+                   if problem["source"] == source)
+
+    def segment_span(self, pdf_path, page, text, page_problems):
+        """Problems of a span cut at a shard edge, numbered after the page's problems (for merge_shards)"""
+        first_number = self.numbered_problems(pdf_path, page, {page: page_problems}) + 1
+        return self.extract_problems_from_text(text, page, pdf_path, first_number)
 
     def process_specific_pages(self, pdf_path, page_list):
-        """Process specific pages from PDF"""
+        """Process specific pages from PDF, in page order whatever order they were selected in"""
         problems = []
+        finished = self.journal.finished(pdf_path) if self.journal else {}
+        # A problem cut by a page break is held back and joined with the top of the next page
+        stitcher = PageStitcher(lexer_markers())
+        if self.shard_edges and page_list:
+            stitcher.lead_page = min(page_list) + 1
+        page_counts = {}
+        # (page number, journaled problems, restored from the journal) of the page the held span was journaled with
+        holder = None
+
+        for page_num in sorted(page_list):
+            if page_num + 1 in finished:
+                # A span held from a page read in this run was never joined with this page, so it is
+                # finished on its own; one restored from the journal already is part of this page
+                if holder and not holder[2]:
+                    problems.extend(self.finish_held_span(stitcher, holder, page_counts, pdf_path))
+                problems.extend(finished[page_num + 1])
+                # The span the earlier run held back after this page carries on to the next page read
+                stitcher.held = self.journal.held(pdf_path, page_num + 1)
+                if stitcher.held:
+                    held_page = stitcher.held[0]
+                    page_counts[held_page] = self.numbered_problems(pdf_path, held_page, finished)
+                holder = (page_num + 1, finished[page_num + 1], True)
+                print(f"Page {page_num + 1} finished in an earlier run")
+                continue
 
-        for page_num in page_list:
             print(f"Processing page {page_num + 1}...")
 
-            image_path = self.convert_page_to_image(pdf_path, page_num)
-            if not image_path:
-                continue
-
-            text = self.ocr_page(image_path)
+            if self.reocr:
+                key = cache_key(pdf_path, page_num, self.reocr.low_zoom, 'chi_sim+eng', 6, 3,
+                                self.reocr.cache_mode())
+            else:
+                key = cache_key(pdf_path, page_num, self.ZOOM, 'chi_sim+eng', 6, 3, self.render_mode)
+            cached = self.ocr_cache.get(key)
+            image_path = None
+
+            if cached is not None:
+                text = cached['text']
+            elif self.reocr:
+                text = self.ocr_page_two_pass(pdf_path, page_num, cache_key=key)
+            else:
+                image_path = self.convert_page_to_image(pdf_path, page_num)
+                if not image_path:
+                    continue
+                text = self.ocr_page(image_path, cache_key=key)
+            page_problems = []
             if text:
-                page_problems = self.extract_problems_from_text(text, page_num + 1, pdf_path)
+                carried, text = stitcher.feed(page_num + 1, text)
+                if carried:
+                    # The previous page's last problem, reported on the page it starts on
+                    page, carried_text = carried
+                    page_problems = self.extract_problems_from_text(carried_text, page, pdf_path,
+                                                                    page_counts.get(page, 0) + 1)
+                own_problems = self.extract_problems_from_text(text, page_num + 1, pdf_path)
+                page_counts[page_num + 1] = len(own_problems)
+                page_problems += own_problems
                 problems.extend(page_problems)
                 print(f"Found {len(page_problems)} problems on page {page_num + 1}")
             else:
                 print(f"No text extracted from page {page_num + 1}")
 
-            if os.path.exists(image_path):
+            # The held span is journaled with the page, so a resumed run can still join it with the next one
+            if self.journal:
+                self.journal.record(pdf_path, page_num + 1, page_problems, held=stitcher.held,
+                                    lead=stitcher.pop_lead())
+            holder = (page_num + 1, page_problems, False)
+
+            if image_path and os.path.exists(image_path):
                 os.remove(image_path)
 
+        if holder and not self.shard_edges:
+            problems.extend(self.finish_held_span(stitcher, holder, page_counts, pdf_path))
         return problems
 
     def cleanup(self):
@@ -187,24 +260,49 @@ class TargetedMathExtractor:
             shutil.rmtree(self.temp_dir)
 
 def main():
-    # Target pages that are likely to contain math problems
-    # Skip first few pages (covers, table of contents) and focus on content pages
-    target_pages = [5, 6, 7, 10, 15, 20, 25, 30, 35, 40]
-
     pdf_files = [
         "/Users/tywg001/Downloads/mathlearning/aoshu/一本数学思维训练四年级.pdf",
         "/Users/tywg001/Downloads/mathlearning/aoshu/学霸提优大试卷四年级上册数学人教版.pdf"
     ]
 
-    extractor = TargetedMathExtractor()
+    parser = argparse.ArgumentParser(description="Extract math problems from triaged PDF pages with OCR")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip pages an interrupted run already finished (from its checkpoint journal)")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
+
+    output_file = "/Users/tywg001/Downloads/mathlearning/targeted_extracted_problems.json"
+    run_file = shard_path(output_file, args.shard) if args.shard else output_file
+    journal = None if args.merge else CheckpointJournal(default_journal_path(run_file), resume=args.resume)
+    # OCR_TWO_PASS=1 reads pages at low zoom and re-reads only unsure lines at high zoom
+    extractor = TargetedMathExtractor(two_pass=os.environ.get("OCR_TWO_PASS") == "1", journal=journal,
+                                      shard_edges=bool(args.shard))
+    triage = PageTriage()
     all_problems = []
+    assigned = {}
 
     try:
-        for pdf_file in pdf_files:
-            print(f"\nProcessing: {Path(pdf_file).name}")
-            problems = extractor.process_specific_pages(pdf_file, target_pages)
-            all_problems.extend(problems)
-            print(f"Total from {Path(pdf_file).name}: {len(problems)}")
+        if args.merge:
+            try:
+                all_problems = merge_shards(output_file, extractor.segment_span)
+            except ValueError as e:
+                print(f"Cannot merge shards: {e}")
+                return
+        else:
+            for pdf_file in pdf_files:
+                print(f"\nProcessing: {Path(pdf_file).name}")
+                # Target pages that are likely to contain math problems: the triage pass
+                # skips covers, tables of contents, answer grids and blank pages
+                # Shards take runs of consecutive pages, so the triage ranking is put back in page order
+                target_pages = shard_pages(sorted(triage.select_pages(pdf_file)), args.shard)
+                assigned[pdf_file] = [page_num + 1 for page_num in target_pages]
+                problems = extractor.process_specific_pages(pdf_file, target_pages)
+                all_problems.extend(problems)
+                print(f"Total from {Path(pdf_file).name}: {len(problems)}")
+
+            if args.shard:
+                write_shard(output_file, args.shard, assigned, journal)
+                return
 
         # Remove duplicates
         unique_problems = []
@@ -218,7 +316,6 @@ def main():
                 seen_stems.add(stem_key)
 
         # Save results
-        output_file = "/Users/tywg001/Downloads/mathlearning/targeted_extracted_problems.json"
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(unique_problems, f, ensure_ascii=False, indent=2)
 
@@ -248,6 +345,8 @@ def main():
         print(f"By Difficulty: {diff_counts}")
 
     finally:
+        if journal:
+            journal.close()
         extractor.cleanup()
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Test cross-page problem stitching
+Covers the stitcher itself and the extractors that use it: a run
+interrupted between two pages and resumed from its checkpoint journal must
+give the same problems as an uninterrupted run, and pages selected out of
+page order must still be stitched
+
+No OCR is needed: ocr_pdf_extraction reads the text layer of a generated
+PDF and the other extractors get their page text from a stand-in cache.
+
+Usage:
+    python -m pytest -q test_page_stitcher.py
+"""
+
+import fitz
+import pytest
+from checkpoint_journal import CheckpointJournal
+from extract_pdf_ocr import MathProblemOCRExtractor
+from improved_ocr_extraction import ImprovedMathProblemExtractor
+from ocr_pdf_extraction import OCRMathProblemExtractor
+from ocr_words import OCRWords
+from page_stitcher import PageStitcher, lexer_markers, stitch_pages
+from targeted_ocr_extraction import TargetedMathExtractor
+
+# Problems ② and ④ run over a page break
+OCR_PAGES = [
+    "① 小明有5个苹果，又买了3个苹果，现在一共有多少个苹果？\n② 一个长方形的长是8厘米，宽是",
+    "5厘米，它的周长是多少厘米？\n③ 一本书有120页，小红每天看15页，几天能看完？\n④ 计算 25 + 37 的和，再减去",
+    "18，结果是多少？请写出计算过程。\n⑤ 学校买来4箱粉笔，每箱24盒，一共有多少盒粉笔？",
+]
+
+# Problems 2 and 4 run over a page break
+TARGETED_PAGES = [
+    "1. 一个长方形的长是12厘米，宽是5厘米，求这个长方形的面积。\n2. 学校买来三箱粉笔，每箱有二十四盒，一共有",
+    "多少盒粉笔？请列式计算。\n3. 计算 125 + 375 = ？再把结果乘以四是多少？\n4. 小明每分钟走六十米，他从家到学校走了",
+    "十五分钟，他家离学校有多远？\n5. 一本故事书有二百四十页，小红每天看三十页，几天能看完？",
+]
+
+class Crash(Exception):
+    """Stands in for the process dying between two pages"""
+
+def page_words(text):
+    """OCRWords of a page's text, one OCR line per text line"""
+    words = OCRWords()
+    for line_number, line in enumerate(text.split("\n"), 1):
+        for word in line.split():
+            words.append(word, (0, 0, 10, 10), 90, (1, 1, line_number))
+    return words
+
+class PageTextCache:
+    """OCR cache stand-in that answers every page with its text, and crashes on one page"""
+
+    def __init__(self, texts, crash_at=None):
+        self.texts = texts
+        self.crash_at = crash_at
+
+    def get(self, key):
+        page_index = key[1]
+        if page_index == self.crash_at:
+            raise Crash()
+        return {"text": self.texts[page_index], "confidences": [], "words": page_words(self.texts[page_index])}
+
+    def put(self, key, text, words=None):
+        pass
+
+class InlinePool:
+    """OCR pool stand-in for extractors that size their threads by it; every page is cached"""
+    workers = 1
+
+def crash_after(records, page):
+    """Pass page records through, then crash once the given page has been processed"""
+    for record in records:
+        yield record
+        if record["page"] == page:
+            raise Crash()
+
+def make_text_pdf(tmp_path, texts):
+    pdf_path = str(tmp_path / "book.pdf")
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text((50, 80), text, fontname="china-s", fontsize=11)
+    doc.save(pdf_path)
+    doc.close()
+    return pdf_path
+
+def summary(problems):
+    return [(problem["id"], problem["stem"]) for problem in problems]
+
+def run_ocr(pdf_path, journal_path, resume=False, crash_page=None):
+    journal = CheckpointJournal(journal_path, resume=resume)
+    extractor = OCRMathProblemExtractor(ocr_pool=object(), journal=journal)
+    records = extractor.iter_pages_with_ocr(pdf_path)
+    if crash_page is not None:
+        records = crash_after(records, crash_page)
+    try:
+        return extractor.process_pages(records, pdf_path)
+    finally:
+        journal.close()
+
+def run_targeted(pdf_path, page_list, journal_path=None, resume=False, crash_at=None):
+    journal = CheckpointJournal(journal_path, resume=resume) if journal_path else None
+    extractor = TargetedMathExtractor(ocr_pool=object(), ocr_cache=PageTextCache(TARGETED_PAGES, crash_at),
+                                      journal=journal)
+    try:
+        return extractor.process_specific_pages(pdf_path, page_list)
+    finally:
+        extractor.cleanup()
+        if journal:
+            journal.close()
+
+def run_extract_pdf_ocr(pdf_path, journal_path=None, resume=False, crash_at=None, pipelined=False):
+    journal = CheckpointJournal(journal_path, resume=resume) if journal_path else None
+    extractor = MathProblemOCRExtractor(ocr_pool=InlinePool(), ocr_cache=PageTextCache(TARGETED_PAGES, crash_at),
+                                        journal=journal)
+    try:
+        if pipelined:
+            return extractor.process_pdf_pipelined(pdf_path, pages=[0, 1, 2])
+        return extractor.process_pdf(pdf_path, workers=1, pages=[0, 1, 2])
+    finally:
+        extractor.cleanup()
+        if journal:
+            journal.close()
+
+class CrashingImproved(ImprovedMathProblemExtractor):
+    """Improved extractor that crashes before segmenting the page read crash_after pages in"""
+
+    def __init__(self, crash_after=None, **kwargs):
+        super().__init__(**kwargs)
+        self.crash_after = crash_after
+        self.pages_read = 0
+
+    def is_math_problem_section(self, text):
+        if self.pages_read == self.crash_after:
+            raise Crash()
+        self.pages_read += 1
+        return super().is_math_problem_section(text)
+
+def run_improved(pdf_path, pages, journal_path=None, resume=False, crash_after=None):
+    journal = CheckpointJournal(journal_path, resume=resume) if journal_path else None
+    extractor = CrashingImproved(crash_after, ocr_pool=InlinePool(), ocr_cache=PageTextCache(TARGETED_PAGES),
+                                 journal=journal)
+    try:
+        return extractor.process_pdf(pdf_path, pages=pages)
+    finally:
+        extractor.cleanup()
+        if journal:
+            journal.close()
+
+def test_stitcher_joins_open_span_with_next_page():
+    pieces = list(stitch_pages(enumerate(TARGETED_PAGES, 1), lexer_markers()))
+    joined = [text for page, text in pieces if "一共有" in text]
+    assert joined and "多少盒粉笔" in joined[0]
+
+def test_stitcher_only_joins_consecutive_pages():
+    stitcher = PageStitcher(lexer_markers())
+    stitcher.feed(1, TARGETED_PAGES[0])
+    carried, rest = stitcher.feed(3, TARGETED_PAGES[2])
+    assert carried[0] == 1 and "十五分钟" not in carried[1]
+    assert rest.startswith("十五分钟")
+
+@pytest.mark.parametrize("crash_page", [1, 2])
+def test_ocr_resume_after_crash_between_pages(tmp_path, crash_page):
+    pdf_path = make_text_pdf(tmp_path, OCR_PAGES)
+    expected = summary(run_ocr(pdf_path, str(tmp_path / "full.jsonl")))
+    assert any("宽是" in stem and "周长" in stem for problem_id, stem in expected)
+
+    journal_path = str(tmp_path / "crash.jsonl")
+    with pytest.raises(Crash):
+        run_ocr(pdf_path, journal_path, crash_page=crash_page)
+    assert summary(run_ocr(pdf_path, journal_path, resume=True)) == expected
+    # Resuming the finished run replays every page to the same result
+    assert summary(run_ocr(pdf_path, journal_path, resume=True)) == expected
+
+@pytest.mark.parametrize("crash_at", [1, 2])
+def test_targeted_resume_after_crash_between_pages(tmp_path, crash_at):
+    pdf_path = make_text_pdf(tmp_path, ["", "", ""])
+    expected = summary(run_targeted(pdf_path, [0, 1, 2]))
+    assert any("一共有" in stem and "多少盒粉笔" in stem for problem_id, stem in expected)
+
+    journal_path = str(tmp_path / "crash.jsonl")
+    with pytest.raises(Crash):
+        run_targeted(pdf_path, [0, 1, 2], journal_path, crash_at=crash_at)
+    assert summary(run_targeted(pdf_path, [0, 1, 2], journal_path, resume=True)) == expected
+    assert summary(run_targeted(pdf_path, [0, 1, 2], journal_path, resume=True)) == expected
+
+def test_targeted_stitches_pages_selected_out_of_order(tmp_path):
+    pdf_path = make_text_pdf(tmp_path, ["", "", ""])
+    assert summary(run_targeted(pdf_path, [2, 0, 1])) == summary(run_targeted(pdf_path, [0, 1, 2]))
+
+def test_targeted_resume_flushes_span_held_after_replayed_page(tmp_path):
+    # Page 2 is journaled still holding problem 4, then the resumed run stops at page 2
+    pdf_path = make_text_pdf(tmp_path, ["", "", ""])
+    journal_path = str(tmp_path / "journal.jsonl")
+    with pytest.raises(Crash):
+        run_targeted(pdf_path, [0, 1, 2], journal_path, crash_at=2)
+    resumed = run_targeted(pdf_path, [0, 1], journal_path, resume=True)
+
+    assert summary(resumed) == summary(run_targeted(pdf_path, [0, 1]))
+    ids = [problem["id"] for problem in resumed]
+    assert len(ids) == len(set(ids))
+
+    # The replayed page is journaled again with the held problem added, not replaced by it
+    journal = CheckpointJournal(journal_path, resume=True)
+    finished = journal.finished(pdf_path)
+    journal.close()
+    assert summary(problem for page in sorted(finished) for problem in finished[page]) == summary(resumed)
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_extract_pdf_ocr_stitches_pages(tmp_path, pipelined):
+    pdf_path = make_text_pdf(tmp_path, ["", "", ""])
+    problems = summary(run_extract_pdf_ocr(pdf_path, pipelined=pipelined))
+    assert any("一共有" in stem and "多少盒粉笔" in stem for problem_id, stem in problems)
+    assert any("从家到学校走了" in stem and "十五分钟" in stem for problem_id, stem in problems)
+    assert len({problem_id for problem_id, stem in problems}) == len(problems)
+    if pipelined:
+        assert problems == summary(run_extract_pdf_ocr(pdf_path))
+
+@pytest.mark.parametrize("crash_at", [1, 2])
+def test_extract_pdf_ocr_resume_after_crash_between_pages(tmp_path, crash_at):
+    pdf_path = make_text_pdf(tmp_path, ["", "", ""])
+    expected = summary(run_extract_pdf_ocr(pdf_path))
+
+    journal_path = str(tmp_path / "crash.jsonl")
+    with pytest.raises(Crash):
+        run_extract_pdf_ocr(pdf_path, journal_path, crash_at=crash_at)
+    assert summary(run_extract_pdf_ocr(pdf_path, journal_path, resume=True)) == expected
+    assert summary(run_extract_pdf_ocr(pdf_path, journal_path, resume=True, pipelined=True)) == expected
+
+def test_improved_stitches_pages_selected_out_of_order(tmp_path):
+    pdf_path = make_text_pdf(tmp_path, ["", "", ""])
+    problems = summary(run_improved(pdf_path, [0, 1, 2]))
+    assert any("一共有" in stem and "多少盒粉笔" in stem for problem_id, stem in problems)
+    assert len({problem_id for problem_id, stem in problems}) == len(problems)
+    assert summary(run_improved(pdf_path, [2, 0, 1])) == problems
+
+@pytest.mark.parametrize("crash_after", [1, 2])
+def test_improved_resume_after_crash_between_pages(tmp_path, crash_after):
+    pdf_path = make_text_pdf(tmp_path, ["", "", ""])
+    expected = summary(run_improved(pdf_path, [0, 1, 2]))
+
+    journal_path = str(tmp_path / "crash.jsonl")
+    with pytest.raises(Crash):
+        run_improved(pdf_path, [0, 1, 2], journal_path, crash_after=crash_after)
+    assert summary(run_improved(pdf_path, [0, 1, 2], journal_path, resume=True)) == expected
+    assert summary(run_improved(pdf_path, [0, 1, 2], journal_path, resume=True)) == expected
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test sharded runs and their merge
+Runs the OCR extractor's page segmentation over text page records (no
+OCR needed), once unsharded and once as two shards, and merges the shard
+files
+
+Usage:
+    python -m pytest -q test_shard_results.py
+"""
+
+from checkpoint_journal import CheckpointJournal
+from ocr_pdf_extraction import OCRMathProblemExtractor
+from page_stream import page_record
+from shard_results import join_shard_edges, merge_shards, shard_pages, write_shard
+
+# Problem ② runs over the break between page 1 and page 2
+PAGES = {
+    1: "① 小明有5个苹果，又买了3个苹果，现在一共有多少个苹果？\n② 一个长方形的长是8厘米，宽是",
+    2: "5厘米，它的周长是多少厘米？\n③ 计算 25 + 37 = ？请写出计算过程和答案。",
+}
+
+def make_pdf(tmp_path):
+    # Only the bytes matter: documents are keyed by content hash
+    pdf_path = tmp_path / "doc.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 shard test")
+    return str(pdf_path)
+
+def run_pages(pdf_path, page_nums, journal=None, shard_edges=False):
+    extractor = OCRMathProblemExtractor(ocr_pool=object(), journal=journal, shard_edges=shard_edges)
+    return extractor.process_pages([page_record(page, "text", PAGES[page]) for page in page_nums], pdf_path)
+
+def run_sharded(tmp_path, pdf_path, count):
+    output_file = str(tmp_path / "out.json")
+    for index in range(1, count + 1):
+        shard = (index, count)
+        page_nums = [page_index + 1 for page_index in shard_pages(range(len(PAGES)), shard)]
+        journal = CheckpointJournal(str(tmp_path / f"shard-{index}.journal.jsonl"))
+        run_pages(pdf_path, page_nums, journal, shard_edges=True)
+        write_shard(output_file, shard, {pdf_path: page_nums}, journal)
+        journal.close()
+    return merge_shards(output_file, OCRMathProblemExtractor(ocr_pool=object()).segment_span)
+
+def summary(problems):
+    return [(problem["id"], problem["stem"]) for problem in problems]
+
+def test_single_shard_merge_matches_unsharded_run(tmp_path):
+    pdf_path = make_pdf(tmp_path)
+    assert summary(run_sharded(tmp_path, pdf_path, 1)) == summary(run_pages(pdf_path, [1, 2]))
+
+def test_problem_across_shard_boundary_is_joined(tmp_path, capsys):
+    pdf_path = make_pdf(tmp_path)
+    unsharded = summary(run_pages(pdf_path, [1, 2]))
+    assert any("宽是" in stem and "周长" in stem for problem_id, stem in unsharded)
+
+    # Each shard sees one half of problem ②, too short to pass alone; the merge joins them
+    assert summary(run_sharded(tmp_path, pdf_path, 2)) == unsharded
+    assert "1 joined across shard boundaries" in capsys.readouterr().out
+
+def test_shard_edges_of_pages_apart_are_segmented_on_their_own():
+    # Page 2 failed in both shards, so page 1's held span and page 3's lead are not one problem
+    pages = {1: ["p1"], 3: ["p3"]}
+    calls = []
+
+    def segment(pdf_path, page_num, text, page_problems):
+        calls.append((page_num, text))
+        return [text]
+
+    joined = join_shard_edges(pages, [("doc.pdf", None, [1, "held"]), ("doc.pdf", [3, "lead"], None)], segment)
+    assert joined == 0
+    assert sorted(calls) == [(1, "held"), (3, "lead")]
+    assert pages == {1: ["p1", "held"], 3: ["lead", "p3"]}